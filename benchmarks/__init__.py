@@ -0,0 +1 @@
+"""Performance benchmarks for pyalgebra.  Run from the repository root."""
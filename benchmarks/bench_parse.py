@@ -0,0 +1,90 @@
+"""
+Compares the tokenizer-based parser front end with the original loop.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_parse [max_size_in_bytes]
+
+Both front ends are timed on expression strings of doubling size, so a
+linear implementation shows a roughly constant time per byte.
+"""
+
+import sys
+import timeit
+from pyalgebra.expr import *
+from pyalgebra.parser import *
+
+
+def legacy_parse_helper(expr_str):
+    """The character loop Parser._parse_helper used before the tokenizer."""
+    expr_str = expr_str.replace(' ', '')
+    output = []
+    op_stack = []
+    index = 0
+    while index < len(expr_str):
+        if expr_str[index].isalpha():
+            symbol_name = ''
+            while index < len(expr_str) and expr_str[index].isalpha():
+                symbol_name += expr_str[index]
+                index += 1
+            output.append(Expr(Symbol(symbol_name)))
+        elif expr_str[index].isdigit() or expr_str[index] == '.':
+            num_string = ''
+            while (index < len(expr_str) and
+                (expr_str[index].isdigit() or expr_str[index] == '.')):
+                num_string += expr_str[index]
+                index += 1
+            output.append(Expr(float(num_string)))
+        elif expr_str[index] == '(':
+            op_stack.append(expr_str[index])
+            index += 1
+        elif expr_str[index] == ')':
+            while op_stack and op_stack[-1] != '(':
+                legacy_pop_oper(output, op_stack)
+            op_stack.pop()
+            index += 1
+        elif expr_str[index] in OPS:
+            new_op = expr_str[index]
+            while (op_stack and
+                OP_PRECEDENCES[new_op] <= OP_PRECEDENCES[op_stack[-1]]):
+                    legacy_pop_oper(output, op_stack)
+            op_stack.append(new_op)
+            index += 1
+    while op_stack:
+        legacy_pop_oper(output, op_stack)
+    return output[0]
+
+
+def legacy_pop_oper(output, op_stack):
+    op = op_stack.pop()
+    operand2 = output.pop()
+    operand1 = output.pop()
+    output.append(Expr(op, [operand1, operand2]))
+
+
+def make_expr_str(size):
+    """Returns an expression string of roughly size bytes."""
+    term = '(alpha * 12.375 + beta ^ 2) / gamma'
+    count = max(1, size // (len(term) + 3))
+    return ' + '.join([term] * count)
+
+
+def best_time(func, arg, repeat=3):
+    return min(timeit.repeat(lambda: func(arg), number=1, repeat=repeat))
+
+
+def main(max_size=1 << 20):
+    print('%10s %12s %12s %8s %14s' % (
+        'bytes', 'legacy (s)', 'new (s)', 'speedup', 'new (ns/byte)'))
+    size = 1 << 14
+    while size <= max_size:
+        expr_str = make_expr_str(size)
+        legacy = best_time(legacy_parse_helper, expr_str)
+        new = best_time(Parser._parse_helper, expr_str)
+        print('%10d %12.4f %12.4f %7.2fx %14.1f' % (
+            len(expr_str), legacy, new, legacy / new,
+            new * 1e9 / len(expr_str)))
+        size *= 2
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
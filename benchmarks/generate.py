@@ -0,0 +1,103 @@
+"""
+Seeded random expressions for the benchmarks.
+
+The same seed always gives the same expressions, so timings of different
+runs are comparable.
+"""
+
+import random
+from pyalgebra.expr import *
+from pyalgebra.constants import *
+
+
+def symbol_names(num_symbols):
+    """Returns num_symbols distinct symbol names: a, b, ..., z, aa, ab, ..."""
+    names = []
+    for index in range(1, num_symbols + 1):
+        name = ''
+        while index:
+            index, letter = divmod(index - 1, 26)
+            name = chr(ord('a') + letter) + name
+        names.append(name)
+    return names
+
+
+def random_expr(seed, size, max_depth, num_symbols):
+    """
+    Returns a random expression tree with one operator per node.
+
+    This is the shape the original parser built, so the tree isn't flat and
+    makes a useful input for flatten_expr.
+
+    Parameters:
+    seed: (hashable) - seeds the random generator
+    size: (int) - the number of terminals
+    max_depth: (int) - the depth at which subtrees stop branching.  Below it
+        the remaining terminals are chained with a single operator from the
+        left, so the depth of the flattened tree stays within max_depth + 1.
+    num_symbols: (int) - how many distinct symbols to use.  0 gives a purely
+        numeric expression.
+    """
+    rng = random.Random(seed)
+    names = symbol_names(num_symbols)
+    results = []
+    # Items are (number of terminals, depth) for subtrees still to be built,
+    # or an operator whose two operands are on top of results.
+    stack = [(size, 1)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            operand2 = results.pop()
+            operand1 = results.pop()
+            results.append(Expr(item, [operand1, operand2]))
+            continue
+        leaves, depth = item
+        if leaves == 1:
+            results.append(Expr(_random_terminal(rng, names)))
+            continue
+        op = rng.choice(OPS)
+        if depth >= max_depth:
+            chain = Expr(_random_terminal(rng, names))
+            for _ in range(leaves - 1):
+                chain = Expr(op, [chain, Expr(_random_terminal(rng, names))])
+            results.append(chain)
+            continue
+        left = rng.randint(1, leaves - 1)
+        stack.append(op)
+        stack.append((leaves - left, depth + 1))
+        stack.append((left, depth + 1))
+    return results[0]
+
+
+def to_source(expr):
+    """
+    Renders an expression as a string Parser.parse reads back.
+
+    Every operator node is parenthesized, since str(expr) doesn't keep the
+    grouping of nested operators.
+    """
+    pieces = []
+    stack = [expr]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            pieces.append(item)
+        elif not item.operands:
+            pieces.append(str(item.value))
+        else:
+            separator = ' %s ' % item.value
+            stack.append(')')
+            for index in range(len(item.operands) - 1, 0, -1):
+                stack.append(item.operands[index])
+                stack.append(separator)
+            stack.append(item.operands[0])
+            stack.append('(')
+    return ''.join(pieces)
+
+
+def _random_terminal(rng, names):
+    if names and rng.random() < 0.6:
+        return Symbol(rng.choice(names))
+    if rng.random() < 0.5:
+        return float(rng.randint(1, 99))
+    return rng.randint(1, 999) / 8.0
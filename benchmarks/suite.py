@@ -0,0 +1,194 @@
+"""
+Times the core operations on seeded random expressions.
+
+Usage (from the repository root):
+    python -m benchmarks.suite run [-o results.json] [--seed N] [--repeat N]
+    python -m benchmarks.suite compare baseline.json results.json
+        [--threshold 0.2]
+
+run times Parser.parse, flatten_expr, substitute, Expr.__eq__ and
+Expr.__hash__ on every case in CASES and writes the results as JSON (to
+stdout by default).  compare prints the change of each timing between two
+runs and exits with status 1 if any got slower by more than the threshold,
+a fraction of the baseline time.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+from pyalgebra.expr import *
+from pyalgebra.parser import *
+from pyalgebra.operations import substitute
+from pyalgebra.flat import FlatExpr
+from .generate import random_expr, to_source
+
+FORMAT_VERSION = 1
+
+# name: (number of terminals, maximum depth, number of symbols)
+CASES = {
+    'small': (50, 6, 3),
+    'medium': (2000, 8, 10),
+    'large': (50000, 10, 50),
+    'deep': (5000, 200, 5),
+    'shallow': (20000, 3, 5),
+    'many_symbols': (20000, 8, 5000),
+    'numeric': (20000, 8, 0),
+}
+
+
+def run(seed=0, repeat=5, cases=None):
+    """
+    Runs the benchmarks and returns the results as a JSON-ready dict.
+
+    Parameters:
+    seed: (int) - seeds the expression generators
+    repeat: (int) - how many times each operation is timed.  The best time
+        is the one compared between runs.
+    cases: (list of strings) - names from CASES to run.  All by default.
+
+    Returns:
+    results: (dict) - 'results' maps 'case/operation' to the best and mean
+        time in seconds, along with the metadata of the run
+    """
+    results = {}
+    for name in (cases or sorted(CASES)):
+        size, max_depth, num_symbols = CASES[name]
+        tree = random_expr('%d:%s' % (seed, name), size, max_depth,
+                num_symbols)
+        source = to_source(tree)
+        expr = Parser.parse(source)
+        same_expr = Parser.parse(source)
+        var = _first_symbol(expr)
+        replacement = Expr('+', [Expr(Symbol('replacement')), Expr(1.0)])
+        # Each repetition flattens a fresh copy of the nested tree
+        flat_tree = FlatExpr.from_expr(tree)
+        operations = [
+            ('parse', lambda: Parser.parse(source), None),
+            ('flatten', lambda copies: flatten_expr(copies.pop()),
+                lambda: [flat_tree.to_expr() for _ in range(repeat)]),
+            ('substitute', lambda: substitute(expr, var, replacement), None),
+            ('eq', lambda: expr == same_expr, None),
+            ('hash', lambda: _fresh_hash(expr), None),
+        ]
+        for operation, func, setup in operations:
+            times = _time(func, setup, repeat)
+            results['%s/%s' % (name, operation)] = {
+                'best': min(times),
+                'mean': sum(times) / len(times),
+                'size': size,
+                'max_depth': max_depth,
+                'num_symbols': num_symbols,
+            }
+    return {
+        'version': FORMAT_VERSION,
+        'seed': seed,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Compares the best times of two runs.
+
+    Parameters:
+    baseline, current: (dict) - results returned by run
+    threshold: (float) - the slowdown, as a fraction of the baseline time,
+        above which a timing counts as a regression
+
+    Returns:
+    rows: (list of tuples) - (key, baseline time, current time, ratio,
+        regressed) for every timing present in both runs, sorted by key
+    """
+    rows = []
+    for key in sorted(set(baseline['results']) & set(current['results'])):
+        old = baseline['results'][key]['best']
+        new = current['results'][key]['best']
+        ratio = new / old if old else float('inf')
+        rows.append((key, old, new, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def _time(func, setup, repeat):
+    """Returns repeat timings of one call of func, in seconds."""
+    if setup is not None:
+        arg = setup()
+        return timeit.repeat(lambda: func(arg), number=1, repeat=repeat)
+    # Fast operations are run several times per timing to reduce the noise
+    once = timeit.timeit(func, number=1)
+    number = max(1, int(_MIN_TIMING / once)) if once else 1000
+    return [total / number for total in
+            timeit.repeat(func, number=number, repeat=repeat)]
+
+
+# The minimum length in seconds of a timing, for operations that don't need a
+# fresh input per call
+_MIN_TIMING = 0.05
+
+
+def _fresh_hash(expr):
+    """Hashes expr from scratch, invalidating the cached hashes first."""
+    Expr._mutations += 1
+    return hash(expr)
+
+
+def _first_symbol(expr):
+    symbols = sorted(expr.free_symbols, key=lambda symbol: symbol.symbol_name)
+    return symbols[0] if symbols else Symbol('x')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite',
+            description='pyalgebra benchmark suite')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('-o', '--output',
+            help='file to write the JSON results to')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--case', action='append', choices=sorted(CASES),
+            help='case to run, can be repeated.  All by default.')
+    compare_parser = commands.add_parser('compare',
+            help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.seed, args.repeat, args.case)
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+        else:
+            json.dump(results, sys.stdout, indent=2, sort_keys=True)
+            print()
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.current) as current_file:
+        current = json.load(current_file)
+    if baseline['seed'] != current['seed']:
+        print('warning: the runs used different seeds', file=sys.stderr)
+    rows = compare(baseline, current, args.threshold)
+    print('%-26s %12s %12s %8s' % ('benchmark', 'baseline (s)', 'current (s)',
+        'ratio'))
+    for key, old, new, ratio, regressed in rows:
+        print('%-26s %12.6f %12.6f %7.2fx%s' % (key, old, new, ratio,
+            '  REGRESSION' if regressed else ''))
+    num_regressions = sum(1 for row in rows if row[4])
+    if num_regressions:
+        print('%d regression(s) above %.0f%%' % (num_regressions,
+            args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""Reverse-mode differentiation of expressions."""
+
+import math
+from .expr import *
+from .cse import cse, _lookup
+from .operations import fold_numbers
+
+
+def gradient(expr, symbols, bindings=None, pool=None):
+    """
+    Differentiates an expression with respect to several symbols at once.
+
+    The expression is first turned into a DAG with cse, so every unique
+    subexpression is handled once however often it occurs.  A forward pass
+    computes the value of each node, then one reverse pass from the root
+    accumulates the derivative of the expression with respect to each node,
+    so the cost is about that of two evaluations however many symbols are
+    asked for.  Subtrees that don't contain any of the symbols are skipped
+    in the reverse pass.
+
+    Without bindings, the derivatives are built symbolically in the pool of
+    the DAG.  They share the nodes of the expression and each other instead
+    of copying them, and multiplications by 0 and 1 and additions of 0 are
+    left out.  Differentiating an exponent, as in 2 ^ x with respect to x,
+    needs a logarithm, which can't be expressed, so it raises an
+    ExprException in that case.
+
+    Parameters:
+    expr: (Expr object) - the expression to differentiate
+    symbols: (list of strings or Symbol objects) - the symbols to
+        differentiate with respect to
+    bindings: (dict) - maps symbol names (or Symbol objects) to numbers.  If
+        given, the derivatives are computed as numbers at these values.
+        Every symbol in the expression must be bound.
+    pool: (ExprPool object) - the pool to intern nodes in.  A new one is
+        used by default.
+
+    Returns:
+    derivatives: (list) - the derivative with respect to each of symbols,
+        in order, as numbers if bindings were given and as InternedExprs
+        otherwise
+    """
+    symbols = [symbol if isinstance(symbol, Symbol) else Symbol(symbol)
+            for symbol in symbols]
+    dag = cse(expr, pool)
+    wanted = set(symbols)
+
+    # Nodes under which one of the symbols occurs.  Only these get adjoints.
+    active = set()
+    for node in dag.nodes:
+        if node.operands:
+            if any([id(operand) in active for operand in node.operands]):
+                active.add(id(node))
+        elif node.value in wanted:
+            active.add(id(node))
+
+    if bindings is None:
+        rules = _SymbolicRules(dag.pool)
+        values = {id(node): node for node in dag.nodes}
+    else:
+        rules = _NUMERIC_RULES
+        values = {}
+        for node in dag.nodes:
+            if node.operands:
+                value = values[id(node.operands[0])]
+                for operand in node.operands[1:]:
+                    value = OP_FUNCS[node.value](value, values[id(operand)])
+            elif isinstance(node.value, Symbol):
+                value = _lookup(bindings, node.value)
+            else:
+                value = node.value
+            values[id(node)] = value
+
+    # node id: the terms of the adjoint, summed once all parents are done
+    adjoints = {}
+    if id(dag.root) in active:
+        adjoints[id(dag.root)] = [rules.one]
+    results = {}
+    for node in reversed(dag.nodes):
+        if id(node) not in adjoints:
+            continue
+        adjoint = rules.add(adjoints.pop(id(node)))
+        if not node.operands:
+            results[node.value] = adjoint
+            continue
+        operand_values = [values[id(operand)] for operand in node.operands]
+        is_active = [id(operand) in active for operand in node.operands]
+        partials = _partials(rules, node.value, values[id(node)],
+                operand_values, is_active)
+        for operand, partial in zip(node.operands, partials):
+            if partial is not None:
+                adjoints.setdefault(id(operand), []).append(
+                        rules.multiply([adjoint, partial]))
+    return [results.get(symbol, rules.zero) for symbol in symbols]
+
+
+class _NumericRules():
+    """Derivative arithmetic on numbers."""
+
+    zero = 0
+    one = 1
+
+    def number(self, value):
+        return value
+
+    def is_zero(self, value):
+        return value == 0
+
+    def add(self, terms):
+        total = terms[0]
+        for term in terms[1:]:
+            total = total + term
+        return total
+
+    def multiply(self, factors):
+        product = factors[0]
+        for factor in factors[1:]:
+            product = product * factor
+        return product
+
+    def divide(self, numerator, denominators):
+        for denominator in denominators:
+            numerator = numerator / denominator
+        return numerator
+
+    def power(self, operands):
+        value = operands[0]
+        for exponent in operands[1:]:
+            value = value ** exponent
+        return value
+
+    def log(self, value):
+        if value <= 0:
+            raise ExprException('Derivative of an exponent of %s, which has '
+                    'no real logarithm' % value)
+        return math.log(value)
+
+
+_NUMERIC_RULES = _NumericRules()
+
+
+class _SymbolicRules():
+    """Derivative arithmetic on interned nodes, simplifying 0s and 1s."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.zero = pool.make(0)
+        self.one = pool.make(1)
+
+    def number(self, value):
+        return self.pool.make(value)
+
+    def is_zero(self, node):
+        return _is_number(node) and node.value == 0
+
+    def add(self, terms):
+        return self._combine('+', terms)
+
+    def multiply(self, factors):
+        return self._combine('*', factors)
+
+    def divide(self, numerator, denominators):
+        return self._combine('/', [numerator] + list(denominators))
+
+    def power(self, operands):
+        return self._combine('^', operands)
+
+    def log(self, node):
+        raise ExprException('Derivative of a power of %s by its exponent '
+                'needs a logarithm' % node)
+
+    def _combine(self, op, operands):
+        """Makes op applied to operands, folding their numbers."""
+        if op in COMMUTATIVE_OPS:
+            identity = 0 if op == '+' else 1
+            numbers = [operand.value for operand in operands
+                    if _is_number(operand)]
+            others = [operand for operand in operands
+                    if not _is_number(operand)]
+            number = fold_numbers(op, numbers) if numbers else identity
+            if number is None:
+                return self.pool.make(op, operands)
+            if op == '*' and number == 0:
+                return self.zero
+            if number != identity:
+                others.insert(0, self.pool.make(number))
+            if not others:
+                return self.pool.make(identity)
+            if len(others) == 1:
+                return others[0]
+            return self.pool.make(op, others)
+        # '/' and '^' apply from the left, so dividing by 1 or raising to the
+        # power 1 can be dropped anywhere after the first operand
+        operands = [operands[0]] + [operand for operand in operands[1:]
+                if not (_is_number(operand) and operand.value == 1)]
+        if len(operands) == 1:
+            return operands[0]
+        if all([_is_number(operand) for operand in operands]):
+            value = fold_numbers(op, [operand.value for operand in operands])
+            if value is not None:
+                return self.pool.make(value)
+        return self.pool.make(op, operands)
+
+
+def _partials(rules, op, result, operands, is_active):
+    """
+    Returns the partial derivatives of a node with respect to its operands.
+
+    Works on numbers or nodes, depending on rules.  The partials of inactive
+    operands aren't computed and are None.
+
+    Parameters:
+    rules: (_NumericRules or _SymbolicRules object) - the arithmetic to use
+    op: (string) - the operator of the node
+    result: (number or node) - the value of the node
+    operands: (list of numbers or nodes) - the values of its operands
+    is_active: (list of bools) - whether each operand needs its partial
+    """
+    partials = [None] * len(operands)
+    if op == '+':
+        for index in range(len(operands)):
+            if is_active[index]:
+                partials[index] = rules.one
+    elif op == '*':
+        # The products of the operands after each one, so every partial
+        # takes two multiplications however many operands there are
+        suffixes = [rules.one] * (len(operands) + 1)
+        for index in range(len(operands) - 1, 0, -1):
+            suffixes[index] = rules.multiply(
+                    [operands[index], suffixes[index + 1]])
+        prefix = rules.one
+        for index in range(len(operands)):
+            if is_active[index]:
+                partials[index] = rules.multiply(
+                        [prefix, suffixes[index + 1]])
+            prefix = rules.multiply([prefix, operands[index]])
+    elif op == '/':
+        # a / b / c = a / (b * c), so d/da = 1 / b / c and d/db = -result / b
+        if is_active[0]:
+            partials[0] = rules.divide(rules.one, operands[1:])
+        for index in range(1, len(operands)):
+            if is_active[index]:
+                partials[index] = rules.multiply([rules.number(-1),
+                    rules.divide(result, [operands[index]])])
+    elif op == '^':
+        # a ^ b ^ c = (a ^ b) ^ c, so go through the powers from the last,
+        # with chain the derivative of the result by the current power
+        chain = rules.one
+        for index in range(len(operands) - 1, 0, -1):
+            if rules.is_zero(chain):
+                # A later exponent is 0, so the earlier operands don't matter
+                for earlier in range(index + 1):
+                    if is_active[earlier]:
+                        partials[earlier] = rules.zero
+                break
+            if index == len(operands) - 1:
+                power = result
+            else:
+                power = rules.power(operands[:index + 1])
+            base = rules.power(operands[:index])
+            exponent = operands[index]
+            if is_active[index]:
+                if rules.is_zero(power):
+                    partials[index] = rules.zero
+                else:
+                    partials[index] = rules.multiply([chain, power,
+                        rules.log(base)])
+            if not any(is_active[:index]):
+                break
+            if rules.is_zero(exponent):
+                # base ^ -1 would divide by zero at base 0
+                chain = rules.zero
+            else:
+                chain = rules.multiply([chain, exponent, rules.power([base,
+                    rules.add([exponent, rules.number(-1)])])])
+        else:
+            partials[0] = chain if is_active[0] else None
+    else:
+        raise ExprException('Cannot differentiate operator %s' % op)
+    return partials
+
+
+def _is_number(node):
+    return not node.operands and not isinstance(node.value, Symbol)
+
@@ -0,0 +1,135 @@
+"""Compiles expressions into plain Python functions."""
+
+import keyword
+import math
+from functools import lru_cache
+from .expr import *
+
+# Python spellings of the operators that have one.  Any other operator in
+# OPS is compiled into a call of its OP_FUNCS entry, named after OP_NAMES.
+_INFIX = {'+': '+', '*': '*', '/': '/', '^': '**'}
+# Python parses long operator chains recursively, so a node with many
+# operands is split across statements of at most this many operands.
+_MAX_CHAIN = 32
+COMPILE_CACHE_SIZE = 256
+
+# Compiled functions are cached by interned expression.  The cache keeps its
+# keys alive, and the pool frees nodes the cache has evicted.
+_pool = ExprPool()
+
+
+def compile_expr(expr, args):
+    """
+    Compiles an expression into a Python function.
+
+    The expression is turned into straight-line Python source once, so
+    calling the function doesn't walk the tree.  Compiled functions are kept
+    in an LRU cache keyed by the structure of the expression and the
+    arguments, so compiling an equal expression again is cheap.
+
+    Parameters:
+    expr: (Expr object) - the expression to compile
+    args: (list of strings or Symbol objects) - the symbols of the
+        expression, in the order the function takes them as arguments
+
+    Returns:
+    func: (function) - a function of len(args) numbers returning the value
+        of the expression
+    """
+    names = []
+    for arg in args:
+        name = arg.symbol_name if isinstance(arg, Symbol) else arg
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise ExprException('Invalid argument name %s' % name)
+        if name in names:
+            raise ExprException('Duplicate argument %s' % name)
+        names.append(name)
+    return _compile_cached(_pool.intern(expr), tuple(names))
+
+
+def compile_cache_info():
+    """Returns the hit and miss statistics of the compile cache."""
+    return _compile_cached.cache_info()
+
+
+def clear_compile_cache():
+    """Empties the compile cache."""
+    _compile_cached.cache_clear()
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def _compile_cached(expr, args):
+    source, namespace = _generate_source(expr, args)
+    code = compile(source, '<compiled %s>' % ', '.join(args), 'exec')
+    exec(code, namespace)
+    return namespace['compiled_expr']
+
+
+def _generate_source(expr, args):
+    """
+    Returns the source of a function computing expr, and its globals.
+
+    Every operator node becomes an assignment to a temporary, in postorder.
+    """
+    # Make sure temporaries can't shadow an argument
+    prefix = '_t'
+    while any(arg.startswith(prefix) for arg in args):
+        prefix = '_' + prefix
+    namespace = {}
+    lines = ['def compiled_expr(%s):' % ', '.join(args)]
+    num_temps = 0
+
+    results = []
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not node.operands:
+            results.append(_terminal_source(node.value, args, namespace))
+        elif visited:
+            operands = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            temp = '%s%d' % (prefix, num_temps)
+            num_temps += 1
+            for statement in _operator_source(node.value, operands, temp,
+                    namespace):
+                lines.append('    %s = %s' % (temp, statement))
+            results.append(temp)
+        else:
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    lines.append('    return %s' % results[0])
+    return '\n'.join(lines) + '\n', namespace
+
+
+def _terminal_source(value, args, namespace):
+    if isinstance(value, Symbol):
+        if value.symbol_name not in args:
+            raise ExprException('Symbol %s is not an argument' %
+                    value.symbol_name)
+        return value.symbol_name
+    if type(value) in (int, float) and math.isfinite(value):
+        return '(%r)' % value if value < 0 else repr(value)
+    # Other numbers are passed in as globals
+    name = '_c%d' % len(namespace)
+    namespace[name] = value
+    return name
+
+
+def _operator_source(op, operands, temp, namespace):
+    """Yields the right hand sides of the assignments computing op."""
+    infix = _INFIX.get(op)
+    if infix is None:
+        func_name = '_' + OP_NAMES[op]
+        namespace[func_name] = OP_FUNCS[op]
+        result = operands[0]
+        for operand in operands[1:]:
+            yield '%s(%s, %s)' % (func_name, result, operand)
+            result = temp
+        return
+    # ** groups from the right in Python, so fold it one operand at a time
+    chain = 2 if infix == '**' else _MAX_CHAIN
+    separator = ' %s ' % infix
+    yield separator.join(operands[:chain])
+    for start in range(chain, len(operands), chain - 1):
+        yield separator.join([temp] + operands[start:start + chain - 1])
@@ -1,5 +1,29 @@
 """Globally used constants."""
 
+import operator
+
 OPS = ['+', '*', '^', '/']
 OP_PRECEDENCES = {'+': 1, '*': 2, '/': 2, '^': 3, '(': 0}
 OP_NAMES = {'+': 'Add', '*': 'Mul', '^': 'Exp', '/': 'Div'}
+# Operators whose operands can be reordered without changing the value.
+COMMUTATIVE_OPS = ['+', '*']
+# Operators that can be regrouped, so nested uses can always be merged.  Other
+# operators with several operands are applied from the left, and only a first
+# operand with the same operator can be merged.
+ASSOCIATIVE_OPS = ['+', '*']
+# Binary functions implementing each operator.  Nodes with more than two
+# operands are evaluated by folding the function over them from the left.
+OP_FUNCS = {
+    '+': operator.add,
+    '*': operator.mul,
+    '^': operator.pow,
+    '/': operator.truediv,
+}
+# Rough relative cost of applying each operator once to two floats.  A node
+# with n operands costs n - 1 applications.
+OP_COSTS = {
+    '+': 1,
+    '*': 1,
+    '^': 8,
+    '/': 4,
+}
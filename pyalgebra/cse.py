@@ -0,0 +1,179 @@
+"""Common-subexpression elimination."""
+
+from functools import reduce
+from .expr import *
+
+
+class ExprDAG():
+    """
+    An expression with every repeated subexpression stored once.
+
+    nodes lists the unique subexpressions as InternedExprs in topological
+    order, so the operands of a node always come before it and the root is
+    last.  Walking nodes in order computes each unique subexpression once.
+
+    Parameters:
+    root: (InternedExpr object) - the root of the shared expression
+    pool: (ExprPool object) - the pool root was interned in
+    num_tree_nodes: (int) - the number of nodes of the expression as a tree
+    """
+
+    def __init__(self, root, pool, num_tree_nodes):
+        self.root = root
+        self.pool = pool
+        self.num_tree_nodes = num_tree_nodes
+        self.nodes = _schedule(root)
+
+    @property
+    def num_eliminated(self):
+        """The number of tree nodes that were merged into shared nodes."""
+        return self.num_tree_nodes - len(self.nodes)
+
+    def to_expr(self):
+        """Expands the DAG back into an ordinary Expr tree."""
+        return _copy_tree(self.root)
+
+    def evaluate(self, bindings):
+        """
+        Computes the numeric value, evaluating each unique node once.
+
+        bindings: (dict) - maps symbol names (or Symbol objects) to values.
+            Values can be numbers or anything else OP_FUNCS works on, like
+            NumPy arrays.
+        """
+        values = {}
+        for node in self.nodes:
+            if node.operands:
+                value = reduce(OP_FUNCS[node.value],
+                        [values[id(operand)] for operand in node.operands])
+            elif isinstance(node.value, Symbol):
+                value = _lookup(bindings, node.value)
+            else:
+                value = node.value
+            values[id(node)] = value
+        return values[id(self.root)]
+
+    def substitute(self, var, new_var):
+        """
+        Substitutes a new number, variable, or expr in the expression.
+
+        Each unique node is rebuilt once, so the result is a new ExprDAG
+        sharing as much as this one.
+
+        Parameters:
+        var: (Symbol object or string) - the symbol to replace
+        new_var: (a number, Symbol object, string name for Symbol, Expr
+            object) - what to replace var with
+
+        Returns:
+        new_dag: (ExprDAG object) - the result of the substitution
+        """
+        if not isinstance(var, Symbol):
+            var = Symbol(var)
+        if not isinstance(new_var, (Number, Symbol, Expr)):
+            new_var = Symbol(new_var)
+        if not isinstance(new_var, Expr):
+            new_var = Expr(new_var)
+        new_var = self.pool.intern(new_var)
+
+        pool = self.pool
+        new_nodes = {}
+        # Tree sizes of the new nodes, to keep num_eliminated meaningful
+        sizes = {}
+        for node in self.nodes:
+            if node.operands:
+                operands = [new_nodes[id(operand)]
+                        for operand in node.operands]
+                new_node = pool.make(node.value, operands)
+                sizes[id(new_node)] = 1 + sum([sizes[id(operand)]
+                    for operand in operands])
+            elif node.value == var:
+                new_node = new_var
+                sizes[id(new_node)] = _tree_size(new_var)
+            else:
+                new_node = node
+                sizes[id(new_node)] = 1
+            new_nodes[id(node)] = new_node
+        root = new_nodes[id(self.root)]
+        return ExprDAG(root, pool, sizes[id(root)])
+
+
+def cse(expr, pool=None):
+    """
+    Eliminates common subexpressions from an expression.
+
+    Structurally equal subtrees are merged into a single shared node, using
+    the same notion of equality as Expr, so x * y and y * x are merged too.
+
+    Parameters:
+    expr: (Expr object) - the expression.  It isn't modified.
+    pool: (ExprPool object) - the pool to intern nodes in.  A new one is
+        used by default.
+
+    Returns:
+    dag: (ExprDAG object) - the shared expression and its schedule.
+        dag.num_eliminated is the number of nodes that were merged away.
+    """
+    if pool is None:
+        pool = ExprPool()
+    return ExprDAG(pool.intern(expr), pool, _tree_size(expr))
+
+
+def _schedule(root):
+    """Returns the unique nodes under root in postorder."""
+    nodes = []
+    seen = set()
+    stack = [(root, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            nodes.append(node)
+        elif id(node) not in seen:
+            seen.add(id(node))
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    return nodes
+
+
+def _tree_size(expr):
+    """Counts the nodes of expr as a tree, visiting shared objects once."""
+    sizes = {}
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            sizes[id(node)] = 1 + sum([sizes[id(operand)]
+                for operand in node.operands])
+        elif id(node) not in sizes:
+            stack.append((node, True))
+            for operand in node.operands:
+                stack.append((operand, False))
+    return sizes[id(expr)]
+
+
+def _copy_tree(root):
+    """Copies a DAG of nodes into an Expr tree without shared nodes."""
+    results = []
+    stack = [(root, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not node.operands:
+            results.append(Expr(node.value))
+        elif visited:
+            operands = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            results.append(Expr(node.value, operands))
+        else:
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    return results[0]
+
+
+def _lookup(bindings, symbol):
+    if symbol.symbol_name in bindings:
+        return bindings[symbol.symbol_name]
+    if symbol in bindings:
+        return bindings[symbol]
+    raise ExprException('No value for symbol %s' % symbol.symbol_name)
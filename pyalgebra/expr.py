@@ -1,6 +1,11 @@
-from numbers import Number
-from collections import Counter
+import math
+import operator
+import sys
+import weakref
+import zlib
+from numbers import Number, Rational, Real
 from .constants import *
+from . import instrument
 
 
 class Expr():
@@ -11,8 +16,26 @@ class Expr():
     (instance of numbers.Number). Examples: Symbol('x'), 5, 5.585, etc.
 
     An operator is a valid char from Expr.OPS.
+
+    The operands of commutative operators are kept in a canonical order:
+    numbers first by value, then symbols by name, then other expressions by
+    their hash.  Since equal expressions then have their operands in the
+    same order, they can be compared in a single linear pass.
     """
 
+    # The caches of free symbols and the hash, with the value of _mutations
+    # they were computed at.  Nodes have no __dict__, which keeps the many
+    # small nodes of a parsed corpus compact.
+    __slots__ = ('value', 'operands', '_free_symbols',
+            '_free_symbols_mutations', '_hash', '_hash_mutations')
+
+    # Bumped when add_operand, add_operands or flatten_expr modify a node
+    # with cached values.  Cached free symbols and hashes are only valid
+    # while it doesn't change, since modifying a node changes them for all
+    # the nodes above it too.  Nodes without cached values, like those just
+    # built by the parser, can be modified without invalidating anything.
+    _mutations = 0
+
     def __init__(self, value, operands=None):
         """
         Constructor for Expr.
@@ -20,9 +43,11 @@ class Expr():
         value: (a terminal or operator) - The value.  Must be one listed in OPS.
         operands: (list of Exprs) - The operands (children) of this expression.
         """
+        if instrument.ENABLED:
+            instrument.count('Expr.nodes')
         if value is None:
             raise ExprException('Node must have a value')
-        if self.is_terminal(value):
+        if isinstance(value, (Symbol, Number)):
             if not operands:
                 self.value = value
                 self.operands = []
@@ -30,62 +55,164 @@ class Expr():
                 raise ExprException(
                         'A node with a terminal value cannot have any'
                         'operands.')
-        elif self.is_operator(value):
+        elif value in OPS:
             # TODO(smilli): Maybe don't allow no operands when the value
             # is an operator
             if not operands:
                 raise ExprException(
                         'An expression with an operator as a value must have'
                         ' operands')
+            if not all([isinstance(operand, Expr) for operand in operands]):
+                raise ExprException('Operands must be expressions')
             self.value = value
-            self.operands = []
-            self.add_operands(operands)
+            self.operands = _sort_operands(value, list(operands))
         else:
             raise ExprException('Invalid value for expression node: %s' %
                     str(value))
+        self._free_symbols_mutations = -1
+        self._hash_mutations = -1
+
+    @classmethod
+    def _new(cls, value, operands):
+        """
+        Builds a node without validating value and operands.
+
+        Only for internal callers that already guarantee a valid node, such
+        as the parser.  operands must be a new list owned by the node, and
+        the caller is responsible for their order, see _new_sorted.
+        """
+        if instrument.ENABLED:
+            instrument.count('Expr.nodes')
+        expr = cls.__new__(cls)
+        expr.value = value
+        expr.operands = operands
+        expr._free_symbols_mutations = -1
+        expr._hash_mutations = -1
+        return expr
+
+    @classmethod
+    def _new_sorted(cls, value, operands):
+        """Like _new, but puts the operands in canonical order."""
+        return cls._new(value, _sort_operands(value, operands))
 
     def __eq__(self, other):
-        if (isinstance(other, self.__class__)
-                and self.value == other.value):
-            return Counter(self.operands) == Counter(other.operands)
-        return False
+        """
+        Compares the structure of two expressions.
+
+        Thanks to the canonical operand order this walks both trees side by
+        side once, and exits as soon as the cached hashes of two nodes
+        differ.
+        """
+        if self is other:
+            return True
+        if not isinstance(other, Expr) or hash(self) != hash(other):
+            return False
+        stack = [(self, other)]
+        while stack:
+            node1, node2 = stack.pop()
+            if node1 is node2:
+                continue
+            if (node1.value != node2.value or
+                    len(node1.operands) != len(node2.operands) or
+                    hash(node1) != hash(node2)):
+                # The hashes matched above, so this is either a hash
+                # collision or operands out of order after a node was
+                # modified in place
+                return _equal_ignoring_order(self, other)
+            stack.extend(zip(node1.operands, node2.operands))
+        return True
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __getstate__(self):
+        # The caches are only meaningful in the process that filled them
+        return self.value, self.operands
+
+    def __setstate__(self, state):
+        self.value, self.operands = state
+        self._free_symbols_mutations = -1
+        self._hash_mutations = -1
+
     def __repr__(self):
-        if not self.operands:
-            return repr(self.value)
-        string = '%s(' % OP_NAMES[self.value]
-        for index, operand in enumerate(self.operands):
-            if index == len(self.operands) - 1:
-                string += repr(operand)
-            else:
-                string += '%s, ' % repr(operand)
-        string += ')'
-        return string
+        return self._render(repr, lambda op: '%s(' % OP_NAMES[op],
+                lambda op: ', ', ')')
 
     def __str__(self):
-        if not self.operands:
-            return str(self.value)
-        string = ''
-        for index, operand in enumerate(self.operands):
-            if index == len(self.operands) - 1:
-                string += str(operand)
+        return self._render(str, lambda op: '', lambda op: ' %s ' % op, '')
+
+    def _render(self, render_terminal, render_open, render_separator, close):
+        """
+        Builds the string for __repr__ or __str__ in one pass.
+
+        The pieces are collected in order with an explicit stack and joined
+        once, so deep trees neither recurse nor copy partial strings.
+        """
+        pieces = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+            elif not item.operands:
+                pieces.append(render_terminal(item.value))
             else:
-                string += '%s %s ' % (str(operand), self.value)
-        return string
+                pieces.append(render_open(item.value))
+                separator = render_separator(item.value)
+                stack.append(close)
+                for index in range(len(item.operands) - 1, 0, -1):
+                    stack.append(item.operands[index])
+                    stack.append(separator)
+                stack.append(item.operands[0])
+        return ''.join(pieces)
 
     def __hash__(self):
-        # The value of this hash will change when the obj changes
-        # Should only currently be used in __eq__
-        # TODO(smilli): Find better way to do this
-        if not self.operands:
-            return hash(self.value)
-        hash_value = hash(self.value)
+        """
+        A structural hash, the same in every process.
+
+        It is computed in one pass and cached on every node of the
+        expression, like free_symbols.  The value of this hash will change
+        when the obj changes.
+        """
+        mutations = Expr._mutations
+        if self._hash_mutations == mutations:
+            return self._hash
+        # Nodes are usually built on top of terminals and operands that are
+        # already hashed, which doesn't need a walk
+        hashes = []
         for operand in self.operands:
-            hash_value ^= hash(operand)
-        return hash_value
+            if operand._hash_mutations != mutations:
+                if operand.operands:
+                    break
+                operand._hash = _structural_hash(operand.value, ())
+                operand._hash_mutations = mutations
+            hashes.append(operand._hash)
+        else:
+            self._hash = _structural_hash(self.value, hashes)
+            self._hash_mutations = mutations
+            return self._hash
+        hashes = []
+        stack = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if node._hash_mutations == mutations:
+                hashes.append(node._hash)
+                continue
+            if isinstance(node, InternedExpr):
+                hashes.append(node._hash)
+                continue
+            if visited or not node.operands:
+                num_operands = len(node.operands)
+                operand_hashes = hashes[len(hashes) - num_operands:]
+                del hashes[len(hashes) - num_operands:]
+                node._hash = _structural_hash(node.value, operand_hashes)
+                node._hash_mutations = mutations
+                hashes.append(node._hash)
+            else:
+                stack.append((node, True))
+                for operand in reversed(node.operands):
+                    stack.append((operand, False))
+        return hashes[0]
 
     def is_operator(self, value=None):
         if value == None:
@@ -101,7 +228,10 @@ class Expr():
         if not self.is_operator():
             raise ExprException('This node\'s value is not an operator')
         if isinstance(operand, Expr):
+            if _is_cached(self):
+                Expr._mutations += 1
             self.operands.append(operand)
+            _sort_operands(self.value, self.operands)
         else:
             raise ExprException('Operand must be an expression')
 
@@ -114,7 +244,10 @@ class Expr():
         if not self.is_operator():
             raise ExprException('This node\'s value is not an operator')
         if all([isinstance(operand, Expr) for operand in operands]):
+            if _is_cached(self):
+                Expr._mutations += 1
             self.operands.extend(operands)
+            _sort_operands(self.value, self.operands)
         else:
             raise ExprException('Operands must be expressions')
 
@@ -122,6 +255,290 @@ class Expr():
     def num_operands(self):
         return len(self.operands)
 
+    @property
+    def free_symbols(self):
+        """
+        The Symbols occurring in this expression, as a frozenset.
+
+        Computed in one pass the first time it is needed and cached on every
+        node of the expression, so later queries on any subtree are O(1).
+        The caches are invalidated whenever add_operand, add_operands or
+        flatten_expr modify a node.
+        """
+        mutations = Expr._mutations
+        if self._free_symbols_mutations == mutations:
+            return self._free_symbols
+        results = []
+        stack = [(self, False)]
+        while stack:
+            node, visited = stack.pop()
+            if node._free_symbols_mutations == mutations:
+                results.append(node._free_symbols)
+                continue
+            if not node.operands:
+                if isinstance(node.value, Symbol):
+                    symbols = frozenset([node.value])
+                else:
+                    symbols = _NO_SYMBOLS
+            elif not visited:
+                stack.append((node, True))
+                for operand in reversed(node.operands):
+                    stack.append((operand, False))
+                continue
+            else:
+                operand_symbols = results[len(results) - len(node.operands):]
+                del results[len(results) - len(node.operands):]
+                symbols = _union(operand_symbols)
+            node._free_symbols = symbols
+            node._free_symbols_mutations = mutations
+            results.append(symbols)
+        return results[0]
+
+    def has_symbol(self, symbol):
+        """
+        Returns whether the symbol occurs in this expression.
+
+        symbol: (Symbol object or string) - the symbol or its name
+        """
+        if not isinstance(symbol, Symbol):
+            symbol = Symbol(symbol)
+        return symbol in self.free_symbols
+
+
+class InternedExpr(Expr):
+    """
+    An immutable Expr that is unique within the ExprPool that created it.
+
+    Structurally identical interned nodes are the same object, so equality
+    between nodes of the same pool is an identity check and the hash is
+    computed once when the node is built.  Don't create these directly, use
+    ExprPool.make or ExprPool.intern instead.
+    """
+
+    # Pools hold their nodes weakly
+    __slots__ = ('_pool', '__weakref__')
+
+    def __init__(self, pool, value, operands, hash_value):
+        self._pool = pool
+        self._hash = hash_value
+        self._hash_mutations = -1
+        self._free_symbols_mutations = -1
+        self.value = value
+        self.operands = tuple(operands)
+
+    def __eq__(self, other):
+        if isinstance(other, InternedExpr) and other._pool is self._pool:
+            return self is other
+        return Expr.__eq__(self, other)
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # The pool doesn't exist in the process unpickling the node, so it
+        # comes back as a plain Expr
+        return Expr, (self.value, list(self.operands))
+
+    def add_operand(self, operand):
+        raise ExprException('Interned expressions are immutable')
+
+    def add_operands(self, operands):
+        raise ExprException('Interned expressions are immutable')
+
+
+class ExprPool():
+    """
+    Factory for hash-consed expressions.
+
+    Every node made by a pool is an InternedExpr, and the pool hands out the
+    same object for structurally identical subtrees.  Nodes are only held
+    weakly, so they are freed once nothing else refers to them.
+    """
+
+    def __init__(self):
+        self._nodes = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def make(self, value, operands=None):
+        """
+        Returns the interned node with the given value and operands.
+
+        value: (a terminal or operator) - The value, as for Expr.
+        operands: (list of Exprs) - The operands.  Operands that don't belong
+            to this pool are interned first.
+        """
+        if value is None:
+            raise ExprException('Node must have a value')
+        if isinstance(value, (Symbol, Number)):
+            if operands:
+                raise ExprException(
+                        'A node with a terminal value cannot have any'
+                        'operands.')
+            key = (type(value), value)
+            operands = ()
+        elif value in OPS:
+            if not operands:
+                raise ExprException(
+                        'An expression with an operator as a value must have'
+                        ' operands')
+            if not all([isinstance(operand, Expr) for operand in operands]):
+                raise ExprException('Operands must be expressions')
+            operands = _sort_operands(value,
+                    [self._own(operand) for operand in operands])
+            operand_ids = [id(operand) for operand in operands]
+            if value in COMMUTATIVE_OPS:
+                operand_ids.sort()
+            key = (value, tuple(operand_ids))
+        else:
+            raise ExprException('Invalid value for expression node: %s' %
+                    str(value))
+        node = self._nodes.get(key)
+        if node is None:
+            if instrument.ENABLED:
+                instrument.count('ExprPool.nodes')
+            hash_value = _structural_hash(value,
+                    [operand._hash for operand in operands])
+            node = InternedExpr(self, value, operands, hash_value)
+            self._nodes[key] = node
+        return node
+
+    def intern(self, expr):
+        """
+        Returns the interned node structurally identical to expr.
+
+        expr: (Expr object) - the expression to intern.  It isn't modified.
+        """
+        # Objects that occur more than once in expr are only interned once
+        memo = {}
+        interned = []
+        stack = [(expr, False)]
+        while stack:
+            node, visited = stack.pop()
+            if isinstance(node, InternedExpr) and node._pool is self:
+                interned.append(node)
+            elif id(node) in memo:
+                interned.append(memo[id(node)])
+            elif visited or not node.operands:
+                operands = interned[len(interned) - len(node.operands):]
+                del interned[len(interned) - len(node.operands):]
+                memo[id(node)] = self.make(node.value, operands)
+                interned.append(memo[id(node)])
+            else:
+                stack.append((node, True))
+                for operand in reversed(node.operands):
+                    stack.append((operand, False))
+        return interned[0]
+
+    def _own(self, expr):
+        if isinstance(expr, InternedExpr) and expr._pool is self:
+            return expr
+        return self.intern(expr)
+
+
+_NO_SYMBOLS = frozenset()
+
+
+def _union(symbol_sets):
+    """Unions frozensets, reusing the largest one if it has everything."""
+    largest = max(symbol_sets, key=len)
+    if all([symbols <= largest for symbols in symbol_sets]):
+        return largest
+    return frozenset().union(*symbol_sets)
+
+
+def _structural_hash(value, operand_hashes):
+    """
+    Combines a node's value with the hashes of its operands.
+
+    Operand order is ignored for commutative operators, so the hash stays
+    right for nodes whose operands went out of order, but repeated operands
+    still count, so x + x and y + y hash differently.  Symbol names are
+    hashed with CRC-32 and operators by their index in OPS instead of with
+    the salted str hash, so the hash, and with it the canonical operand
+    order, is the same in every process.
+    """
+    if not operand_hashes:
+        if isinstance(value, Symbol):
+            return zlib.crc32(value.symbol_name.encode('utf-8'))
+        return hash(value)
+    if value in COMMUTATIVE_OPS:
+        operand_hashes = sorted(operand_hashes)
+    return hash((_OP_CODES[value], tuple(operand_hashes)))
+
+
+_OP_CODES = {op: index for index, op in enumerate(OPS)}
+
+
+def _is_cached(node):
+    """
+    Whether node has a current cached hash or set of free symbols.
+
+    Both are cached on whole subtrees at once, so when a node has neither,
+    no node above it has them either, and modifying it in place doesn't
+    need to invalidate any cache.
+    """
+    mutations = Expr._mutations
+    return (node._hash_mutations == mutations or
+            node._free_symbols_mutations == mutations)
+
+
+def _sort_key(expr):
+    """Orders numbers by value, then symbols by name, then the rest."""
+    if expr.operands:
+        return (3, hash(expr))
+    if isinstance(expr.value, Symbol):
+        return (2, expr.value.symbol_name)
+    if isinstance(expr.value, Real):
+        return (0, expr.value)
+    return (1, hash(expr))
+
+
+def _sort_operands(value, operands):
+    """Sorts operands in place if value is commutative, and returns them."""
+    if value in COMMUTATIVE_OPS:
+        operands.sort(key=_sort_key)
+    return operands
+
+
+def _equal_ignoring_order(expr1, expr2):
+    """
+    Compares two expressions without relying on the canonical order.
+
+    Modifying a node in place can leave the operands of the nodes above it
+    out of order, so Expr.__eq__ falls back to this when the ordered
+    comparison fails despite equal hashes.  The nodes of both expressions
+    are numbered bottom up by their class of equal subtrees, with the
+    operand classes of commutative nodes sorted, and the expressions are
+    equal when their roots land in the same class.  An explicit stack is
+    used, and shared objects are only numbered once.
+    """
+    classes = {}
+    class_numbers = {}
+    for expr in [expr1, expr2]:
+        stack = [(expr, False)]
+        while stack:
+            node, visited = stack.pop()
+            if id(node) in classes:
+                continue
+            if node.operands and not visited:
+                stack.append((node, True))
+                for operand in node.operands:
+                    stack.append((operand, False))
+                continue
+            if node.operands:
+                operand_classes = [classes[id(operand)]
+                        for operand in node.operands]
+                if node.value in COMMUTATIVE_OPS:
+                    operand_classes.sort()
+                key = (node.value, tuple(operand_classes))
+            else:
+                key = (node.value,)
+            classes[id(node)] = class_numbers.setdefault(key,
+                    len(class_numbers))
+    return classes[id(expr1)] == classes[id(expr2)]
+
 
 class ExprException(Exception):
     """Thrown when an error occurs when calling a method of an Expr."""
@@ -129,11 +546,31 @@ class ExprException(Exception):
 
 
 class Symbol():
-    """An algebraic symbol like x, y, a, etc."""
-    def __init__(self, symbol_name):
-        self.symbol_name = symbol_name
+    """
+    An algebraic symbol like x, y, a, etc.
+
+    Symbols are interned: Symbol('x') returns the same object as long as one
+    is alive, so every occurrence of x in a corpus shares it and equal
+    symbols are usually identical.
+    """
+
+    __slots__ = ('symbol_name', '__weakref__')
+
+    def __new__(cls, symbol_name):
+        key = (cls, symbol_name)
+        symbol = _symbols.get(key)
+        if symbol is None:
+            symbol = object.__new__(cls)
+            symbol.symbol_name = symbol_name
+            symbol = _symbols.setdefault(key, symbol)
+        return symbol
+
+    def __reduce__(self):
+        return self.__class__, (self.symbol_name,)
 
     def __eq__(self, other):
+        if self is other:
+            return True
         return (isinstance(other, self.__class__)
                 and self.symbol_name == other.symbol_name)
 
@@ -147,7 +584,209 @@ class Symbol():
         return self.symbol_name
 
 
+# (Symbol class, name): the live Symbol with that name
+_symbols = weakref.WeakValueDictionary()
+
+
 class Fraction():
-    def __init__(self, numer, denom):
-        self.numer = numer
-        self.denom = denom
+    """
+    An exact rational number numer / denom.
+
+    Fractions are always in lowest terms with a positive denominator, so
+    equal fractions have the same numer and denom.  They compare and hash
+    equal to ints and floats of the same value.  Arithmetic with ints and
+    other Fractions is exact and gives an int whenever the result is whole;
+    arithmetic with floats gives floats.
+    """
+
+    __slots__ = ('numer', 'denom')
+
+    def __init__(self, numer, denom=1):
+        if not isinstance(numer, int) or not isinstance(denom, int):
+            raise ExprException('A Fraction needs an integer numerator and '
+                    'denominator')
+        if denom == 0:
+            raise ZeroDivisionError('Fraction with a zero denominator')
+        divisor = math.gcd(numer, denom)
+        if denom < 0:
+            divisor = -divisor
+        self.numer = numer // divisor
+        self.denom = denom // divisor
+
+    @property
+    def numerator(self):
+        return self.numer
+
+    @property
+    def denominator(self):
+        return self.denom
+
+    def _apply(self, other, exact_func, float_func, reflected=False):
+        if isinstance(other, int):
+            other = (other, 1)
+        elif isinstance(other, Fraction):
+            other = (other.numer, other.denom)
+        elif isinstance(other, float):
+            if reflected:
+                return float_func(other, float(self))
+            return float_func(float(self), other)
+        else:
+            return NotImplemented
+        if reflected:
+            return exact_func(other, (self.numer, self.denom))
+        return exact_func((self.numer, self.denom), other)
+
+    def __add__(self, other):
+        return self._apply(other, _add_fractions, operator.add)
+
+    def __radd__(self, other):
+        return self._apply(other, _add_fractions, operator.add, True)
+
+    def __sub__(self, other):
+        return self._apply(other, _subtract_fractions, operator.sub)
+
+    def __rsub__(self, other):
+        return self._apply(other, _subtract_fractions, operator.sub, True)
+
+    def __mul__(self, other):
+        return self._apply(other, _multiply_fractions, operator.mul)
+
+    def __rmul__(self, other):
+        return self._apply(other, _multiply_fractions, operator.mul, True)
+
+    def __truediv__(self, other):
+        return self._apply(other, _divide_fractions, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self._apply(other, _divide_fractions, operator.truediv, True)
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, int):
+            if exponent >= 0:
+                return rational(self.numer ** exponent, self.denom ** exponent)
+            return rational(self.denom ** -exponent, self.numer ** -exponent)
+        if isinstance(exponent, (float, Fraction)):
+            return float(self) ** float(exponent)
+        return NotImplemented
+
+    def __rpow__(self, base):
+        if isinstance(base, (int, float)):
+            return float(base) ** float(self)
+        return NotImplemented
+
+    def __neg__(self):
+        return Fraction(-self.numer, self.denom)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Fraction(abs(self.numer), self.denom)
+
+    def __float__(self):
+        return self.numer / self.denom
+
+    def __int__(self):
+        if self.numer < 0:
+            return -(-self.numer // self.denom)
+        return self.numer // self.denom
+
+    def __bool__(self):
+        return self.numer != 0
+
+    def _compare(self, other, compare):
+        if isinstance(other, float):
+            if math.isnan(other) or math.isinf(other):
+                return compare(0.0, other)
+            other = Fraction(*other.as_integer_ratio())
+        if isinstance(other, int):
+            return compare(self.numer, other * self.denom)
+        if isinstance(other, Fraction):
+            return compare(self.numer * other.denom, other.numer * self.denom)
+        return NotImplemented
+
+    def __eq__(self, other):
+        return self._compare(other, operator.eq)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __lt__(self, other):
+        return self._compare(other, operator.lt)
+
+    def __le__(self, other):
+        return self._compare(other, operator.le)
+
+    def __gt__(self, other):
+        return self._compare(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._compare(other, operator.ge)
+
+    def __hash__(self):
+        # The same hash Python uses for numbers, so a Fraction hashes like
+        # an equal int or float
+        modulus = sys.hash_info.modulus
+        inverse = pow(self.denom, modulus - 2, modulus)
+        if not inverse:
+            hash_value = sys.hash_info.inf
+        else:
+            hash_value = abs(self.numer) % modulus * inverse % modulus
+        if self.numer < 0:
+            hash_value = -hash_value
+        return -2 if hash_value == -1 else hash_value
+
+    def __repr__(self):
+        return 'Fraction(%d, %d)' % (self.numer, self.denom)
+
+    def __str__(self):
+        # Parenthesized so str of an expression parses back the same
+        return '(%d/%d)' % (self.numer, self.denom)
+
+
+Rational.register(Fraction)
+
+
+def rational(numer, denom=1):
+    """
+    Returns numer / denom exactly.
+
+    numer, denom: (ints or Fractions)
+
+    Returns:
+    value: (int or Fraction) - an int if the quotient is whole
+    """
+    if isinstance(numer, Fraction):
+        numer, denom = numer.numer, numer.denom * denom
+    if isinstance(denom, Fraction):
+        numer, denom = numer * denom.denom, denom.numer
+    if denom == 0:
+        raise ZeroDivisionError('Fraction with a zero denominator')
+    if numer % denom == 0:
+        return numer // denom
+    return Fraction(numer, denom)
+
+
+def _add_fractions(fraction1, fraction2):
+    numer1, denom1 = fraction1
+    numer2, denom2 = fraction2
+    return rational(numer1 * denom2 + numer2 * denom1, denom1 * denom2)
+
+
+def _subtract_fractions(fraction1, fraction2):
+    numer1, denom1 = fraction1
+    numer2, denom2 = fraction2
+    return rational(numer1 * denom2 - numer2 * denom1, denom1 * denom2)
+
+
+def _multiply_fractions(fraction1, fraction2):
+    numer1, denom1 = fraction1
+    numer2, denom2 = fraction2
+    return rational(numer1 * numer2, denom1 * denom2)
+
+
+def _divide_fractions(fraction1, fraction2):
+    numer1, denom1 = fraction1
+    numer2, denom2 = fraction2
+    return rational(numer1 * denom2, denom1 * numer2)
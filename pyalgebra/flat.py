@@ -0,0 +1,231 @@
+"""Compact, array-backed representation of expression trees."""
+
+from array import array
+from functools import reduce
+from .expr import *
+
+# Opcodes for terminals.  Operators are stored as CONST_OPS + OPS.index(op).
+CONST = 0
+SYMBOL = 1
+CONST_OPS = 2
+
+
+class FlatExpr():
+    """
+    An expression tree stored as flat arrays in postorder.
+
+    Node i is described by three parallel arrays:
+    opcodes[i]: CONST, SYMBOL, or CONST_OPS + the index of its operator in OPS
+    args[i]: the index into constants or symbols for terminals, the number
+        of operands for operators
+    sizes[i]: the number of nodes in the subtree rooted at node i
+
+    Since the arrays are in postorder, the last operand of node i is node
+    i - 1, the one before it is node i - 1 - sizes[i - 1], and so on.  The
+    root is always the last node.  Numbers are kept in the constants pool and
+    symbol names in the symbols pool, each stored only once.
+
+    The arrays support the buffer protocol, so they can be wrapped by NumPy
+    (numpy.frombuffer) or sent to other processes without per-node objects.
+    """
+
+    def __init__(self, opcodes, args, sizes, constants, symbols):
+        self.opcodes = opcodes
+        self.args = args
+        self.sizes = sizes
+        self.constants = constants
+        self.symbols = symbols
+
+    @classmethod
+    def from_expr(cls, expr):
+        """
+        Converts an Expr object to a FlatExpr.
+
+        expr: (Expr object) - the expression to convert
+        """
+        builder = _FlatBuilder()
+        builder.add_expr(expr)
+        return builder.build()
+
+    def to_expr(self, sort=True):
+        """
+        Converts this back to an equivalent Expr object.
+
+        sort: (bool) - whether to put the operands of commutative operators
+            in canonical order.  Leaving it out saves hashing every node,
+            for FlatExprs made from expressions already in canonical order.
+        """
+        make = Expr._new_sorted if sort else Expr._new
+        symbols = [Symbol(name) for name in self.symbols]
+        stack = []
+        for index in range(len(self.opcodes)):
+            opcode = self.opcodes[index]
+            arg = self.args[index]
+            if opcode == CONST:
+                stack.append(Expr._new(self.constants[arg], []))
+            elif opcode == SYMBOL:
+                stack.append(Expr._new(symbols[arg], []))
+            else:
+                operands = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                stack.append(make(OPS[opcode - CONST_OPS], operands))
+        return stack[0]
+
+    def substitute(self, var, new_var):
+        """
+        Substitutes a new number, variable, or expr in the expression.
+
+        Works like operations.substitute, but on the flat arrays.  Returns a
+        new FlatExpr and does not modify this one.
+
+        Parameters:
+        var: (Symbol object or string) - the symbol to replace
+        new_var: (a number, Symbol object, string name for Symbol, Expr
+            object, FlatExpr object) - what to replace var with
+
+        Returns:
+        new_flat_expr: (FlatExpr object) - the result of the substitution
+        """
+        if isinstance(var, Symbol):
+            var = var.symbol_name
+        if isinstance(new_var, FlatExpr):
+            new_var = new_var.to_expr()
+        elif not isinstance(new_var, (Number, Symbol, Expr)):
+            new_var = Symbol(new_var)
+        if not isinstance(new_var, Expr):
+            new_var = Expr(new_var)
+
+        builder = _FlatBuilder()
+        for index in range(len(self.opcodes)):
+            opcode = self.opcodes[index]
+            arg = self.args[index]
+            if opcode == CONST:
+                builder.add_terminal(self.constants[arg])
+            elif opcode == SYMBOL:
+                if self.symbols[arg] == var:
+                    builder.add_expr(new_var)
+                else:
+                    builder.add_terminal(Symbol(self.symbols[arg]))
+            else:
+                builder.add_operator(OPS[opcode - CONST_OPS], arg)
+        return builder.build()
+
+    def evaluate(self, bindings):
+        """
+        Computes the numeric value of the expression.
+
+        bindings: (dict) - maps symbol names (or Symbol objects) to numbers.
+            Every symbol in the expression must be bound.
+        """
+        values = []
+        for symbol_name in self.symbols:
+            if symbol_name in bindings:
+                values.append(bindings[symbol_name])
+            elif Symbol(symbol_name) in bindings:
+                values.append(bindings[Symbol(symbol_name)])
+            else:
+                raise ExprException('No value for symbol %s' % symbol_name)
+        funcs = [OP_FUNCS[op] for op in OPS]
+
+        stack = []
+        for index in range(len(self.opcodes)):
+            opcode = self.opcodes[index]
+            arg = self.args[index]
+            if opcode == CONST:
+                stack.append(self.constants[arg])
+            elif opcode == SYMBOL:
+                stack.append(values[arg])
+            else:
+                operands = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                stack.append(reduce(funcs[opcode - CONST_OPS], operands))
+        return stack[0]
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __repr__(self):
+        return self._render(repr, lambda op, operands:
+                '%s(%s)' % (OP_NAMES[op], ', '.join(operands)))
+
+    def __str__(self):
+        return self._render(str, lambda op, operands:
+                (' %s ' % op).join(operands))
+
+    def _render(self, render_terminal, render_operator):
+        """Builds a string with the same layout as the equivalent Expr."""
+        stack = []
+        for index in range(len(self.opcodes)):
+            opcode = self.opcodes[index]
+            arg = self.args[index]
+            if opcode == CONST:
+                stack.append(render_terminal(self.constants[arg]))
+            elif opcode == SYMBOL:
+                stack.append(render_terminal(Symbol(self.symbols[arg])))
+            else:
+                operands = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                stack.append(render_operator(OPS[opcode - CONST_OPS],
+                    operands))
+        return stack[0]
+
+
+class _FlatBuilder():
+    """Appends nodes in postorder and produces a FlatExpr."""
+
+    def __init__(self):
+        self.opcodes = array('b')
+        self.args = array('i')
+        self.sizes = array('i')
+        self.constants = []
+        self.symbols = []
+        self._constant_indices = {}
+        self._symbol_indices = {}
+        # Sizes of the subtrees that don't have a parent yet
+        self._pending_sizes = []
+
+    def add_terminal(self, value):
+        if isinstance(value, Symbol):
+            indices, pool, opcode = (self._symbol_indices, self.symbols,
+                    SYMBOL)
+            key = value = value.symbol_name
+        else:
+            indices, pool, opcode = (self._constant_indices, self.constants,
+                    CONST)
+            # Keep 5 and 5.0 apart so the conversion is lossless
+            key = (type(value), value)
+        index = indices.get(key)
+        if index is None:
+            index = indices[key] = len(pool)
+            pool.append(value)
+        self.opcodes.append(opcode)
+        self.args.append(index)
+        self.sizes.append(1)
+        self._pending_sizes.append(1)
+
+    def add_operator(self, op, num_operands):
+        pending = self._pending_sizes
+        size = 1 + sum(pending[len(pending) - num_operands:])
+        del pending[len(pending) - num_operands:]
+        pending.append(size)
+        self.opcodes.append(CONST_OPS + OPS.index(op))
+        self.args.append(num_operands)
+        self.sizes.append(size)
+
+    def add_expr(self, expr):
+        """Adds all nodes of an Expr in postorder without recursing."""
+        stack = [(expr, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not node.operands:
+                self.add_terminal(node.value)
+            elif visited:
+                self.add_operator(node.value, len(node.operands))
+            else:
+                stack.append((node, True))
+                for operand in reversed(node.operands):
+                    stack.append((operand, False))
+
+    def build(self):
+        return FlatExpr(self.opcodes, self.args, self.sizes, self.constants,
+                self.symbols)
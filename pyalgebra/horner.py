@@ -0,0 +1,223 @@
+"""Rewrites polynomials into cheaper forms for repeated evaluation."""
+
+import math
+from .expr import *
+from .polynomial import Polynomial, _OPERATORS
+
+# Powers with a larger exponent aren't expanded, and polynomials that could
+# have more terms than this are left as they are, so expansion can't blow up
+_MAX_EXPONENT = 32
+_MAX_TERMS = 10000
+
+
+def eval_cost(expr):
+    """
+    Estimates the cost of evaluating an expression as a tree.
+
+    Each operator node with n operands costs n - 1 times its OP_COSTS entry.
+    Terminals are free.
+    """
+    cost = 0
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node.operands:
+            cost += OP_COSTS[node.value] * (len(node.operands) - 1)
+            stack.extend(node.operands)
+    return cost
+
+
+def optimize_for_eval(expr):
+    """
+    Rewrites the polynomial parts of an expression to evaluate faster.
+
+    Every maximal subtree built from '+', '*', division by numbers and
+    powers with small natural exponents is expanded into a polynomial over
+    its symbols and other subexpressions, which are optimized the same way.
+    The polynomial is then written in multivariate Horner form: the symbol
+    occurring in the most terms is factored out of them, as in
+    a + x * (b + x * (c + ...)), and the remaining parts are treated the
+    same way.  Powers of a symbol left by gaps in its exponents are written
+    as products when that is cheaper, and shared between the places that
+    need them.  Each subtree keeps whichever of the two forms is cheaper by
+    eval_cost, so factored input like (x + 1) ^ 10 isn't expanded.
+
+    Does not modify the expression passed in.  The result is an ordinary
+    Expr, sharing unchanged subtrees with expr.
+
+    Parameters:
+    expr: (Expr object) - the expression to optimize
+
+    Returns:
+    new_expr: (Expr object) - the optimized expression, or expr itself if
+        nothing was cheaper
+    cost_before: (number) - eval_cost(expr)
+    cost_after: (number) - eval_cost(new_expr)
+    """
+    # A result is (polynomial or None, expression, whether the node is part
+    # of a polynomial).  The expression of a polynomial node is only a
+    # rebuilt copy until finished by its first non-polynomial ancestor.
+    results = []
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not node.operands:
+            if isinstance(node.value, Symbol):
+                results.append((Polynomial.generator(node), node, False))
+            else:
+                results.append((Polynomial.constant(node.value), node, False))
+        elif visited:
+            operands = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            polynomial = None
+            if (_is_polynomial(node) and all([operand[0] is not None
+                    for operand in operands]) and _max_terms(node.value,
+                        [operand[0] for operand in operands]) <= _MAX_TERMS):
+                polynomial = _OPERATORS[node.value]([operand[0]
+                    for operand in operands])
+            if polynomial is not None:
+                results.append((polynomial, _rebuild(node,
+                    [operand[1] for operand in operands]), True))
+            else:
+                new_node = _rebuild(node, [_finish(operand)
+                    for operand in operands])
+                results.append((Polynomial.generator(new_node), new_node,
+                    False))
+        else:
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    new_expr = _finish(results[0])
+    cost_before = eval_cost(expr)
+    cost_after = eval_cost(new_expr)
+    if cost_after >= cost_before:
+        return expr, cost_before, cost_before
+    return new_expr, cost_before, cost_after
+
+
+def _is_polynomial(node):
+    if node.value in ('+', '*'):
+        return True
+    if node.value == '/':
+        return all([not operand.operands and
+            not isinstance(operand.value, Symbol) and operand.value != 0
+            for operand in node.operands[1:]])
+    if node.value == '^':
+        if len(node.operands) != 2 or node.operands[1].operands:
+            return False
+        exponent = node.operands[1].value
+        return isinstance(exponent, int) and 0 <= exponent <= _MAX_EXPONENT
+    return False
+
+
+def _max_terms(op, polynomials):
+    """
+    Bounds the number of terms of op applied to polynomials.
+
+    Computed before expanding, so a product that would be too large is never
+    built.  A power of a polynomial with n terms to the k has at most
+    binomial(n + k - 1, k) terms, one per multiset of k of its terms.
+    """
+    sizes = [max(len(polynomial.terms), 1) for polynomial in polynomials]
+    if op == '+':
+        return sum(sizes)
+    if op == '*':
+        bound = 1
+        for size in sizes:
+            bound *= size
+            if bound > _MAX_TERMS:
+                break
+        return bound
+    if op == '^':
+        exponent = polynomials[1].constant_value()
+        return math.comb(sizes[0] + exponent - 1, exponent)
+    return sizes[0]
+
+
+def _rebuild(node, operands):
+    if all([new_operand is operand for new_operand, operand
+            in zip(operands, node.operands)]):
+        return node
+    return Expr._new_sorted(node.value, operands)
+
+
+def _finish(result):
+    """Returns the cheaper of the Horner form and the rebuilt expression."""
+    polynomial, expr, is_polynomial = result
+    if not is_polynomial:
+        return expr
+    horner = _horner(polynomial)
+    if eval_cost(horner) < eval_cost(expr):
+        return horner
+    return expr
+
+
+def _power(base, exponent):
+    """Returns base ^ exponent, as a product if that is cheaper."""
+    if exponent == 1:
+        return base
+    if (exponent - 1) * OP_COSTS['*'] < OP_COSTS['^']:
+        return Expr('*', [base] * exponent)
+    return Expr('^', [base, Expr(exponent)])
+
+
+def _horner(polynomial):
+    """
+    Writes a polynomial in multivariate Horner form.
+
+    The terms are split on the generator occurring in most of them: the
+    terms without it, and the others with its lowest power factored out.
+    Both parts are split again until they are constants.  An explicit
+    stack is used since the splits nest as deep as the degree.
+    """
+    generators = polynomial.generators
+    # (key, exponent): the shared Expr of that power
+    powers = {}
+    results = []
+    stack = [(polynomial.terms, None)]
+    while stack:
+        terms, split = stack.pop()
+        if split is not None:
+            key, exponent = split
+            factored = results.pop()
+            rest = results.pop()
+            power = powers.get(split)
+            if power is None:
+                power = _power(generators[key], exponent)
+                powers[split] = power
+            if not factored.operands and factored.value == 1:
+                product = power
+            else:
+                product = Expr('*', [power, factored])
+            if not rest.operands and rest.value == 0:
+                results.append(product)
+            else:
+                results.append(Expr('+', [rest, product]))
+            continue
+
+        counts = {}
+        for monomial in terms:
+            for key, _ in monomial:
+                counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            results.append(Expr(terms.get((), 0)))
+            continue
+        key = max(sorted(counts), key=lambda key: counts[key])
+        exponent = min([dict(monomial)[key] for monomial in terms
+            if key in dict(monomial)])
+        with_key = {}
+        without_key = {}
+        for monomial, coefficient in terms.items():
+            exponents = dict(monomial)
+            if key not in exponents:
+                without_key[monomial] = coefficient
+                continue
+            if exponents[key] == exponent:
+                del exponents[key]
+            else:
+                exponents[key] -= exponent
+            with_key[tuple(sorted(exponents.items()))] = coefficient
+        stack.append((None, (key, exponent)))
+        stack.append((with_key, None))
+        stack.append((without_key, None))
+    return results[0]
@@ -0,0 +1,159 @@
+"""Incremental re-evaluation of expressions."""
+
+import heapq
+from functools import reduce
+from .expr import *
+
+# Wider nodes of associative operators are evaluated through a tree of
+# partial results with at most this many operands each
+MAX_ARITY = 8
+
+
+class IncrementalEvaluator():
+    """
+    Evaluates an expression and updates its value as bindings change.
+
+    The value of every node is cached, and each symbol is indexed to the
+    terminals it occurs in.  When a symbol is rebound, only the nodes on the
+    paths from those terminals to the root are recomputed, and propagation
+    stops early at nodes whose value didn't change.  Sums and products with
+    more than MAX_ARITY operands, as the parser makes them, are split into a
+    balanced tree of partial results, so rebinding a symbol recomputes a
+    logarithmic number of partials instead of the whole operand list.
+
+    Parameters:
+    expr: (Expr object) - the expression to evaluate
+    bindings: (dict) - maps symbol names (or Symbol objects) to their
+        initial values.  Every symbol in the expression must be bound.
+    """
+
+    def __init__(self, expr, bindings):
+        # Nodes are numbered in postorder, so operands always have smaller
+        # indices than the node using them.
+        self._ops = []
+        self._operands = []
+        self._parents = []
+        self._values = []
+        self._symbol_nodes = {}
+
+        bindings = _by_name(bindings)
+        indices = []
+        stack = [(expr, False)]
+        while stack:
+            node, visited = stack.pop()
+            if node.operands and not visited:
+                stack.append((node, True))
+                for operand in reversed(node.operands):
+                    stack.append((operand, False))
+                continue
+            if node.operands:
+                operands = indices[len(indices) - len(node.operands):]
+                del indices[len(indices) - len(node.operands):]
+                if node.value in ASSOCIATIVE_OPS:
+                    while len(operands) > MAX_ARITY:
+                        operands = [self._add_operator(node.value,
+                            operands[start:start + MAX_ARITY])
+                            for start in range(0, len(operands), MAX_ARITY)]
+                indices.append(self._add_operator(node.value, operands))
+                continue
+            index = len(self._ops)
+            self._ops.append(None)
+            self._operands.append(None)
+            if isinstance(node.value, Symbol):
+                name = node.value.symbol_name
+                if name not in bindings:
+                    raise ExprException('No value for symbol %s' % name)
+                self._symbol_nodes.setdefault(name, []).append(index)
+                self._values.append(bindings[name])
+            else:
+                self._values.append(node.value)
+            self._parents.append(None)
+            indices.append(index)
+
+    @property
+    def value(self):
+        """The current value of the expression."""
+        return self._values[-1]
+
+    @property
+    def symbols(self):
+        """The names of the symbols the expression depends on."""
+        return set(self._symbol_nodes)
+
+    def update(self, symbol, value):
+        """
+        Rebinds a symbol and returns the new value of the expression.
+
+        symbol: (Symbol object or string) - the symbol to rebind
+        value: the new value of the symbol
+        """
+        return self.update_many({symbol: value})
+
+    def update_many(self, bindings):
+        """
+        Rebinds several symbols and returns the new value of the expression.
+
+        Nodes depending on more than one of the symbols are still only
+        recomputed once.  If computing a node raises, like for a division
+        by zero, every value is restored and the evaluator is left as it
+        was before the call.
+
+        bindings: (dict) - maps symbol names (or Symbol objects) to values
+        """
+        bindings = _by_name(bindings)
+        for name in bindings:
+            if name not in self._symbol_nodes:
+                raise ExprException('Symbol %s is not in the expression'
+                        % name)
+        dirty = []
+        queued = set()
+        # (index, old value) of every value overwritten, for undoing them
+        changes = []
+        try:
+            for name, value in bindings.items():
+                for index in self._symbol_nodes[name]:
+                    if self._values[index] == value:
+                        continue
+                    changes.append((index, self._values[index]))
+                    self._values[index] = value
+                    self._queue_parent(index, dirty, queued)
+
+            # Smallest index first, so a node's operands are up to date
+            while dirty:
+                index = heapq.heappop(dirty)
+                value = reduce(OP_FUNCS[self._ops[index]],
+                        [self._values[operand]
+                            for operand in self._operands[index]])
+                if value == self._values[index]:
+                    continue
+                changes.append((index, self._values[index]))
+                self._values[index] = value
+                self._queue_parent(index, dirty, queued)
+        except Exception:
+            for index, value in reversed(changes):
+                self._values[index] = value
+            raise
+        return self.value
+
+    def _add_operator(self, op, operands):
+        """Appends a node applying op to the given nodes, returns its index."""
+        index = len(self._ops)
+        for operand in operands:
+            self._parents[operand] = index
+        self._ops.append(op)
+        self._operands.append(operands)
+        self._values.append(reduce(OP_FUNCS[op],
+            [self._values[operand] for operand in operands]))
+        self._parents.append(None)
+        return index
+
+    def _queue_parent(self, index, dirty, queued):
+        parent = self._parents[index]
+        if parent is not None and parent not in queued:
+            queued.add(parent)
+            heapq.heappush(dirty, parent)
+
+
+def _by_name(bindings):
+    return {symbol.symbol_name if isinstance(symbol, Symbol) else symbol:
+            value for symbol, value in bindings.items()}
@@ -0,0 +1,148 @@
+"""
+Opt-in counters and timers for seeing what the library is doing.
+
+Instrumentation is off by default.  Instrumented functions read ENABLED once
+per call and skip all bookkeeping while it is False, so the cost when off is
+a flag check per call.  Turn it on with enable(), or for a block of code with
+capture():
+
+    with instrument.capture() as stats:
+        Parser.parse('x + y * 2')
+    stats['counters']['Parser.parse.nodes']   # 5
+
+Counters:
+Expr.nodes: Expr objects built, by the constructor or internally
+ExprPool.nodes: new nodes made by an ExprPool
+Parser.parse.nodes: Expr objects built while parsing
+visits.<operator name>: operator nodes walked by flatten_expr, substitute and
+    substitute_many, by the names in OP_NAMES
+
+Timers count the calls and total seconds spent in Parser.parse, flatten_expr
+and the functions of operations.
+"""
+
+import functools
+import time
+from contextlib import contextmanager
+from .constants import OP_NAMES
+
+ENABLED = False
+
+_counters = {}
+# name: [number of calls, total seconds]
+_timers = {}
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    """Clears all counters and timers."""
+    _counters.clear()
+    _timers.clear()
+
+
+def count(name, amount=1):
+    _counters[name] = _counters.get(name, 0) + amount
+
+
+def counter(name):
+    """Returns the current value of a counter."""
+    return _counters.get(name, 0)
+
+
+def count_visits(visits):
+    """
+    Adds the operator visits tallied by one traversal.
+
+    visits: (dict) - maps operators in OPS to the number of nodes visited
+    """
+    for op, amount in visits.items():
+        count('visits.' + OP_NAMES[op], amount)
+
+
+def record_time(name, seconds):
+    timer = _timers.get(name)
+    if timer is None:
+        timer = _timers[name] = [0, 0.0]
+    timer[0] += 1
+    timer[1] += seconds
+
+
+def timed(name):
+    """
+    Decorator that records the calls and running time of a function.
+
+    name: (string) - the name of the timer
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Returns the counters and timers as a plain dict.
+
+    Returns:
+    stats: (dict) - {'counters': {name: count}, 'timers': {name: {'calls':
+        number of calls, 'seconds': total seconds}}}
+    """
+    return {
+        'counters': dict(_counters),
+        'timers': {name: {'calls': calls, 'seconds': seconds}
+            for name, (calls, seconds) in _timers.items()},
+    }
+
+
+@contextmanager
+def capture():
+    """
+    Enables instrumentation for a block and collects what happened in it.
+
+    Yields a dict that is filled in when the block exits, in the format of
+    snapshot() but only with what changed during the block.  Captures can be
+    nested, and the previous ENABLED setting is restored afterwards.
+    """
+    global ENABLED
+    was_enabled = ENABLED
+    before = snapshot()
+    stats = {}
+    ENABLED = True
+    try:
+        yield stats
+    finally:
+        ENABLED = was_enabled
+        stats.update(_difference(snapshot(), before))
+
+
+def _difference(after, before):
+    counters = {}
+    for name, value in after['counters'].items():
+        value -= before['counters'].get(name, 0)
+        if value:
+            counters[name] = value
+    timers = {}
+    for name, timer in after['timers'].items():
+        previous = before['timers'].get(name, {'calls': 0, 'seconds': 0.0})
+        calls = timer['calls'] - previous['calls']
+        if calls:
+            timers[name] = {'calls': calls,
+                    'seconds': timer['seconds'] - previous['seconds']}
+    return {'counters': counters, 'timers': timers}
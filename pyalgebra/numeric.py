@@ -0,0 +1,89 @@
+"""Vectorized numeric evaluation of expressions.  Requires NumPy."""
+
+import numpy as np
+from .expr import *
+
+# NumPy ufuncs for the operators in OPS.  Operators missing from this table
+# fall back to OP_FUNCS, which NumPy arrays also support.
+_UFUNCS = {
+    '+': np.add,
+    '*': np.multiply,
+    '^': np.power,
+    '/': np.true_divide,
+}
+
+
+def evaluate_array(expr, bindings, dtype=np.float64):
+    """
+    Evaluates an expression over arrays of symbol values.
+
+    Every node is computed with whole-array NumPy operations, one per
+    operand, rather than a Python call per element.  Bound values are
+    broadcast against each other, so scalars can be mixed with arrays.
+
+    Parameters:
+    expr: (Expr object) - the expression to evaluate
+    bindings: (dict) - maps symbol names (or Symbol objects) to arrays or
+        scalars.  Every symbol in the expression must be bound.
+    dtype: (NumPy dtype) - the type to compute in
+
+    Returns:
+    result: (NumPy array) - the value of the expression, with the broadcast
+        shape of the bound values
+    """
+    values = {}
+    for symbol, value in bindings.items():
+        if isinstance(symbol, Symbol):
+            symbol = symbol.symbol_name
+        values[symbol] = np.asarray(value, dtype=dtype)
+
+    # Each result is stored with a flag saying whether it is a temporary that
+    # can be overwritten, which lets operators reuse buffers instead of
+    # allocating a new array per operand.
+    results = []
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not node.operands:
+            if isinstance(node.value, Symbol):
+                name = node.value.symbol_name
+                if name not in values:
+                    raise ExprException('No value for symbol %s' % name)
+                results.append((values[name], False))
+            else:
+                results.append((np.asarray(node.value, dtype=dtype), False))
+        elif visited:
+            operands = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            results.append(_apply_operator(node.value, operands))
+        else:
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    return results[0][0]
+
+
+def _apply_operator(op, operands):
+    """Folds op over (array, is_temporary) pairs from the left."""
+    ufunc = _UFUNCS.get(op)
+    result, is_temporary = operands[0]
+    for operand, operand_is_temporary in operands[1:]:
+        if ufunc is None:
+            result = OP_FUNCS[op](result, operand)
+        elif is_temporary and _can_hold(result, operand):
+            ufunc(result, operand, out=result)
+        elif operand_is_temporary and _can_hold(operand, result):
+            ufunc(result, operand, out=operand)
+            result = operand
+        else:
+            result = ufunc(result, operand)
+        is_temporary = True
+    return result, is_temporary
+
+
+def _can_hold(out, other):
+    """Whether out can store the broadcast result of an op on out and other."""
+    # Ufuncs on 0-d inputs return NumPy scalars, which can't be an out
+    return (isinstance(out, np.ndarray) and np.ndim(other) <= out.ndim and
+            np.broadcast_shapes(out.shape, np.shape(other)) == out.shape and
+            np.result_type(out, other) == out.dtype)
@@ -1,12 +1,20 @@
 """Operations that can be used on expressions."""
 
 from .expr import *
+from .polynomial import Polynomial, _exact_power
+from . import instrument
 
 
+@instrument.timed('simplify')
 def simplify(expr):
     """
     Simplifies an expression by combining operands of the same type.
 
+    The expression is expanded into a sparse polynomial, where like terms
+    are combined as they are added, and converted back.  Subexpressions that
+    aren't polynomials, like x / y, are simplified inside and otherwise kept
+    as they are.
+
     Does not modify the expression passed in.
     Returns a new expression instead.
 
@@ -16,15 +24,42 @@ def simplify(expr):
     Returns:
     new_expr: (Expr object) - the simplified expression
     """
-    pass
+    return expand(expr)
+
+
+@instrument.timed('expand')
+def expand(expr):
+    """
+    Multiplies out products and natural powers of sums.
+
+    The expression is converted to a polynomial and back.  Products of
+    polynomials in one symbol with mostly nonzero coefficients are computed
+    on coefficient lists, with Karatsuba multiplication for long ones, and
+    other products term by term on sparse dictionaries.  Natural powers are
+    computed by repeated squaring, so (x + y + 1) ^ 50 takes 6 products
+    rather than 49.  Coefficients stay exact for ints and Fractions.
+
+    Does not modify the expression passed in.
+
+    Parameters:
+    expr: (Expr object) - the expression to expand, built from any of OPS.
+        Subexpressions that aren't polynomials, like x / y or 2 ^ x, are
+        expanded inside and otherwise kept as they are.
+
+    Returns:
+    new_expr: (Expr object) - the expanded expression
+    """
+    return Polynomial.from_expr(expr).to_expr()
 
 
+@instrument.timed('substitute')
 def substitute(expr, var, new_var):
     """
     Substitutes a new number, variable, or expr in the expression.
 
     This does not simplify the expression.  It simply replaces all occurences
     of var with new_var.  It returns a new expression and does not modify expr.
+    Subtrees that don't contain var are shared with expr instead of copied.
 
     Parameters:
     expr: (Expr object) - the expression to substitute new_var in 
@@ -48,23 +83,209 @@ def substitute(expr, var, new_var):
     return _substitute_helper(expr, var, new_var)
 
 
+@instrument.timed('substitute_many')
+def substitute_many(expr, substitutions):
+    """
+    Substitutes several variables at once.
+
+    Works like substitute, but replaces every variable in substitutions in
+    a single pass.  Only the nodes on paths to a replaced variable are
+    copied: unchanged subtrees of expr are reused in the result as they are,
+    and expr itself is returned if nothing was replaced.  Don't modify the
+    result in place if expr is still used.
+
+    Parameters:
+    expr: (Expr object) - the expression to substitute in
+    substitutions: (dict) - maps the variables to replace (Symbol objects or
+        string names) to what to replace them with (a number, Symbol object,
+        string name for Symbol, Expr object)
+
+    Returns:
+    new_expr: (Expr object) - the result of performing the substitutions on
+        the given expr
+    """
+    replacements = {}
+    for var, new_var in substitutions.items():
+        if not isinstance(var, Symbol):
+            var = Symbol(var)
+        if not isinstance(new_var, (Number, Symbol, Expr)):
+            new_var = Symbol(new_var)
+        if not isinstance(new_var, Expr):
+            new_var = Expr(new_var)
+        replacements[var] = new_var
+    variables = frozenset(replacements)
+
+    visits = {} if instrument.ENABLED else None
+    results = []
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not visited and node.free_symbols.isdisjoint(variables):
+            results.append(node)
+        elif not node.operands:
+            results.append(replacements[node.value])
+        elif visited:
+            operands = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            if all([new_operand is operand for new_operand, operand
+                    in zip(operands, node.operands)]):
+                results.append(node)
+            else:
+                results.append(Expr._new_sorted(node.value, operands))
+        else:
+            if visits is not None:
+                visits[node.value] = visits.get(node.value, 0) + 1
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    if visits:
+        instrument.count_visits(visits)
+    return results[0]
+
+
 def _substitute_helper(expr, var, new_var_expr):
     """
     Helper method for substitute.
 
+    Walks expr in postorder with an explicit stack, so deep expressions
+    don't hit the recursion limit.  Subtrees that don't contain var, going
+    by their cached free_symbols, are reused without being walked.
+
     Parameters:
     expr: (Expr object) - the expression to subtitute new_expr in
     var: (Symbol object or string) - the string name or symbol to replace
     new_var_expr: (Expr object) - the expression that will replace ones
         that have var as the value
     """
-    if not expr.operands and expr.value == var:
-        return new_var_expr
-    operands = [_substitute_helper(operand, var, new_var_expr)
-        for operand in expr.operands]
-    return Expr(expr.value, operands)
+    visits = {} if instrument.ENABLED else None
+    results = []
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not visited and var not in node.free_symbols:
+            results.append(node)
+        elif not node.operands:
+            results.append(new_var_expr)
+        elif visited:
+            operands = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            results.append(Expr._new_sorted(node.value, operands))
+        else:
+            if visits is not None:
+                visits[node.value] = visits.get(node.value, 0) + 1
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    if visits:
+        instrument.count_visits(visits)
+    return results[0]
+
+
+@instrument.timed('fold_constants')
+def fold_constants(expr):
+    """
+    Evaluates the purely numeric parts of an expression.
+
+    Subtrees with only numbers are replaced by their value.  The numbers
+    among the operands of '+' and '*' are combined into one, and for '/' and
+    '^', which apply from the left, the leading run of numbers is folded.
+    Arithmetic on ints and Fractions is exact, so 1 / 3 becomes
+    Fraction(1, 3), and folds without an exact real value, like 1 / 0 or
+    2 ^ (1 / 2), are left as they are.  Numbers that are already floats are
+    folded with float arithmetic.
+
+    Like substitute_many, only changed nodes are copied and expr itself is
+    returned if nothing could be folded.
+
+    Parameters:
+    expr: (Expr object) - the expression to fold
+
+    Returns:
+    new_expr: (Expr object) - the folded expression
+    """
+    results = []
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not node.operands:
+            results.append(node)
+        elif visited:
+            operands = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            folded = _fold_operands(node.value, operands)
+            if folded is None:
+                if all([new_operand is operand for new_operand, operand
+                        in zip(operands, node.operands)]):
+                    results.append(node)
+                else:
+                    results.append(Expr._new_sorted(node.value, operands))
+            elif len(folded) == 1:
+                results.append(folded[0])
+            else:
+                results.append(Expr._new_sorted(node.value, folded))
+        else:
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+    return results[0]
+
+
+def _fold_operands(op, operands):
+    """Returns the operands of op with their numbers folded, or None."""
+    is_number = [not operand.operands and
+            not isinstance(operand.value, Symbol) for operand in operands]
+    if op in ASSOCIATIVE_OPS and op in COMMUTATIVE_OPS:
+        positions = [index for index, number in enumerate(is_number)
+                if number]
+    else:
+        positions = []
+        while (len(positions) < len(operands) and
+                is_number[len(positions)]):
+            positions.append(len(positions))
+    if len(positions) < 2:
+        return None
+    value = fold_numbers(op, [operands[index].value for index in positions])
+    if value is None:
+        return None
+    folded = list(operands)
+    folded[positions[0]] = Expr(value)
+    for index in reversed(positions[1:]):
+        del folded[index]
+    return folded
+
+
+def fold_numbers(op, values):
+    """
+    Applies op to numbers from the left, exactly where possible.
+
+    Parameters:
+    op: (string) - an operator in OPS
+    values: (list of numbers) - the operands
+
+    Returns:
+    value: (number) - the result, or None if it has no exact real value or
+        can't be computed, like for division by zero
+    """
+    exact = all([isinstance(value, (int, Fraction)) for value in values])
+    result = values[0]
+    try:
+        for value in values[1:]:
+            if exact and op == '/':
+                result = rational(result, value)
+            elif exact and op == '^':
+                result = _exact_power(result, value)
+                if result is None:
+                    return None
+            else:
+                result = OP_FUNCS[op](result, value)
+    except (ZeroDivisionError, OverflowError):
+        return None
+    if isinstance(result, complex):
+        return None
+    return result
 
 
+@instrument.timed('evalute')
 def evalute(expr, var, new_var):
     """
     Evaluates the expression by replacing the given variable with the new value.
@@ -85,4 +306,4 @@ def evalute(expr, var, new_var):
     new_expr: (Expr object) - a new expression that is the result of evaluating
         the given expr
     """
-    pass
+    return simplify(substitute(expr, var, new_var))
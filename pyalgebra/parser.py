@@ -1,77 +1,254 @@
+import re
+import multiprocessing
+from collections import deque
+from itertools import islice
 from .expr import *
+from .expr import _is_cached, _sort_key
+from .flat import FlatExpr
 from .constants import *
+from . import instrument
+from .operations import fold_constants
+
 
 class Parser():
     """Class that wraps methods related to parsing"""
 
     @classmethod
-    def parse(cls, expr_str):
-        """Parses a string into an Expr object."""
-        expr_str = expr_str.replace(' ', '')
-        expr = cls._parse_helper(expr_str)
-        expr = flatten_expr(expr)
+    @instrument.timed('Parser.parse')
+    def parse(cls, expr_str, fold=False, max_nodes=None, max_depth=None):
+        """
+        Parses a string into an Expr object.
+
+        The result is already flat, see flatten_expr.  Numbers without a
+        decimal point are read as ints, the others as floats.
+
+        The size and depth limits are checked as the tree is built, so an
+        expression over a limit is rejected as soon as the part read so far
+        exceeds it, without reading the rest.  They apply to the flat result
+        before any folding, as measured by expr_stats.
+
+        Parameters:
+        expr_str: (string) - the expression to parse
+        fold: (bool) - whether to evaluate the numeric parts of the
+            expression right away, see fold_constants
+        max_nodes: (int) - if given, raise a ParseLimitException for
+            expressions with more nodes
+        max_depth: (int) - if given, raise a ParseLimitException for
+            expressions with more nodes on a path from the root to a
+            terminal
+        """
+        if max_nodes is not None or max_depth is not None:
+            limits = _Limits(max_nodes, max_depth)
+        else:
+            limits = None
+        if not instrument.ENABLED:
+            expr = cls._parse_helper(expr_str, limits)
+        else:
+            num_nodes = instrument.counter('Expr.nodes')
+            expr = cls._parse_helper(expr_str, limits)
+            instrument.count('Parser.parse.nodes',
+                    instrument.counter('Expr.nodes') - num_nodes)
+        if fold:
+            expr = fold_constants(expr)
         return expr
 
     @classmethod
-    def _parse_helper(cls, expr_str):
+    def parse_many(cls, expr_strs, workers=None, chunksize=256):
+        """
+        Parses many expression strings, yielding the results in input order.
+
+        Results are streamed as a generator.  A string that can't be parsed
+        doesn't stop the batch: its ParseExprException is yielded in place of
+        the Expr object.
+
+        Parameters:
+        expr_strs: (iterable of strings) - the expressions to parse.  It is
+            consumed lazily.
+        workers: (int) - the number of worker processes.  None or 1 parses in
+            this process.
+        chunksize: (int) - the number of strings sent to a worker at once
+
+        Returns:
+        results: (generator of Expr objects or ParseExprExceptions)
+        """
+        if chunksize < 1:
+            raise ValueError('chunksize must be at least 1')
+        if workers is None or workers <= 1:
+            return (_parse_or_error(expr_str) for expr_str in expr_strs)
+        return cls._parse_in_pool(expr_strs, workers, chunksize)
+
+    @classmethod
+    def parse_file(cls, path, workers=None, chunksize=256, encoding=None):
+        """
+        Parses a file with one expression per line.
+
+        Lines are read lazily and at most a few chunks per worker are in
+        flight at once, so memory use doesn't grow with the file size.  Like
+        parse_many, a ParseExprException is yielded for each line that can't
+        be parsed, including blank lines.
+
+        Parameters:
+        path: (string) - the path of the file to read
+        workers, chunksize: see parse_many
+        encoding: (string) - the encoding of the file
+
+        Returns:
+        results: (generator of Expr objects or ParseExprExceptions) - one
+            per line of the file
+        """
+        with open(path, encoding=encoding) as expr_file:
+            lines = (line.rstrip('\r\n') for line in expr_file)
+            yield from cls.parse_many(lines, workers, chunksize)
+
+    @classmethod
+    def _parse_in_pool(cls, expr_strs, workers, chunksize):
+        """Fans parse_many out to a process pool, keeping input order."""
+        expr_strs = iter(expr_strs)
+        pending = deque()
+        with multiprocessing.Pool(workers) as pool:
+            while True:
+                chunk = list(islice(expr_strs, chunksize))
+                if not chunk:
+                    break
+                pending.append(pool.apply_async(_parse_chunk, (chunk,)))
+                # Bound the number of chunks held in memory
+                if len(pending) >= 2 * workers:
+                    yield from _from_chunk(pending.popleft().get())
+            while pending:
+                yield from _from_chunk(pending.popleft().get())
+
+    @classmethod
+    def _parse_helper(cls, expr_str, limits=None):
         """
         Converts expression string to Expr object.
 
-        Uses Djikstra's Shunting Yard algorithm.
+        Uses Djikstra's Shunting Yard algorithm.  Reads the same tokens as
+        tokenize, straight from the regex matches to save a tuple per token.
+
+        limits: (_Limits object) - the limits to enforce, if any
         """
         output = []
         op_stack = []
-        index = 0
-        while index < len(expr_str):
-            if expr_str[index].isalpha():
-                symbol_name = ''
-                while index < len(expr_str) and expr_str[index].isalpha():
-                    symbol_name += expr_str[index]
-                    index += 1
-                output.append(Expr(Symbol(symbol_name)))
-            elif expr_str[index].isdigit() or expr_str[index] == '.':
-                num_string = ''
-                while (index < len(expr_str) and
-                    (expr_str[index].isdigit() or expr_str[index] == '.')):
-                    num_string += expr_str[index]
-                    index += 1
+        needs_flattening = False
+        for match in _TOKEN_REGEX.finditer(expr_str):
+            kind = match.lastindex
+            if limits is not None and kind <= NUMBER_TOKEN:
+                limits.add_terminal()
+            if kind == SYMBOL_TOKEN:
+                output.append(Expr._new(Symbol(match.group(kind)), []))
+            elif kind == NUMBER_TOKEN:
+                num_string = match.group(kind)
                 try:
-                    number = float(num_string)
-                    output.append(Expr(number))
+                    if '.' in num_string:
+                        number = float(num_string)
+                    else:
+                        number = int(num_string)
                 except ValueError:
                     raise ParseExprException('Invalid number %s' % num_string)
-            elif expr_str[index] == '(':
-                op_stack.append(expr_str[index])
-                index += 1
-            elif expr_str[index] == ')':
+                output.append(Expr._new(number, []))
+            elif kind == OP_TOKEN:
+                new_op = match.group(kind)
+                precedence = OP_PRECEDENCES[new_op]
+                while (op_stack and
+                        precedence <= OP_PRECEDENCES[op_stack[-1]]):
+                    needs_flattening |= cls._pop_oper(output, op_stack,
+                            limits)
+                op_stack.append(new_op)
+            elif kind == LPAREN_TOKEN:
+                op_stack.append('(')
+            elif kind == RPAREN_TOKEN:
                 while op_stack and op_stack[-1] != '(':
-                    cls._pop_oper(output, op_stack)
+                    needs_flattening |= cls._pop_oper(output, op_stack,
+                            limits)
                 if not op_stack:
                     raise ParseExprException('Mismatched parentheses')
                 op_stack.pop() # pop the '('
-                index += 1
-            elif expr_str[index] in OPS:
-                new_op = expr_str[index]
-                while (op_stack and
-                    OP_PRECEDENCES[new_op] <= OP_PRECEDENCES[op_stack[-1]]):
-                        cls._pop_oper(output, op_stack)
-                op_stack.append(new_op)
-                index += 1
+            else:
+                raise ParseExprException('Invalid character %r at position %d'
+                        % (match.group(kind), match.start(kind)))
         while op_stack:
             if op_stack[-1] == '(':
                 raise ParseExprException('Mismatched parentheses')
-            cls._pop_oper(output, op_stack)
+            needs_flattening |= cls._pop_oper(output, op_stack, limits)
+        if not output:
+            raise ParseExprException('Empty expression')
         if len(output) > 1:
             raise ParseExprException('Malformed expression')
+        if limits is not None:
+            limits.finish()
+        if needs_flattening:
+            return flatten_expr(output[0])
+        _sort_tree(output[0])
         return output[0]
 
     @classmethod
-    def _pop_oper(cls, output, op_stack):
-        """Pops an op off the stack and applies it to the operands in the output"""
+    def _pop_oper(cls, output, op_stack, limits=None):
+        """
+        Pops an op off the stack and applies it to the operands in the output
+
+        A first operand with the same op is extended in place instead of
+        nested, the same way flatten_expr would merge it, so chains like
+        x + y + z are built flat.  All nodes in the output are owned by the
+        parser, so they can be modified.
+
+        Returns True if the new node still needs flattening, which only
+        happens for parenthesized operands like x + (y + z).
+        """
         op = op_stack.pop()
+        if len(output) < 2:
+            raise ParseExprException('Malformed expression')
         operand2 = output.pop()
-        operand1 = output.pop()
-        output.append(Expr(op, [operand1, operand2]))
+        operand1 = output[-1]
+        needs_flattening = op in ASSOCIATIVE_OPS and operand2.value == op
+        if operand1.value == op:
+            operand1.operands.append(operand2)
+            if limits is not None:
+                limits.extend_operator(needs_flattening)
+        else:
+            output[-1] = Expr._new(op, [operand1, operand2])
+            if limits is not None:
+                limits.add_operator(needs_flattening, op in ASSOCIATIVE_OPS)
+        return needs_flattening
+
+# Token kinds yielded by tokenize.  They double as the group numbers of the
+# token regex below.
+SYMBOL_TOKEN = 1
+NUMBER_TOKEN = 2
+OP_TOKEN = 3
+LPAREN_TOKEN = 4
+RPAREN_TOKEN = 5
+_INVALID_TOKEN = 6
+
+# Leading whitespace is consumed as part of each token, so spaces never need
+# a match of their own.
+_TOKEN_REGEX = re.compile(r"""\s*(?:
+    ([^\W\d_]+)
+    | ([\d.]+)
+    | (%s)
+    | (\()
+    | (\))
+    | (\S)
+)""" % '|'.join(re.escape(op) for op in OPS), re.VERBOSE)
+
+
+def tokenize(expr_str):
+    """
+    Splits an expression string into tokens in a single pass.
+
+    Yields (kind, start, end) tuples, where kind is one of SYMBOL_TOKEN,
+    NUMBER_TOKEN, OP_TOKEN, LPAREN_TOKEN and RPAREN_TOKEN, and
+    expr_str[start:end] is the text of the token.  Whitespace is skipped
+    without copying the string.
+
+    expr_str: (string) - the expression string to tokenize
+    """
+    for match in _TOKEN_REGEX.finditer(expr_str):
+        kind = match.lastindex
+        start, end = match.span(kind)
+        if kind == _INVALID_TOKEN:
+            raise ParseExprException('Invalid character %r at position %d'
+                    % (expr_str[start], start))
+        yield kind, start, end
 
 
 class ParseExprException(Exception):
@@ -79,6 +256,126 @@ class ParseExprException(Exception):
     pass
 
 
+class ParseLimitException(ParseExprException):
+    """Thrown when an expression exceeds the limits passed to Parser.parse."""
+    pass
+
+
+class _Limits():
+    """
+    Tracks the size and depth of the output of the parser as it is built.
+
+    depths runs parallel to the parser's output stack, with the depth of
+    each tree on it once flattened.  The count of nodes never exceeds the
+    size of the flat result, so no expression within the limits is
+    rejected: a new sum or product, which flattening merges into a parent
+    with the same operator, isn't counted until it becomes an operand and
+    is known to stay.  pending runs parallel to depths and marks the trees
+    whose root is still uncounted.
+    """
+
+    def __init__(self, max_nodes, max_depth):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.num_nodes = 0
+        self.depths = []
+        self.pending = []
+
+    def add_terminal(self):
+        self.depths.append(1)
+        self.pending.append(False)
+        self._add_nodes(1)
+        self._check_depth(1)
+
+    def add_operator(self, merged, mergeable):
+        """
+        A new node with the top two trees of the output as operands.
+
+        merged says whether the second operand will be merged into the new
+        node by flattening, which removes it and lifts its operands.
+        mergeable says whether the new node could be merged in turn, in
+        which case it is counted once that is decided.
+        """
+        depth = self._pop_operand(merged)
+        # The first operand stays a node of its own
+        count = self.pending[-1] + (not mergeable)
+        self.pending[-1] = mergeable
+        depth = max(self.depths[-1], depth) + 1
+        self.depths[-1] = depth
+        self._add_nodes(count)
+        self._check_depth(depth)
+
+    def extend_operator(self, merged):
+        """The top tree of the output added to the operator below it."""
+        # The operator below can still be merged as it was
+        depth = self._pop_operand(merged)
+        if depth + 1 > self.depths[-1]:
+            self.depths[-1] = depth + 1
+            self._check_depth(depth + 1)
+
+    def finish(self):
+        """The parser is done, so the root stays."""
+        if self.pending and self.pending[-1]:
+            self.pending[-1] = False
+            self._add_nodes(1)
+
+    def _pop_operand(self, merged):
+        """Pops the second operand and returns its depth once merged."""
+        depth = self.depths.pop()
+        pending = self.pending.pop()
+        if merged:
+            if not pending:
+                self.num_nodes -= 1
+            return depth - 1
+        if pending:
+            self._add_nodes(1)
+        return depth
+
+    def _add_nodes(self, count):
+        self.num_nodes += count
+        if self.max_nodes is not None and self.num_nodes > self.max_nodes:
+            raise ParseLimitException('Expression has more than %d nodes'
+                    % self.max_nodes)
+
+    def _check_depth(self, depth):
+        if self.max_depth is not None and depth > self.max_depth:
+            raise ParseLimitException('Expression is deeper than %d levels'
+                    % self.max_depth)
+
+
+def _parse_or_error(expr_str):
+    try:
+        return Parser.parse(expr_str)
+    except ParseExprException as exception:
+        return exception
+
+
+def _parse_chunk(expr_strs):
+    """
+    Runs in a worker process of Parser.parse_many.
+
+    Expressions are sent back as FlatExprs, since pickling an Expr recurses
+    once per level and fails on deeply nested ones.
+    """
+    results = []
+    for expr_str in expr_strs:
+        result = _parse_or_error(expr_str)
+        if isinstance(result, Expr):
+            result = FlatExpr.from_expr(result)
+        results.append(result)
+    return results
+
+
+def _from_chunk(results):
+    """Converts the results of _parse_chunk back to Expr objects."""
+    for result in results:
+        if isinstance(result, FlatExpr):
+            # The parser left the operands in canonical order
+            result = result.to_expr(sort=False)
+        yield result
+
+
+@instrument.timed('flatten_expr')
 def flatten_expr(expr):
     """
     Flattens an Expr object.
@@ -86,14 +383,85 @@ def flatten_expr(expr):
     At the end of this there should be no operators that have the same
     operator as a child.  For example no '+' should have a '+' as a child.
 
+    Operators in ASSOCIATIVE_OPS absorb every operand with the same operator.
+    The other operators are applied from the left when they have several
+    operands, x / y / z meaning (x / y) / z, so only a first operand with the
+    same operator is absorbed and x / (y / z) is left as it is.  The nodes
+    are walked with an explicit stack and each operand list is rebuilt once,
+    so this takes linear time.  The operands of commutative operators are
+    put back in canonical order afterwards.
+
+    Interned nodes are immutable and may be shared with other expressions,
+    so they are copied rather than modified.  Use the return value in case
+    expr itself was one of them.
+
     expr: (Expr object) - the expression to flatten
+
+    Returns:
+    expr: (Expr object) - the flattened expression
     """
-    # TODO(smilli): Still need to implement this for '/', '^'
-    if not expr.operands:
-        return expr
-    for index, operand in enumerate(expr.operands):
-        operand = flatten_expr(operand)
-        if operand.value == expr.value:
-            expr.operands.remove(operand)
-            expr.add_operands(operand.operands)
+    visits = {} if instrument.ENABLED else None
+    expr = _own_copy(expr)
+    nodes = []
+    # Whether a node with cached values was changed
+    invalidate = False
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if not node.operands:
+            continue
+        nodes.append(node)
+        if visits is not None:
+            visits[node.value] = visits.get(node.value, 0) + 1
+        associative = node.value in ASSOCIATIVE_OPS
+        # Collect the operands of the whole run of nodes with the same
+        # operator below this one.  Every node is either absorbed here or
+        # kept as an operand and flattened later, so each is seen once.
+        operands = []
+        pending = list(reversed(node.operands))
+        while pending:
+            operand = pending.pop()
+            if operand.value == node.value and (associative or not operands):
+                pending.extend(reversed(operand.operands))
+                invalidate = invalidate or _is_cached(node)
+            else:
+                operands.append(_own_copy(operand))
+        node.operands = operands
+        stack.extend(operands)
+    if visits:
+        instrument.count_visits(visits)
+    if invalidate:
+        Expr._mutations += 1
+    _sort_nodes(nodes)
     return expr
+
+
+def _own_copy(node):
+    """Returns a plain copy of an interned operator node, else the node."""
+    if isinstance(node, InternedExpr) and node.operands:
+        return Expr._new(node.value, list(node.operands))
+    return node
+
+
+def _sort_tree(expr):
+    """Puts the operands of every commutative node in canonical order."""
+    nodes = []
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node.operands:
+            nodes.append(node)
+            stack.extend(node.operands)
+    _sort_nodes(nodes)
+
+
+def _sort_nodes(nodes):
+    """
+    Sorts the operands of nodes, listed with parents before their operands.
+
+    They are sorted from the bottom up, since the order of an operand list
+    depends on the hashes of the operands, which depend on their own order.
+    """
+    for node in reversed(nodes):
+        if node.value in COMMUTATIVE_OPS:
+            node.operands.sort(key=_sort_key)
@@ -0,0 +1,477 @@
+"""Sparse polynomial representation of expressions."""
+
+from .expr import *
+
+# Dense univariate products switch from schoolbook multiplication to
+# Karatsuba once both factors have at least this many coefficients.
+KARATSUBA_THRESHOLD = 32
+
+
+class Polynomial():
+    """
+    A sparse polynomial over symbols and opaque subexpressions.
+
+    terms maps monomials to their nonzero coefficients.  A monomial is a
+    tuple of (generator key, exponent) pairs sorted by key, so like terms
+    always share the same dictionary entry.  A generator is either a Symbol
+    or a subexpression that isn't a polynomial, like x / y or 2 ^ x;
+    generators maps each key back to the Expr it stands for.
+
+    Parameters:
+    terms: (dict) - maps monomials to coefficients
+    generators: (dict) - maps generator keys to Expr objects
+    """
+
+    def __init__(self, terms=None, generators=None):
+        self.terms = terms if terms is not None else {}
+        self.generators = generators if generators is not None else {}
+
+    @classmethod
+    def constant(cls, value):
+        return cls({(): value} if value != 0 else {})
+
+    @classmethod
+    def generator(cls, expr):
+        """Returns the polynomial consisting of just the generator expr."""
+        if isinstance(expr.value, Symbol):
+            key = (0, expr.value.symbol_name)
+        else:
+            key = (1, _ExprKey(expr))
+        return cls({((key, 1),): 1}, {key: expr})
+
+    @classmethod
+    def from_expr(cls, expr):
+        """
+        Converts an Expr object to a Polynomial in one postorder pass.
+
+        Sums, products, division by numbers and powers with non-negative
+        integer exponents are expanded.  Any other subexpression is kept as a
+        generator, with its operands converted first.
+
+        expr: (Expr object) - the expression to convert
+        """
+        # Polynomials are never modified once built, so terminals that occur
+        # more than once can share theirs.
+        terminals = {}
+        results = []
+        stack = [(expr, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not node.operands:
+                key = (type(node.value), node.value)
+                polynomial = terminals.get(key)
+                if polynomial is None:
+                    if isinstance(node.value, Symbol):
+                        polynomial = cls.generator(node)
+                    else:
+                        polynomial = cls.constant(node.value)
+                    terminals[key] = polynomial
+                results.append(polynomial)
+            elif visited:
+                operands = results[len(results) - len(node.operands):]
+                del results[len(results) - len(node.operands):]
+                results.append(_OPERATORS[node.value](operands))
+            else:
+                stack.append((node, True))
+                for operand in reversed(node.operands):
+                    stack.append((operand, False))
+        return results[0]
+
+    def to_expr(self):
+        """
+        Converts this to an Expr object.
+
+        Coefficients and exponents of 1 are left out.  The terms end up in
+        the canonical order of Expr.
+        """
+        if not self.terms:
+            return Expr(0)
+        summands = []
+        for monomial in self.terms:
+            coefficient = self.terms[monomial]
+            factors = []
+            if coefficient != 1 or not monomial:
+                factors.append(Expr(coefficient))
+            for key, exponent in monomial:
+                base = self.generators[key]
+                if exponent == 1:
+                    factors.append(base)
+                else:
+                    factors.append(Expr('^', [base, Expr(exponent)]))
+            if len(factors) == 1:
+                summands.append(factors[0])
+            else:
+                summands.append(Expr('*', factors))
+        if len(summands) == 1:
+            return summands[0]
+        return Expr('+', summands)
+
+    def constant_value(self):
+        """Returns the value if this is a constant, otherwise None."""
+        if not self.terms:
+            return 0
+        if len(self.terms) == 1 and () in self.terms:
+            return self.terms[()]
+        return None
+
+    def __add__(self, other):
+        return _sum([self, other])
+
+    def __mul__(self, other):
+        if other.constant_value() is not None:
+            return self._scale(other.constant_value())
+        if self.constant_value() is not None:
+            return other._scale(self.constant_value())
+        degrees = _degrees([self.terms, other.terms])
+        if len(degrees) == 1 and _is_dense(self.terms) and _is_dense(
+                other.terms):
+            terms = _multiply_dense(self.terms, other.terms)
+        else:
+            terms = _multiply_sparse(self.terms, other.terms, degrees)
+        return Polynomial(_drop_zeros(terms),
+                _merge_generators([self, other]))
+
+    def _scale(self, factor):
+        if factor == 1:
+            return self
+        return Polynomial(_drop_zeros({monomial: coefficient * factor
+            for monomial, coefficient in self.terms.items()}),
+            self.generators)
+
+    def __pow__(self, exponent):
+        """Raises this to a non-negative integer power by repeated squaring."""
+        result = Polynomial.constant(1)
+        base = self
+        while exponent:
+            if exponent & 1:
+                result = result * base
+            exponent >>= 1
+            if exponent:
+                base = base * base
+        return result
+
+    def __eq__(self, other):
+        return isinstance(other, Polynomial) and self.terms == other.terms
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'Polynomial(%r)' % self.to_expr()
+
+
+class _ExprKey():
+    """
+    Identifies a subexpression used as a generator.
+
+    Compares by the cached structural hash of the expression, and only walks
+    it when the hashes are equal, so making a key and looking it up doesn't
+    depend on the size of the expression.  Keys are ordered by hash, which
+    is the same in every process, so monomials sort the same way each run.
+    """
+
+    __slots__ = ('expr', 'hash')
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.hash = hash(expr)
+
+    def __eq__(self, other):
+        return self is other or (self.hash == other.hash and
+                self.expr == other.expr)
+
+    def __hash__(self):
+        return self.hash
+
+    def __lt__(self, other):
+        if self.hash != other.hash:
+            return self.hash < other.hash
+        # Only for unequal expressions with the same hash
+        return repr(self.expr) < repr(other.expr)
+
+
+def _sum(polynomials):
+    """Adds polynomials, combining like terms in a single dictionary."""
+    terms = {}
+    try:
+        for polynomial in polynomials:
+            for monomial, coefficient in polynomial.terms.items():
+                terms[monomial] = terms.get(monomial, 0) + coefficient
+    except OverflowError:
+        # An int too large for the float it is added to
+        return _opaque('+', polynomials)
+    return Polynomial(_drop_zeros(terms), _merge_generators(polynomials))
+
+
+def _product(polynomials):
+    result = polynomials[0]
+    for polynomial in polynomials[1:]:
+        try:
+            result = result * polynomial
+        except OverflowError:
+            result = _opaque('*', [result, polynomial])
+    return result
+
+
+def _quotient(polynomials):
+    result = polynomials[0]
+    for polynomial in polynomials[1:]:
+        divisor = polynomial.constant_value()
+        if divisor is None or divisor == 0:
+            result = _opaque('/', [result, polynomial])
+            continue
+        try:
+            result = Polynomial(
+                    _drop_zeros({monomial: _divide(coefficient, divisor)
+                        for monomial, coefficient in result.terms.items()}),
+                    result.generators)
+        except OverflowError:
+            result = _opaque('/', [result, polynomial])
+    return result
+
+
+def _power(polynomials):
+    result = polynomials[0]
+    for polynomial in polynomials[1:]:
+        exponent = polynomial.constant_value()
+        base = result.constant_value()
+        if exponent is not None and base is not None:
+            # Numbers are folded with a limit on their size
+            value = _numeric_power(base, exponent)
+            if value is None:
+                result = _opaque('^', [result, polynomial])
+            else:
+                result = Polynomial.constant(value)
+        elif (exponent is not None and exponent >= 0 and
+                _is_integer(exponent)):
+            try:
+                result = result ** int(exponent)
+            except OverflowError:
+                result = _opaque('^', [result, polynomial])
+        else:
+            result = _opaque('^', [result, polynomial])
+    return result
+
+
+def _divide(dividend, divisor):
+    """Divides exactly if both numbers are ints or Fractions."""
+    if (isinstance(dividend, (int, Fraction)) and
+            isinstance(divisor, (int, Fraction))):
+        return rational(dividend, divisor)
+    return dividend / divisor
+
+
+def _numeric_power(base, exponent):
+    """Returns base ^ exponent, or None if it isn't a real number."""
+    try:
+        if (isinstance(base, (int, Fraction)) and
+                isinstance(exponent, (int, Fraction))):
+            # Like fold_numbers, exact numbers never give a float
+            return _exact_power(base, exponent)
+        value = base ** exponent
+    except (ZeroDivisionError, OverflowError):
+        return None
+    if isinstance(value, complex):
+        return None
+    return value
+
+
+# Exact powers whose result would have more bits than this aren't folded
+_MAX_POWER_BITS = 1 << 16
+
+
+def _exact_power(base, exponent):
+    """Returns base ^ exponent for an int or Fraction base, or None."""
+    if not isinstance(exponent, int):
+        return None
+    if isinstance(base, Fraction):
+        size = max(base.numer.bit_length(), base.denom.bit_length())
+    else:
+        size = base.bit_length()
+    if size * abs(exponent) > _MAX_POWER_BITS:
+        return None
+    if exponent >= 0:
+        return base ** exponent
+    return rational(1, base ** -exponent)
+
+
+def _is_integer(value):
+    """Whether a number is integral, without converting it to a float."""
+    if isinstance(value, int):
+        return True
+    if isinstance(value, Fraction):
+        return value.denom == 1
+    return isinstance(value, float) and value.is_integer()
+
+
+def _opaque(op, polynomials):
+    """Makes a generator out of an operator that can't be expanded."""
+    return Polynomial.generator(
+            Expr(op, [polynomial.to_expr() for polynomial in polynomials]))
+
+
+_OPERATORS = {'+': _sum, '*': _product, '/': _quotient, '^': _power}
+
+
+def _degrees(term_dicts):
+    """Returns the highest exponent of each generator key in the terms."""
+    degrees = {}
+    for terms in term_dicts:
+        for monomial in terms:
+            for key, exponent in monomial:
+                if exponent > degrees.get(key, 0):
+                    degrees[key] = exponent
+    return degrees
+
+
+def _is_dense(terms):
+    """Whether at least half the coefficients of a univariate are nonzero."""
+    degree = max([monomial[0][1] if monomial else 0 for monomial in terms])
+    return 2 * len(terms) > degree
+
+
+def _multiply_dense(terms1, terms2):
+    """Multiplies two univariate polynomials as coefficient lists."""
+    coefficients1, key = _to_dense(terms1)
+    coefficients2, key2 = _to_dense(terms2)
+    product = _karatsuba(coefficients1, coefficients2)
+    key = key if key is not None else key2
+    terms = {}
+    for exponent, coefficient in enumerate(product):
+        if exponent == 0:
+            terms[()] = coefficient
+        else:
+            terms[((key, exponent),)] = coefficient
+    return terms
+
+
+def _to_dense(terms):
+    """Returns the coefficients of a univariate by degree, and its key."""
+    key = None
+    for monomial in terms:
+        if monomial:
+            key = monomial[0][0]
+    degree = max([monomial[0][1] if monomial else 0 for monomial in terms])
+    coefficients = [0] * (degree + 1)
+    for monomial, coefficient in terms.items():
+        coefficients[monomial[0][1] if monomial else 0] = coefficient
+    return coefficients, key
+
+
+def _karatsuba(coefficients1, coefficients2):
+    """
+    Multiplies two coefficient lists.
+
+    Above KARATSUBA_THRESHOLD the factors are split in halves a0 + a1 x^m
+    and b0 + b1 x^m, and the product is found with three half-size
+    products, a0 b0, a1 b1 and (a0 + a1)(b0 + b1), instead of four.  A
+    factor much shorter than the other is multiplied with the other's
+    pieces of its own length, so the halves stay balanced.
+    """
+    if len(coefficients1) < len(coefficients2):
+        coefficients1, coefficients2 = coefficients2, coefficients1
+    length1 = len(coefficients1)
+    length2 = len(coefficients2)
+    if length2 < KARATSUBA_THRESHOLD:
+        return _schoolbook(coefficients1, coefficients2)
+    product = [0] * (length1 + length2 - 1)
+    if 2 * length2 <= length1:
+        for start in range(0, length1, length2):
+            piece = _karatsuba(coefficients1[start:start + length2],
+                    coefficients2)
+            for index, coefficient in enumerate(piece):
+                product[start + index] += coefficient
+        return product
+
+    middle = length1 // 2
+    low1, high1 = coefficients1[:middle], coefficients1[middle:]
+    low2, high2 = coefficients2[:middle], coefficients2[middle:]
+    low = _karatsuba(low1, low2)
+    high = _karatsuba(high1, high2)
+    cross = _karatsuba(_add_coefficients(low1, high1),
+            _add_coefficients(low2, high2))
+    for index, coefficient in enumerate(low):
+        product[index] += coefficient
+        cross[index] -= coefficient
+    for index, coefficient in enumerate(high):
+        product[index + 2 * middle] += coefficient
+        cross[index] -= coefficient
+    for index, coefficient in enumerate(cross):
+        if index + middle < len(product):
+            product[index + middle] += coefficient
+    return product
+
+
+def _schoolbook(coefficients1, coefficients2):
+    product = [0] * (len(coefficients1) + len(coefficients2) - 1)
+    for index1, coefficient1 in enumerate(coefficients1):
+        if coefficient1 == 0:
+            continue
+        for index2, coefficient2 in enumerate(coefficients2):
+            product[index1 + index2] += coefficient1 * coefficient2
+    return product
+
+
+def _add_coefficients(coefficients1, coefficients2):
+    if len(coefficients1) < len(coefficients2):
+        coefficients1, coefficients2 = coefficients2, coefficients1
+    total = list(coefficients1)
+    for index, coefficient in enumerate(coefficients2):
+        total[index] += coefficient
+    return total
+
+
+def _multiply_sparse(terms1, terms2, degrees):
+    """
+    Multiplies two polynomials term by term.
+
+    Each monomial is packed into one int, with a digit per generator key
+    wide enough for the exponents of the product (Kronecker substitution),
+    so multiplying two monomials is an int addition and like terms of the
+    product meet in the same dictionary entry.
+    """
+    keys = sorted(degrees)
+    weights = {}
+    weight = 1
+    for key in keys:
+        weights[key] = weight
+        # The exponent of key in the product is at most twice its degree
+        weight *= 2 * degrees[key] + 1
+
+    packed1 = [(_pack(monomial, weights), coefficient)
+            for monomial, coefficient in terms1.items()]
+    packed2 = [(_pack(monomial, weights), coefficient)
+            for monomial, coefficient in terms2.items()]
+    packed = {}
+    for monomial1, coefficient1 in packed1:
+        for monomial2, coefficient2 in packed2:
+            monomial = monomial1 + monomial2
+            packed[monomial] = (packed.get(monomial, 0) +
+                    coefficient1 * coefficient2)
+
+    terms = {}
+    for monomial, coefficient in packed.items():
+        exponents = []
+        for key in keys:
+            monomial, exponent = divmod(monomial, 2 * degrees[key] + 1)
+            if exponent:
+                exponents.append((key, exponent))
+        terms[tuple(exponents)] = coefficient
+    return terms
+
+
+def _pack(monomial, weights):
+    return sum([exponent * weights[key] for key, exponent in monomial])
+
+
+def _merge_generators(polynomials):
+    generators = {}
+    for polynomial in polynomials:
+        generators.update(polynomial.generators)
+    return generators
+
+
+def _drop_zeros(terms):
+    return {monomial: coefficient for monomial, coefficient in terms.items()
+            if coefficient != 0}
+
@@ -0,0 +1,367 @@
+"""
+Rule-based rewriting of expressions.
+
+A rule rewrites expressions matching a pattern, an Expr containing Wild
+symbols that stand for any subexpression:
+
+    rules = RuleSet([
+        Rule('a * 0', '0', wilds='a'),
+        Rule('a * 1', 'a', wilds='a'),
+        Rule('a ^ 1', 'a', wilds='a'),
+    ])
+    rules.rewrite(Parser.parse('(x ^ 1) * 1'))   # x
+
+Operands of commutative operators are matched in any order, but the number
+of operands has to agree, so a * 0 matches x * 0 and 0 * x but not
+x * y * 0.
+"""
+
+from .expr import *
+from .parser import Parser
+from .operations import substitute_many
+
+# Rules are cached per RuleSet in a dictionary of normal forms, which is
+# emptied when it grows past this many nodes
+MEMO_SIZE = 1 << 16
+# The most rule applications a single call of RuleSet.rewrite may make
+MAX_STEPS = 100000
+
+
+class Wild(Symbol):
+    """
+    A symbol in a pattern that matches any subexpression.
+
+    Every occurrence of the same Wild in a pattern has to match equal
+    subexpressions.  Wild('a') isn't equal to Symbol('a').
+    """
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return (isinstance(other, Wild)
+                and self.symbol_name == other.symbol_name)
+
+    def __hash__(self):
+        return hash(self.symbol_name)
+
+    def __repr__(self):
+        return '%s_' % self.symbol_name
+
+
+class Rule():
+    """
+    Rewrites expressions matching pattern to replacement.
+
+    Parameters:
+    pattern: (Expr object or string) - the pattern to match
+    replacement: (Expr object, string, or function) - what matches are
+        replaced by, with the Wilds of the pattern replaced by what they
+        matched.  A function is called with a dict from Wild names to the
+        matched subexpressions instead, and returns the replacement Expr.
+    wilds: (string or list of strings) - names of the symbols of pattern and
+        replacement to turn into Wilds, as a list or separated by spaces
+    condition: (function) - if given, the rule only applies when this
+        returns True for the dict from Wild names to matched subexpressions
+    """
+
+    def __init__(self, pattern, replacement, wilds=(), condition=None):
+        if isinstance(wilds, str):
+            wilds = wilds.split()
+        self.pattern = _make_pattern(pattern, wilds)
+        if callable(replacement):
+            self.replacement = replacement
+        else:
+            self.replacement = _make_pattern(replacement, wilds)
+            unbound = _wilds(self.replacement) - _wilds(self.pattern)
+            if unbound:
+                raise ExprException('Replacement has Wilds not in the '
+                        'pattern: %s' % ', '.join(sorted([wild.symbol_name
+                            for wild in unbound])))
+        self.condition = condition
+
+    def __repr__(self):
+        return 'Rule(%r, %r)' % (self.pattern, self.replacement)
+
+
+class RuleSet():
+    """
+    An indexed collection of rules, applied until none of them matches.
+
+    The patterns are compiled into a discrimination tree, a trie over the
+    preorder of each pattern that is keyed on operators with their number
+    of operands, symbols and numbers, with a branch for Wilds.  Looking up
+    a node walks the trie along the node, so only rules whose pattern
+    could match it are tried, however many rules there are.  The operands
+    of commutative operators aren't in the index, since they can match in
+    any order; they are checked when the candidate rules are tried.
+
+    Parameters:
+    rules: (list of Rule objects) - the rules.  When several rules match a
+        node, the first one is applied.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = []
+        self._index = {}
+        self._pool = ExprPool()
+        # id of node: (node, its normal form)
+        self._memo = {}
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, rule):
+        """Adds a rule after the existing ones."""
+        node = self._index
+        for key in _pattern_keys(rule.pattern):
+            node = node.setdefault(key, {})
+        node.setdefault(_RULES, []).append(len(self.rules))
+        self.rules.append(rule)
+        self._memo.clear()
+
+    def candidates(self, expr):
+        """Returns the rules whose pattern could match expr, in order."""
+        found = []
+        stack = [(self._index, (expr,))]
+        while stack:
+            node, pending = stack.pop()
+            if not pending:
+                found.extend(node.get(_RULES, ()))
+                continue
+            term = pending[0]
+            rest = pending[1:]
+            child = node.get(_WILD)
+            if child is not None:
+                stack.append((child, rest))
+            child = node.get(_term_key(term))
+            if child is not None:
+                if term.operands and term.value not in COMMUTATIVE_OPS:
+                    rest = tuple(term.operands) + rest
+                stack.append((child, rest))
+        found.sort()
+        return [self.rules[index] for index in found]
+
+    def rewrite(self, expr, max_steps=MAX_STEPS):
+        """
+        Rewrites an expression until no rule matches any of its nodes.
+
+        Nodes are rewritten bottom up: the operands of a node are brought
+        into normal form before rules are tried on the node, and the result
+        of a rule is normalized again.  Normal forms are remembered across
+        calls, so subexpressions that occur more than once, or again in a
+        later call, are only rewritten once.  The rules should terminate;
+        a rule that comes back to a node it is rewriting raises an
+        ExprException, as does needing more than max_steps applications.
+
+        Parameters:
+        expr: (Expr object) - the expression to rewrite.  It isn't modified.
+        max_steps: (int) - the most rule applications to make
+
+        Returns:
+        new_expr: (InternedExpr object) - the normal form of expr
+        """
+        pool = self._pool
+        memo = self._memo
+        if len(memo) > MEMO_SIZE:
+            memo.clear()
+        steps = 0
+        # ids of the nodes whose rewritten forms are being normalized
+        in_progress = set()
+        results = []
+        stack = [(_VISIT, expr)]
+        while stack:
+            action, node = stack.pop()
+            if action == _VISIT:
+                entry = memo.get(id(node))
+                if entry is not None and entry[0] is node:
+                    results.append(entry[1])
+                elif not node.operands:
+                    stack.append((_REDUCE, pool.make(node.value)))
+                else:
+                    stack.append((_BUILD, node))
+                    for operand in reversed(node.operands):
+                        stack.append((_VISIT, operand))
+            elif action == _BUILD:
+                operands = results[len(results) - len(node.operands):]
+                del results[len(results) - len(node.operands):]
+                stack.append((_REDUCE, pool.make(node.value, operands)))
+            elif action == _REDUCE:
+                # The operands of node are in normal form
+                entry = memo.get(id(node))
+                if entry is not None:
+                    results.append(entry[1])
+                    continue
+                if id(node) in in_progress:
+                    raise ExprException('Rewriting %s loops' % node)
+                rewritten = self._apply(node)
+                if rewritten is None:
+                    memo[id(node)] = (node, node)
+                    results.append(node)
+                    continue
+                steps += 1
+                if steps > max_steps:
+                    raise ExprException('Rewriting took more than %d steps'
+                            % max_steps)
+                in_progress.add(id(node))
+                stack.append((_MEMO, node))
+                stack.append((_VISIT, rewritten))
+            else:
+                in_progress.discard(id(node))
+                memo[id(node)] = (node, results[-1])
+        return results[0]
+
+    def _apply(self, node):
+        """Returns node rewritten by the first matching rule, or None."""
+        for rule in self.candidates(node):
+            for bindings in _match(rule.pattern, node, {}):
+                if rule.condition is not None and not rule.condition(
+                        bindings):
+                    continue
+                if callable(rule.replacement):
+                    return self._pool.intern(rule.replacement(bindings))
+                return self._instantiate(rule.replacement, bindings)
+        return None
+
+    def _instantiate(self, replacement, bindings):
+        pool = self._pool
+        results = []
+        stack = [(replacement, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not node.operands:
+                if isinstance(node.value, Wild):
+                    results.append(pool.intern(
+                        bindings[node.value.symbol_name]))
+                else:
+                    results.append(pool.make(node.value))
+            elif visited:
+                operands = results[len(results) - len(node.operands):]
+                del results[len(results) - len(node.operands):]
+                results.append(pool.make(node.value, operands))
+            else:
+                stack.append((node, True))
+                for operand in reversed(node.operands):
+                    stack.append((operand, False))
+        return results[0]
+
+
+def match(pattern, expr):
+    """
+    Matches a pattern against an expression.
+
+    Parameters:
+    pattern: (Expr object) - the pattern, containing Wilds
+    expr: (Expr object) - the expression to match
+
+    Returns:
+    bindings: (dict) - maps the names of the Wilds to the subexpressions
+        they matched, or None if the pattern doesn't match
+    """
+    for bindings in _match(pattern, expr, {}):
+        return bindings
+    return None
+
+
+# Actions of RuleSet.rewrite
+_VISIT = 0
+_BUILD = 1
+_REDUCE = 2
+_MEMO = 3
+
+# Special keys of the discrimination tree
+_WILD = ('wild',)
+_RULES = None
+_NUMBER = 0
+_SYMBOL = 1
+
+
+def _make_pattern(pattern, wilds):
+    if isinstance(pattern, str):
+        pattern = Parser.parse(pattern)
+    elif not isinstance(pattern, Expr):
+        pattern = Expr(pattern)
+    if wilds:
+        pattern = substitute_many(pattern,
+                {name: Expr(Wild(name)) for name in wilds})
+    return pattern
+
+
+def _wilds(pattern):
+    return frozenset([symbol for symbol in pattern.free_symbols
+        if isinstance(symbol, Wild)])
+
+
+def _term_key(expr):
+    if expr.operands:
+        return (expr.value, len(expr.operands))
+    if isinstance(expr.value, Symbol):
+        return (_SYMBOL, expr.value.symbol_name)
+    return (_NUMBER, expr.value)
+
+
+def _pattern_keys(pattern):
+    """The keys of pattern in preorder, leaving out commutative operands."""
+    keys = []
+    stack = [pattern]
+    while stack:
+        node = stack.pop()
+        if not node.operands and isinstance(node.value, Wild):
+            keys.append(_WILD)
+        else:
+            keys.append(_term_key(node))
+            if node.value not in COMMUTATIVE_OPS:
+                stack.extend(reversed(node.operands))
+    return keys
+
+
+def _match(pattern, expr, bindings):
+    """Yields every extension of bindings under which pattern matches expr."""
+    if not pattern.operands:
+        value = pattern.value
+        if isinstance(value, Wild):
+            bound = bindings.get(value.symbol_name)
+            if bound is None:
+                bindings = dict(bindings)
+                bindings[value.symbol_name] = expr
+                yield bindings
+            elif bound == expr:
+                yield bindings
+        elif (not expr.operands and
+                isinstance(value, Symbol) == isinstance(expr.value, Symbol)
+                and value == expr.value):
+            yield bindings
+        return
+    if (pattern.value != expr.value or
+            len(pattern.operands) != len(expr.operands)):
+        return
+    if pattern.value in COMMUTATIVE_OPS:
+        # Operands that aren't unbound Wilds narrow the search the most
+        patterns = sorted(pattern.operands, key=lambda operand:
+                not operand.operands and isinstance(operand.value, Wild))
+        yield from _match_unordered(patterns, list(expr.operands), bindings)
+    else:
+        yield from _match_ordered(pattern.operands, expr.operands, 0,
+                bindings)
+
+
+def _match_ordered(patterns, exprs, index, bindings):
+    if index == len(patterns):
+        yield bindings
+        return
+    for new_bindings in _match(patterns[index], exprs[index], bindings):
+        yield from _match_ordered(patterns, exprs, index + 1, new_bindings)
+
+
+def _match_unordered(patterns, exprs, bindings):
+    if not patterns:
+        yield bindings
+        return
+    for index, expr in enumerate(exprs):
+        # Equal operands would give the same matches again
+        if any([expr is other for other in exprs[:index]]):
+            continue
+        for new_bindings in _match(patterns[0], expr, bindings):
+            yield from _match_unordered(patterns[1:],
+                    exprs[:index] + exprs[index + 1:], new_bindings)
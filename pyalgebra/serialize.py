@@ -0,0 +1,310 @@
+"""
+Compact binary serialization of expressions.
+
+A file holds any number of expressions.  All integers are little-endian.
+
+header: magic b'PYAL', version (u16), reserved (u16), number of entries
+    (u32), then the offsets (u64) of the symbol table, the constant pool and
+    the entry index
+symbol table: count (u32), then per symbol its length (u32) and UTF-8 name
+constant pool: count (u32), then per constant a tag byte and its value: an
+    i64 for 'i', an f64 for 'f', a big integer for 'I', or a big integer
+    numerator and denominator for a Fraction tagged 'r'.  Big integers are
+    a length (u32) and that many signed bytes.
+entry index: per entry its offset (u64) and number of nodes (u32)
+entries: per entry the args (i32) then the opcodes (i8) of its nodes in
+    postorder, as in FlatExpr, with args indexing the shared symbol table
+    and constant pool
+
+Symbols and constants are stored once per file.  load memory-maps the file
+and only decodes the symbol table and constant pool up front; each entry is
+decoded when it is accessed.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from .expr import *
+from .flat import *
+
+MAGIC = b'PYAL'
+FORMAT_VERSION = 2
+# Version 1 files are the same, but have no Fraction constants
+_READABLE_VERSIONS = (1, 2)
+
+_HEADER = struct.Struct('<4sHHIQQQ')
+_INDEX_ENTRY = struct.Struct('<QI')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+
+
+class ExprFormatException(Exception):
+    """Thrown when expressions can't be serialized or deserialized."""
+    pass
+
+
+def dumps(exprs):
+    """
+    Serializes expressions to bytes.
+
+    exprs: (iterable of Expr or FlatExpr objects) - the expressions to store
+    """
+    symbols = []
+    symbol_indices = {}
+    constants = []
+    constant_indices = {}
+    entries = []
+    for expr in exprs:
+        if not isinstance(expr, FlatExpr):
+            expr = FlatExpr.from_expr(expr)
+        # Renumber the expression's own pools into the shared ones
+        symbol_map = [_pool_index(symbols, symbol_indices, name, name)
+                for name in expr.symbols]
+        constant_map = [_pool_index(constants, constant_indices,
+            (type(value), value), value) for value in expr.constants]
+        args = array('i', expr.args)
+        for index, opcode in enumerate(expr.opcodes):
+            if opcode == SYMBOL:
+                args[index] = symbol_map[args[index]]
+            elif opcode == CONST:
+                args[index] = constant_map[args[index]]
+        entries.append((args, expr.opcodes))
+
+    symbol_table = [_U32.pack(len(symbols))]
+    for name in symbols:
+        encoded = name.encode('utf-8')
+        symbol_table.append(_U32.pack(len(encoded)))
+        symbol_table.append(encoded)
+    symbol_table = b''.join(symbol_table)
+
+    constant_pool = [_U32.pack(len(constants))]
+    for value in constants:
+        constant_pool.append(_encode_constant(value))
+    constant_pool = b''.join(constant_pool)
+
+    symbols_offset = _HEADER.size
+    constants_offset = symbols_offset + len(symbol_table)
+    index_offset = constants_offset + len(constant_pool)
+    offset = index_offset + _INDEX_ENTRY.size * len(entries)
+    index = []
+    bodies = []
+    for args, opcodes in entries:
+        index.append(_INDEX_ENTRY.pack(offset, len(opcodes)))
+        if sys.byteorder != 'little':
+            args.byteswap()
+        bodies.append(args.tobytes())
+        bodies.append(opcodes.tobytes())
+        offset += len(bodies[-2]) + len(bodies[-1])
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(entries),
+            symbols_offset, constants_offset, index_offset)
+    return b''.join([header, symbol_table, constant_pool] + index + bodies)
+
+
+def dump(exprs, expr_file):
+    """
+    Writes expressions to a binary file.
+
+    exprs: (iterable of Expr or FlatExpr objects) - the expressions to store
+    expr_file: (binary file object or path) - where to write them
+    """
+    data = dumps(exprs)
+    if hasattr(expr_file, 'write'):
+        expr_file.write(data)
+    else:
+        with open(expr_file, 'wb') as opened_file:
+            opened_file.write(data)
+
+
+def loads(data):
+    """
+    Returns an ExprArchive reading serialized expressions from bytes.
+
+    data: (bytes-like object) - what dumps returned
+    """
+    return ExprArchive(data)
+
+
+def load(path):
+    """
+    Memory-maps a file of serialized expressions.
+
+    path: (string) - the file written by dump
+
+    Returns:
+    archive: (ExprArchive object) - decodes the expressions on access.  Close
+        it, or use it as a context manager, to unmap the file.
+    """
+    with open(path, 'rb') as expr_file:
+        # Empty files can't be mapped
+        if os.fstat(expr_file.fileno()).st_size < _HEADER.size:
+            raise ExprFormatException('Truncated header')
+        mapped = mmap.mmap(expr_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return ExprArchive(mapped)
+    except Exception:
+        mapped.close()
+        raise
+
+
+class ExprArchive():
+    """
+    A sequence of serialized expressions, decoded lazily.
+
+    archive[i] decodes the i-th expression to an Expr and archive.flat(i)
+    to a FlatExpr.  Only the bytes of that entry are read.
+
+    Parameters:
+    data: (bytes-like object or mmap) - the serialized expressions
+    """
+
+    def __init__(self, data):
+        self._data = data
+        if len(data) < _HEADER.size:
+            raise ExprFormatException('Truncated header')
+        (magic, version, _, count, symbols_offset, constants_offset,
+                index_offset) = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ExprFormatException('Not a serialized expression file')
+        if version not in _READABLE_VERSIONS:
+            raise ExprFormatException('Unsupported format version %d' %
+                    version)
+        if index_offset + _INDEX_ENTRY.size * count > len(data):
+            raise ExprFormatException('Truncated entry index')
+        self._count = count
+        self._index_offset = index_offset
+        try:
+            self.symbols = _decode_symbols(data, symbols_offset)
+            self.constants = _decode_constants(data, constants_offset)
+        except struct.error:
+            raise ExprFormatException('Truncated symbol table or constants')
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return self.flat(index).to_expr()
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def flat(self, index):
+        """Decodes the expression at index to a FlatExpr."""
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('Expression index out of range')
+        offset, num_nodes = _INDEX_ENTRY.unpack_from(self._data,
+                self._index_offset + index * _INDEX_ENTRY.size)
+        end = offset + 5 * num_nodes
+        if end > len(self._data):
+            raise ExprFormatException('Truncated expression %d' % index)
+        args = array('i')
+        args.frombytes(self._data[offset:offset + 4 * num_nodes])
+        if sys.byteorder != 'little':
+            args.byteswap()
+        opcodes = array('b')
+        opcodes.frombytes(self._data[offset + 4 * num_nodes:end])
+        return FlatExpr(opcodes, args, _subtree_sizes(opcodes, args),
+                self.constants, self.symbols)
+
+    def close(self):
+        if hasattr(self._data, 'close'):
+            self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _pool_index(pool, indices, key, value):
+    index = indices.get(key)
+    if index is None:
+        index = indices[key] = len(pool)
+        pool.append(value)
+    return index
+
+
+def _encode_constant(value):
+    if isinstance(value, int):
+        if -2 ** 63 <= value < 2 ** 63:
+            return b'i' + _I64.pack(value)
+        return b'I' + _encode_int(value)
+    if isinstance(value, float):
+        return b'f' + _F64.pack(value)
+    if isinstance(value, Fraction):
+        return b'r' + _encode_int(value.numer) + _encode_int(value.denom)
+    raise ExprFormatException('Cannot serialize constant %r' % (value,))
+
+
+def _encode_int(value):
+    encoded = value.to_bytes((value.bit_length() + 8) // 8, 'little',
+            signed=True)
+    return _U32.pack(len(encoded)) + encoded
+
+
+def _decode_int(data, offset):
+    """Returns a big integer and the offset after it."""
+    length, = _U32.unpack_from(data, offset)
+    offset += _U32.size
+    return (int.from_bytes(data[offset:offset + length], 'little',
+        signed=True), offset + length)
+
+
+def _decode_symbols(data, offset):
+    count, = _U32.unpack_from(data, offset)
+    offset += _U32.size
+    symbols = []
+    for _ in range(count):
+        length, = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        symbols.append(bytes(data[offset:offset + length]).decode('utf-8'))
+        offset += length
+    return symbols
+
+
+def _decode_constants(data, offset):
+    count, = _U32.unpack_from(data, offset)
+    offset += _U32.size
+    constants = []
+    for _ in range(count):
+        tag = data[offset:offset + 1]
+        offset += 1
+        if tag == b'i':
+            constants.append(_I64.unpack_from(data, offset)[0])
+            offset += _I64.size
+        elif tag == b'f':
+            constants.append(_F64.unpack_from(data, offset)[0])
+            offset += _F64.size
+        elif tag == b'I':
+            value, offset = _decode_int(data, offset)
+            constants.append(value)
+        elif tag == b'r':
+            numer, offset = _decode_int(data, offset)
+            denom, offset = _decode_int(data, offset)
+            constants.append(Fraction(numer, denom))
+        else:
+            raise ExprFormatException('Unknown constant tag %r' % tag)
+    return constants
+
+
+def _subtree_sizes(opcodes, args):
+    """Recomputes FlatExpr.sizes from the opcodes and arities."""
+    sizes = array('i')
+    pending = []
+    for index in range(len(opcodes)):
+        if opcodes[index] == CONST or opcodes[index] == SYMBOL:
+            size = 1
+        else:
+            num_operands = args[index]
+            size = 1 + sum(pending[len(pending) - num_operands:])
+            del pending[len(pending) - num_operands:]
+        pending.append(size)
+        sizes.append(size)
+    return sizes
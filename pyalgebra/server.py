@@ -0,0 +1,400 @@
+"""
+A local server that evaluates formulas for other processes.
+
+Clients send one JSON request per line and get one JSON response per line:
+
+    {"id": 1, "formula": "x * y + 2", "bindings": {"x": 3, "y": 4}}
+    {"id": 1, "value": 14.0}
+
+A request that fails gets {"id": ..., "error": message} instead.  The id is
+optional and echoed back as it was sent, so a client can pipeline requests
+and match up the responses, which may come back in a different order.
+
+Parsed formulas are cached by their string.  Requests for the same formula
+that arrive together, from one connection or several, are coalesced into a
+batch and evaluated at once: the bindings of the batch are stacked into one
+array per symbol and the formula is evaluated over the arrays with NumPy.
+Values are computed as floats.  Without NumPy each request of a batch is
+evaluated with a compiled function instead.  Either way a result that isn't
+finite, like from division by zero, is an error, since JSON has no inf or
+nan.
+
+Usage:
+    python -m pyalgebra.server --unix /tmp/pyalgebra.sock
+    python -m pyalgebra.server [--host 127.0.0.1] [--port 8750]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import sys
+from collections import OrderedDict
+from numbers import Real
+from .expr import *
+from .parser import *
+from .compiler import compile_expr
+
+try:
+    import numpy as np
+    from .numeric import evaluate_array
+except ImportError:
+    np = None
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+PARSE_CACHE_SIZE = 1024
+# The longest request line accepted, in bytes
+MAX_LINE = 1 << 24
+
+
+class ExprServerException(Exception):
+    """Thrown by ExprClient when the server couldn't evaluate a request."""
+    pass
+
+
+class ExprServer():
+    """
+    Evaluates formulas, batching concurrent requests for the same formula.
+
+    A batch collects the requests for a formula until the event loop gets
+    around to it, which is after every request that is already readable has
+    been read.  With batch_delay > 0 the batch waits that many seconds more
+    for stragglers.
+
+    Parameters:
+    cache_size: (int) - the number of parsed formulas to keep
+    batch_delay: (float) - extra seconds to wait before evaluating a batch
+    """
+
+    def __init__(self, cache_size=PARSE_CACHE_SIZE, batch_delay=0):
+        self.cache_size = cache_size
+        self.batch_delay = batch_delay
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_parses = 0
+        # formula: (Expr object, names of its symbols), least recent first
+        self._cache = OrderedDict()
+        # formula: list of (bindings, future)
+        self._batches = {}
+
+    def submit(self, formula, bindings):
+        """
+        Queues a request and returns a future for its value.
+
+        Must be called from the event loop the server runs in.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._batches.get(formula)
+        if batch is None:
+            batch = self._batches[formula] = []
+            if self.batch_delay > 0:
+                loop.call_later(self.batch_delay, self._flush, formula)
+            else:
+                loop.call_soon(self._flush, formula)
+        batch.append((bindings, future))
+        self.num_requests += 1
+        return future
+
+    async def evaluate(self, formula, bindings):
+        """Evaluates a formula with the given symbol values."""
+        return await self.submit(formula, bindings)
+
+    def parse(self, formula):
+        """Returns the parsed formula and its symbol names, from the cache."""
+        entry = self._cache.get(formula)
+        if entry is not None:
+            self._cache.move_to_end(formula)
+            return entry
+        expr = Parser.parse(formula, fold=True)
+        entry = (expr, sorted([symbol.symbol_name
+            for symbol in expr.free_symbols]))
+        self.num_parses += 1
+        self._cache[formula] = entry
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def start(self, path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Starts listening and returns the asyncio.Server.
+
+        Listens on the Unix socket at path if one is given, and on host and
+        port otherwise.  Pass port=0 to pick a free port.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle, path,
+                    limit=MAX_LINE)
+        return await asyncio.start_server(self._handle, host, port,
+                limit=MAX_LINE)
+
+    def _flush(self, formula):
+        batch = self._batches.pop(formula)
+        batch = [(bindings, future) for bindings, future in batch
+                if not future.cancelled()]
+        if not batch:
+            return
+        self.num_batches += 1
+        try:
+            expr, names = self.parse(formula)
+        except (ParseExprException, ExprException, RecursionError) as error:
+            for _, future in batch:
+                future.set_exception(ParseExprException(str(error)))
+            return
+        try:
+            results = _evaluate_batch(expr, names,
+                    [bindings for bindings, _ in batch])
+        except Exception as error:
+            # Nothing else would resolve the futures of the batch
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The line was longer than MAX_LINE
+                    _respond(writer, None, error='Request too long')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    request_id, formula, bindings = _unpack_request(request)
+                except (ValueError, ExprServerException) as error:
+                    _respond(writer, None, error='Invalid request: %s' % error)
+                    continue
+                future = self.submit(formula, bindings)
+                future.add_done_callback(lambda future, request_id=request_id:
+                        _respond_with(writer, request_id, future))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class ExprClient():
+    """
+    Sends requests to an ExprServer over one connection.
+
+    Requests can be made concurrently, for example with asyncio.gather, and
+    are pipelined on the connection.  Use ExprClient.connect to create one.
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count()
+        # request id: future
+        self._pending = {}
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, path=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Connects to the Unix socket at path, or to host and port."""
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path,
+                    limit=MAX_LINE)
+        else:
+            reader, writer = await asyncio.open_connection(host, port,
+                    limit=MAX_LINE)
+        return cls(reader, writer)
+
+    async def evaluate(self, formula, bindings=None):
+        """
+        Evaluates a formula on the server.
+
+        Parameters:
+        formula: (string) - the expression to evaluate
+        bindings: (dict) - maps symbol names to numbers
+
+        Returns:
+        value: (float) - the value of the formula
+        """
+        if self._receiver.done():
+            raise ConnectionError('Connection closed')
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(json.dumps({'id': request_id, 'formula': formula,
+            'bindings': bindings or {}}).encode() + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._receiver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _receive(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in response:
+                    future.set_exception(
+                            ExprServerException(response['error']))
+                else:
+                    future.set_result(response['value'])
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Connection closed'))
+            self._pending.clear()
+
+
+def _unpack_request(request):
+    if not isinstance(request, dict):
+        raise ExprServerException('expected a JSON object')
+    formula = request.get('formula')
+    if not isinstance(formula, str):
+        raise ExprServerException('formula must be a string')
+    bindings = request.get('bindings', {})
+    if not isinstance(bindings, dict):
+        raise ExprServerException('bindings must be an object')
+    return request.get('id'), formula, bindings
+
+
+def _respond(writer, request_id, value=None, error=None):
+    if writer.is_closing():
+        return
+    if error is None:
+        response = {'id': request_id, 'value': value}
+    else:
+        response = {'id': request_id, 'error': error}
+    writer.write(json.dumps(response, allow_nan=False).encode() + b'\n')
+
+
+def _respond_with(writer, request_id, future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None:
+        _respond(writer, request_id, future.result())
+    else:
+        _respond(writer, request_id, error=str(error))
+
+
+def _check_bindings(names, bindings):
+    for name in names:
+        if name not in bindings:
+            raise ExprException('No value for symbol %s' % name)
+        value = bindings[name]
+        if not isinstance(value, Real) or isinstance(value, bool):
+            raise ExprException('Value for symbol %s is not a number' % name)
+
+
+def _check_finite(value):
+    """Returns value, or an exception for it if it can't be sent as JSON."""
+    if math.isfinite(value):
+        return value
+    return ExprException('Result is not finite: %r' % value)
+
+
+def _evaluate_batch(expr, names, bindings_list):
+    """Returns the value or exception of each request of a batch."""
+    results = [None] * len(bindings_list)
+    valid = []
+    for index, bindings in enumerate(bindings_list):
+        try:
+            _check_bindings(names, bindings)
+            valid.append(index)
+        except ExprException as error:
+            results[index] = error
+    if not valid:
+        return results
+
+    if np is not None:
+        try:
+            arrays = {name: np.array([bindings_list[index][name]
+                for index in valid], dtype=np.float64) for name in names}
+            with np.errstate(all='ignore'):
+                values = evaluate_array(expr, arrays)
+            values = np.broadcast_to(values, (len(valid),))
+        except (ArithmeticError, TypeError, ValueError):
+            # Evaluate the requests one by one below to find the bad ones
+            pass
+        else:
+            for index, value in zip(valid, values.tolist()):
+                results[index] = _check_finite(value)
+            return results
+
+    func = compile_expr(expr, names)
+    for index in valid:
+        bindings = bindings_list[index]
+        try:
+            results[index] = _check_finite(
+                    float(func(*[bindings[name] for name in names])))
+        except (ArithmeticError, TypeError, ValueError) as error:
+            results[index] = ExprException(str(error))
+    return results
+
+
+async def serve(path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, **options):
+    """Runs an ExprServer until cancelled.  options go to ExprServer."""
+    server = await ExprServer(**options).start(path, host, port)
+    if path is not None:
+        print('Listening on %s' % path, flush=True)
+    else:
+        print('Listening on %s:%d' % server.sockets[0].getsockname()[:2],
+                flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pyalgebra.server',
+            description='pyalgebra formula evaluation server')
+    parser.add_argument('--unix', metavar='PATH',
+            help='Unix socket to listen on, instead of a TCP port')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-size', type=int, default=PARSE_CACHE_SIZE,
+            help='number of parsed formulas to keep')
+    parser.add_argument('--batch-delay', type=float, default=0,
+            help='extra seconds to wait for requests to batch')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.unix, args.host, args.port,
+            cache_size=args.cache_size, batch_delay=args.batch_delay))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
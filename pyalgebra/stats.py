@@ -0,0 +1,96 @@
+"""Size statistics of expressions, for deciding what to admit."""
+
+import sys
+from .expr import *
+
+
+def expr_stats(expr):
+    """
+    Measures an expression in one linear pass.
+
+    Every node object is visited once, so an expression that reuses
+    subtree objects, like the results of substitute_many, is measured in
+    time proportional to its distinct objects, while the counts are those
+    of the full tree that consumers walk.
+
+    Parameters:
+    expr: (Expr object) - the expression to measure
+
+    Returns:
+    stats: (dict) - with these entries:
+        nodes: the number of nodes of the tree
+        depth: the number of nodes on the longest path from the root to a
+            terminal
+        distinct_subtrees: the number of structurally different subtrees,
+            the node count left after common-subexpression elimination
+        symbols: the number of different symbols
+        operators: maps each operator in OPS to the number of its nodes
+        memory: the estimated size in bytes of the objects making up expr,
+            counting shared objects once
+    """
+    # The distinct node objects in postorder
+    nodes = []
+    seen = set()
+    stack = [(expr, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            nodes.append(node)
+        elif id(node) not in seen:
+            seen.add(id(node))
+            stack.append((node, True))
+            for operand in reversed(node.operands):
+                stack.append((operand, False))
+
+    # Per object: its depth and the number of its structural class, which
+    # is the same for structurally equal subtrees
+    depths = {}
+    classes = {}
+    class_numbers = {}
+    symbols = set()
+    values = {}
+    memory = 0
+    for node in nodes:
+        memory += sys.getsizeof(node)
+        if node.operands:
+            memory += sys.getsizeof(node.operands)
+            depths[id(node)] = 1 + max([depths[id(operand)]
+                for operand in node.operands])
+            operand_classes = [classes[id(operand)]
+                    for operand in node.operands]
+            if node.value in COMMUTATIVE_OPS:
+                operand_classes.sort()
+            key = (node.value, tuple(operand_classes))
+        else:
+            depths[id(node)] = 1
+            values[id(node.value)] = node.value
+            if isinstance(node.value, Symbol):
+                symbols.add(node.value)
+                key = (Symbol, node.value.symbol_name)
+            else:
+                key = (Number, node.value)
+        classes[id(node)] = class_numbers.setdefault(key, len(class_numbers))
+    for value in values.values():
+        memory += sys.getsizeof(value)
+        if isinstance(value, Symbol):
+            memory += sys.getsizeof(value.symbol_name)
+
+    # How often each object occurs in the tree, from the root down
+    occurrences = {id(expr): 1}
+    for node in reversed(nodes):
+        count = occurrences[id(node)]
+        for operand in node.operands:
+            occurrences[id(operand)] = occurrences.get(id(operand), 0) + count
+    operators = {op: 0 for op in OPS}
+    for node in nodes:
+        if node.operands:
+            operators[node.value] += occurrences[id(node)]
+
+    return {
+        'nodes': sum(occurrences.values()),
+        'depth': depths[id(expr)],
+        'distinct_subtrees': len(class_numbers),
+        'symbols': len(symbols),
+        'operators': operators,
+        'memory': memory,
+    }
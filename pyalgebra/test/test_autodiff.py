@@ -0,0 +1,74 @@
+import unittest
+from ..autodiff import *
+from ..cse import *
+from ..expr import *
+from ..flat import *
+from ..parser import *
+
+
+class TestGradient(unittest.TestCase):
+    """Tests for reverse-mode differentiation"""
+
+    def assertGradient(self, expr_str, bindings, expected):
+        """Checks the numeric gradient and the symbolic one evaluated."""
+        expr = Parser.parse(expr_str)
+        symbols = sorted(bindings)
+        numeric = gradient(expr, symbols, bindings)
+        symbolic = [FlatExpr.from_expr(derivative).evaluate(bindings)
+                for derivative in gradient(expr, symbols)]
+        for derivatives in [numeric, symbolic]:
+            for name, value in zip(symbols, derivatives):
+                self.assertAlmostEqual(value, expected[name])
+
+    def test_gradient(self):
+        self.assertGradient('x * y * z + x ^ 2', {'x': 2, 'y': 3, 'z': 5},
+                {'x': 19, 'y': 10, 'z': 6})
+        self.assertGradient('(x + y) / (x * y)', {'x': 2, 'y': 3},
+                {'x': -1 / 4, 'y': -1 / 9})
+        self.assertGradient('x / y / z', {'x': 2, 'y': 3, 'z': 5},
+                {'x': 1 / 15, 'y': -2 / 45, 'z': -2 / 75})
+        self.assertGradient('x ^ 3 ^ 2', {'x': 2}, {'x': 6 * 2 ** 5})
+        self.assertGradient('(x * y + 1) ^ 3', {'x': 2, 'y': 3},
+                {'x': 3 * 7 ** 2 * 3, 'y': 3 * 7 ** 2 * 2})
+        self.assertGradient('3 * x + 5', {'x': 1, 'y': 1}, {'x': 3, 'y': 0})
+        self.assertEqual(gradient(Parser.parse('x'), ['x', Symbol('y')]),
+                [Expr(1), Expr(0)])
+
+    def test_exponents(self):
+        expr = Parser.parse('2 * x ^ y')
+        x, y = gradient(expr, ['x', 'y'], {'x': 2, 'y': 3})
+        self.assertEqual(x, 24)
+        self.assertAlmostEqual(y, 16 * 0.6931471805599453)
+        # Without a log operator there is no symbolic derivative
+        self.assertRaises(ExprException, gradient, expr, ['y'])
+        self.assertEqual(repr(gradient(expr, ['x'])[0]),
+                'Mul(2, Mul(y, Exp(x, Add(-1, y))))')
+        self.assertRaises(ExprException, gradient, expr, ['y'],
+                {'x': -2, 'y': 3})
+        self.assertRaises(ExprException, gradient, expr, ['x'], {'x': 2})
+
+        # Exponents of 0 make the earlier operands irrelevant, even at 0
+        self.assertGradient('x ^ 0 + x', {'x': 0}, {'x': 1})
+        self.assertGradient('x ^ y ^ 0 + x', {'x': 0, 'y': 0},
+                {'x': 1, 'y': 0})
+
+    def test_shared_subexpressions(self):
+        # x ^ (2 ^ 30) as a tree with 2 ^ 30 leaves, but only 31 unique nodes
+        expr = Expr(Symbol('x'))
+        for _ in range(30):
+            expr = Expr('*', [expr, expr])
+        self.assertEqual(gradient(expr, ['x'], {'x': 1}), [2 ** 30])
+        derivative = gradient(expr, ['x'])[0]
+        self.assertLess(len(cse(derivative).nodes), 10 * 30)
+
+        # The derivatives reuse the nodes of the expression
+        pool = ExprPool()
+        inner = pool.intern(Parser.parse('x * y + 1'))
+        derivative = gradient(Expr('^', [inner, Expr(3)]), ['x'],
+                pool=pool)[0]
+        nodes = cse(derivative, pool).nodes
+        self.assertTrue(any(node is inner for node in nodes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from ..compiler import *
+from ..expr import *
+from ..flat import *
+from ..parser import *
+
+
+class TestCompileExpr(unittest.TestCase):
+    """Tests for compiling expressions into functions"""
+
+    def setUp(self):
+        clear_compile_cache()
+
+    def test_compile_expr(self):
+        for expr_str in ['5', 'x', '(x + 1) * y ^ 2 / 4', '2 ^ x ^ y',
+                'x / y / 4', 'x * y * 3 + x + 0.5']:
+            expr = Parser.parse(expr_str)
+            func = compile_expr(expr, ['x', Symbol('y')])
+            flat = FlatExpr.from_expr(expr)
+            for x, y in [(1, 2), (3.5, -1), (-2, 3)]:
+                self.assertAlmostEqual(func(x, y),
+                        flat.evaluate({'x': x, 'y': y}))
+        func = compile_expr(Parser.parse('y / x'), ['x', 'y'])
+        self.assertEqual(func(y=6, x=3), 2)
+
+    def test_negative_constants(self):
+        expr = Expr('^', [Expr(-3), Expr(2)])
+        self.assertEqual(compile_expr(expr, [])(), 9)
+        expr = Expr('+', [Expr(Symbol('x')), Expr(float('inf'))])
+        self.assertEqual(compile_expr(expr, ['x'])(1), float('inf'))
+
+    def test_long_chains(self):
+        expr = Expr('+', [Expr(Symbol('x'))] * 1000)
+        self.assertEqual(compile_expr(expr, ['x'])(2), 2000)
+        expr = Expr('^', [Expr(Symbol('x')), Expr(2), Expr(3)])
+        self.assertEqual(compile_expr(expr, ['x'])(2), 64)
+        expr = Expr(Symbol('x'))
+        for _ in range(2000):
+            expr = Expr('*', [Expr(1), Expr('+', [expr, Expr(1)])])
+        self.assertEqual(compile_expr(expr, ['x'])(0), 2000)
+
+    def test_cache(self):
+        func = compile_expr(Parser.parse('x * y + 1'), ['x', 'y'])
+        self.assertIs(compile_expr(Parser.parse('1 + y * x'), ['x', 'y']),
+                func)
+        self.assertIsNot(compile_expr(Parser.parse('x * y + 1'),
+            ['y', 'x']), func)
+        info = compile_cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+        # Equal constants of different types compile separately
+        func = compile_expr(Parser.parse('x * 2'), ['x'])
+        self.assertIsInstance(func(3), int)
+        self.assertIsInstance(compile_expr(Parser.parse('x * 2.0'),
+            ['x'])(3), float)
+
+    def test_invalid_args(self):
+        expr = Parser.parse('x + y')
+        self.assertRaises(ExprException, compile_expr, expr, ['x'])
+        self.assertRaises(ExprException, compile_expr, expr, ['x', 'x', 'y'])
+        self.assertRaises(ExprException, compile_expr, expr,
+                ['x', 'y', 'if'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from ..cse import *
+from ..expr import *
+from ..parser import *
+
+
+class TestCSE(unittest.TestCase):
+    """Tests for common-subexpression elimination"""
+
+    def test_cse(self):
+        expr = Parser.parse('(a * b + c) ^ 2 / (a * b + c)')
+        dag = cse(expr)
+        # a, b, a * b, c, a * b + c, 2, ^, /
+        self.assertEqual(len(dag.nodes), 8)
+        self.assertEqual(dag.num_tree_nodes, 13)
+        self.assertEqual(dag.num_eliminated, 5)
+        self.assertIs(dag.nodes[-1], dag.root)
+        self.assertIs(dag.root.operands[0].operands[0],
+                dag.root.operands[1])
+        self.assertEqual(dag.to_expr(), expr)
+
+        # Every node comes after its operands
+        positions = {id(node): index for index, node in enumerate(dag.nodes)}
+        for index, node in enumerate(dag.nodes):
+            for operand in node.operands:
+                self.assertLess(positions[id(operand)], index)
+
+        # Commutative operands are merged regardless of order
+        self.assertEqual(cse(Parser.parse('x * y + y * x')).num_eliminated,
+                3)
+        self.assertEqual(cse(Parser.parse('x + y')).num_eliminated, 0)
+
+    def test_evaluate(self):
+        dag = cse(Parser.parse('(a * b + c) ^ 2 / (a * b + c)'))
+        self.assertEqual(dag.evaluate({'a': 2, 'b': 3, Symbol('c'): 1}), 7)
+        self.assertRaises(ExprException, dag.evaluate, {'a': 2, 'b': 3})
+
+    def test_substitute(self):
+        dag = cse(Parser.parse('(a * b + c) ^ 2 / (a * b + c)'))
+        substituted = dag.substitute('a', Parser.parse('x + 1'))
+        self.assertEqual(substituted.to_expr(),
+                Parser.parse('((x + 1) * b + c) ^ 2 / ((x + 1) * b + c)'))
+        self.assertEqual(substituted.num_tree_nodes, 17)
+        self.assertEqual(substituted.evaluate({'x': 1, 'b': 3, 'c': 1}), 7)
+        self.assertEqual(dag.to_expr(),
+                Parser.parse('(a * b + c) ^ 2 / (a * b + c)'))
+        self.assertIs(dag.substitute('z', 5).root, dag.root)
+
+    def test_deep_sharing(self):
+        expr = Expr(Symbol('x'))
+        for _ in range(20):
+            expr = Expr('+', [expr, expr])
+        dag = cse(expr)
+        self.assertEqual(len(dag.nodes), 21)
+        self.assertEqual(dag.evaluate({'x': 1}), 2 ** 20)
+        self.assertEqual(dag.substitute('x', 2).evaluate({}), 2 ** 21)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import time
+import unittest
+from ..expr import *
+from ..operations import *
+from ..parser import *
+
+DEPTH = 10 ** 6
+
+
+def left_deep_chain(depth, op='+'):
+    """
+    Returns x op 1 op 1 ... op 1 as a left-deep tree of the given depth.
+
+    The chain is built as written, but the canonical operand order puts the
+    1s first, so it ends up as 1 op (1 op (... op x)).
+    """
+    expr = Expr(Symbol('x'))
+    for _ in range(depth):
+        expr = Expr(op, [expr, Expr(1)])
+    return expr
+
+
+def deepest_terminal(expr):
+    while expr.operands:
+        expr = expr.operands[-1]
+    return expr
+
+
+class TestDeepExprs(unittest.TestCase):
+    """Traversals of very deep expressions must not recurse and be linear"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.small = left_deep_chain(DEPTH // 10)
+        cls.large = left_deep_chain(DEPTH)
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.small, cls.large
+
+    def assertLinear(self, func, make_args):
+        """
+        Checks that func takes about 10 times longer on the large chain.
+
+        A quadratic implementation would take about 100 times longer.
+        """
+        start = time.perf_counter()
+        func(*make_args(self.small))
+        small_time = time.perf_counter() - start
+        start = time.perf_counter()
+        result = func(*make_args(self.large))
+        large_time = time.perf_counter() - start
+        self.assertLess(large_time, 30 * max(small_time, 1e-3))
+        return result
+
+    def test_str(self):
+        string = self.assertLinear(str, lambda expr: (expr,))
+        self.assertEqual(string, '1 + ' * DEPTH + 'x')
+
+    def test_repr(self):
+        string = self.assertLinear(repr, lambda expr: (expr,))
+        self.assertEqual(string, 'Add(1, ' * DEPTH + 'x' + ')' * DEPTH)
+
+    def test_hash(self):
+        hash_value = self.assertLinear(hash, lambda expr: (expr,))
+        self.assertIsInstance(hash_value, int)
+        self.assertNotEqual(hash_value, hash(self.small))
+
+    def test_substitute(self):
+        substituted = self.assertLinear(substitute,
+                lambda expr: (expr, 'x', 'y'))
+        self.assertEqual(str(substituted), '1 + ' * DEPTH + 'y')
+        self.assertEqual(deepest_terminal(self.large), Expr(Symbol('x')))
+
+    def test_flatten_expr(self):
+        # Flattening modifies the chains in place, so use fresh copies
+        flattened = self.assertLinear(flatten_expr, lambda expr:
+                (substitute(expr, 'x', 'x'),))
+        self.assertEqual(flattened.value, '+')
+        self.assertEqual(flattened.num_operands, DEPTH + 1)
+        self.assertEqual(flattened.operands[-1], Expr(Symbol('x')))
+        self.assertTrue(all(operand == Expr(1)
+            for operand in flattened.operands[:-1]))
+
+    def test_eq(self):
+        # Compare against equal copies that share no nodes
+        self.assertTrue(self.assertLinear(lambda expr, copy: expr == copy,
+            lambda expr: (expr, substitute(expr, 'x', 'x'))))
+        self.assertNotEqual(self.large, substitute(self.large, 'x', 'y'))
+
+    def test_eq_out_of_order(self):
+        # Operands put out of order in place make __eq__ fall back to the
+        # comparison ignoring the order
+        def make_args(expr):
+            copy = substitute(expr, 'x', 'x')
+            bottom = deepest_terminal(copy)
+            node = copy
+            while node.operands[-1] is not bottom:
+                node = node.operands[-1]
+            node.operands.reverse()
+            Expr._mutations += 1
+            return expr, copy
+        self.assertTrue(self.assertLinear(lambda expr, copy: expr == copy,
+            make_args))
+
+
+if __name__ == '__main__':
+    unittest.main()
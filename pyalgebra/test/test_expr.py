@@ -1,5 +1,14 @@
+import gc
+import os
+import pickle
+import subprocess
+import sys
 import unittest
 from ..expr import *
+from .. import expr as pyalgebra_expr
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
 
 
 class TestExpr(unittest.TestCase):
@@ -82,14 +91,229 @@ class TestExpr(unittest.TestCase):
         self.assertEqual('5 + yz', str(expr))
 
         expr = Expr('*', [Expr(Symbol('x')), Expr(8)])
-        self.assertEqual('x * 8', str(expr))
+        self.assertEqual('8 * x', str(expr))
 
         expr = Expr('+',
                 [
                     Expr(5), Expr('*', [Expr(1), Expr(2)]),
                     Expr(Symbol('z'))
                 ])
-        self.assertEqual('5 + 1 * 2 + z', str(expr))
+        self.assertEqual('5 + z + 1 * 2', str(expr))
+
+    def test_free_symbols(self):
+        x = Expr(Symbol('x'))
+        product = Expr('*', [x, Expr(3)])
+        expr = Expr('+', [product, Expr(Symbol('z'))])
+        self.assertEqual(expr.free_symbols, frozenset([Symbol('x'),
+            Symbol('z')]))
+        self.assertEqual(product.free_symbols, frozenset([Symbol('x')]))
+        self.assertEqual(Expr(5).free_symbols, frozenset())
+        self.assertTrue(expr.has_symbol('x'))
+        self.assertTrue(expr.has_symbol(Symbol('z')))
+        self.assertFalse(expr.has_symbol('y'))
+
+        # Modifying any node invalidates the cached sets above it
+        product.add_operand(Expr(Symbol('y')))
+        self.assertTrue(expr.has_symbol('y'))
+        product.add_operands([Expr(Symbol('w'))])
+        self.assertEqual(expr.free_symbols, frozenset([Symbol('w'),
+            Symbol('x'), Symbol('y'), Symbol('z')]))
+
+    def test_hashing(self):
+        x_plus_x = Expr('+', [Expr(Symbol('x')), Expr(Symbol('x'))])
+        y_plus_y = Expr('+', [Expr(Symbol('y')), Expr(Symbol('y'))])
+        self.assertNotEqual(hash(x_plus_x), hash(y_plus_y))
+
+        expr1 = Expr('*', [Expr(Symbol('x')), Expr(3)])
+        expr2 = Expr('*', [Expr(3), Expr(Symbol('x'))])
+        self.assertEqual(expr1, expr2)
+        self.assertEqual(hash(expr1), hash(expr2))
+
+        # Only commutative operators ignore operand order
+        expr1 = Expr('/', [Expr(Symbol('x')), Expr(3)])
+        expr2 = Expr('/', [Expr(3), Expr(Symbol('x'))])
+        self.assertNotEqual(expr1, expr2)
+
+
+    def test_canonical_order(self):
+        x, y = Expr(Symbol('x')), Expr(Symbol('y'))
+        product = Expr('*', [y, Expr(2)])
+        expr = Expr('+', [product, y, Expr(1.5), x, Expr(-1)])
+        self.assertEqual(repr(expr), 'Add(-1, 1.5, x, y, Mul(2, y))')
+        self.assertEqual(repr(Expr('+', [x, product, Expr(3)])),
+                repr(Expr('+', [product, Expr(3), x])))
+        expr.add_operand(Expr(0))
+        self.assertEqual(repr(expr), 'Add(-1, 0, 1.5, x, y, Mul(2, y))')
+        # Only commutative operators are reordered
+        self.assertEqual(repr(Expr('/', [x, Expr(2)])), 'Div(x, 2)')
+
+    def test_stable_hash(self):
+        code = ('from pyalgebra.expr import *\n'
+                'x = Expr(Symbol("x"))\n'
+                'print(hash(x), Expr("+", [Expr("*", [x, x]), '
+                'Expr("/", [x, Expr(2)]), Expr("^", [x, x])]))')
+        outputs = set()
+        for seed in ['1', '2']:
+            environment = dict(os.environ, PYTHONHASHSEED=seed)
+            outputs.add(subprocess.check_output([sys.executable, '-c', code],
+                env=environment, cwd=_ROOT))
+        self.assertEqual(len(outputs), 1)
+
+    def test_equality_after_modification(self):
+        # Modifying an operand in place can leave its parent out of order,
+        # which equality still handles
+        inner = Expr('*', [Expr(Symbol('a'))])
+        expr = Expr('+', [inner, Expr('*', [Expr(Symbol('b')),
+            Expr(Symbol('c'))])])
+        inner.add_operands([Expr(Symbol('z')), Expr(Symbol('y'))])
+        other = Expr('+', [Expr('*', [Expr(Symbol('c')), Expr(Symbol('b'))]),
+            Expr('*', [Expr(Symbol('y')), Expr(Symbol('a')),
+                Expr(Symbol('z'))])])
+        self.assertEqual(expr, other)
+        self.assertEqual(hash(expr), hash(other))
+        self.assertNotEqual(expr, Expr('+', [inner, inner]))
+
+    def test_dict_keys(self):
+        exprs = {}
+        for index in range(200):
+            terms = [Expr('*', [Expr(index % 10), Expr(Symbol('x'))]),
+                    Expr(Symbol('y')), Expr(index % 3)]
+            if index % 2:
+                terms.reverse()
+            exprs.setdefault(Expr('+', terms), index)
+        self.assertEqual(len(exprs), 30)
+
+    def test_slots(self):
+        for obj in [Expr(Symbol('x')), Expr('+', [Expr(1), Expr(2)]),
+                Symbol('x'), Fraction(1, 2)]:
+            self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertFalse(hasattr(Expr(Symbol('x')), '__weakref__'))
+
+    def test_interned_symbols(self):
+        self.assertIs(Symbol('x'), Symbol('x'))
+        self.assertIsNot(Symbol('x'), Symbol('y'))
+        expr = Expr('*', [Expr(Symbol('zz')), Expr(Symbol('zz'))])
+        self.assertIs(expr.operands[0].value, expr.operands[1].value)
+        # The table doesn't keep unused symbols alive
+        Symbol('unused')
+        gc.collect()
+        self.assertNotIn((Symbol, 'unused'), list(pyalgebra_expr._symbols))
+
+    def test_pickle(self):
+        expr = Expr('+', [Expr('*', [Expr(Fraction(3, 4)), Expr(Symbol('x'))]),
+            Expr(Symbol('y'))])
+        hash(expr)
+        expr.free_symbols
+        copy = pickle.loads(pickle.dumps(expr))
+        self.assertEqual(copy, expr)
+        self.assertEqual(hash(copy), hash(expr))
+        self.assertEqual(copy.free_symbols, expr.free_symbols)
+        self.assertIs(copy.operands[0].value, Symbol('y'))
+        self.assertEqual(repr(copy.operands[1].operands[0].value),
+                'Fraction(3, 4)')
+
+        # Interned nodes come back as plain ones, sharing included
+        product = Expr('*', [Expr(Symbol('x')), Expr(Symbol('y'))])
+        interned = ExprPool().intern(Expr('+', [product, product]))
+        copy = pickle.loads(pickle.dumps(interned))
+        self.assertIs(type(copy), Expr)
+        self.assertEqual(hash(copy), hash(interned))
+        self.assertEqual(copy, interned)
+        self.assertIs(copy.operands[0], copy.operands[1])
+
+
+class TestFraction(unittest.TestCase):
+    """Tests for exact rationals"""
+
+    def test_normalization(self):
+        fraction = Fraction(6, -4)
+        self.assertEqual((fraction.numer, fraction.denom), (-3, 2))
+        self.assertEqual(repr(fraction), 'Fraction(-3, 2)')
+        self.assertEqual(str(fraction), '(-3/2)')
+        self.assertEqual(Fraction(4, 2), 2)
+        self.assertRaises(ZeroDivisionError, Fraction, 1, 0)
+        self.assertRaises(ExprException, Fraction, 1.5, 2)
+        self.assertEqual(rational(6, 3), 2)
+        self.assertIsInstance(rational(6, 3), int)
+        self.assertEqual(rational(Fraction(1, 2), Fraction(1, 4)), 2)
+
+    def test_arithmetic(self):
+        third = Fraction(1, 3)
+        self.assertEqual(third + Fraction(1, 6), Fraction(1, 2))
+        self.assertIsInstance(third * 3, int)
+        self.assertEqual(1 - third, Fraction(2, 3))
+        self.assertEqual(2 / third, 6)
+        self.assertEqual(third ** -2, 9)
+        self.assertEqual(-third, Fraction(-1, 3))
+        self.assertIsInstance(third + 0.5, float)
+        self.assertAlmostEqual(third + 0.5, 5 / 6)
+        self.assertAlmostEqual(4 ** Fraction(1, 2), 2.0)
+        self.assertEqual(int(Fraction(-7, 2)), -3)
+        self.assertEqual(float(Fraction(1, 4)), 0.25)
+
+    def test_comparison_and_hashing(self):
+        self.assertTrue(Fraction(1, 3) < 0.34)
+        self.assertTrue(Fraction(1, 4) == 0.25)
+        self.assertFalse(Fraction(1, 3) == 1 / 3)
+        self.assertTrue(Fraction(-1, 2) < Fraction(1, 3) <= 1)
+        self.assertTrue(Fraction(1, 2) < float('inf'))
+        self.assertEqual(hash(Fraction(1, 2)), hash(0.5))
+        self.assertEqual(hash(Fraction(-3, 1)), hash(-3))
+        self.assertEqual(len({Fraction(1, 2), 0.5, Fraction(2, 4)}), 1)
+        self.assertEqual(Expr(Fraction(1, 2)), Expr(0.5))
+        self.assertIsInstance(Fraction(1, 2), Number)
+
+
+class TestExprPool(unittest.TestCase):
+    """Tests for hash-consed expressions"""
+
+    def test_make(self):
+        pool = ExprPool()
+        x = pool.make(Symbol('x'))
+        self.assertIs(x, pool.make(Symbol('x')))
+        expr1 = pool.make('+', [x, pool.make(5)])
+        expr2 = pool.make('+', [pool.make(Symbol('x')), pool.make(5)])
+        self.assertIs(expr1, expr2)
+        self.assertIs(expr1, pool.make('+', [pool.make(5), x]))
+        self.assertIsNot(pool.make('/', [x, pool.make(5)]),
+                pool.make('/', [pool.make(5), x]))
+        # Equal numbers of different types stay different nodes
+        numbers = [pool.make(value)
+                for value in [1, 1.0, True, Fraction(1, 2), 0.5]]
+        self.assertEqual(len({id(number) for number in numbers}), 5)
+        self.assertIsInstance(pool.make(2.0).value, float)
+
+        self.assertRaises(ExprException, pool.make, None)
+        self.assertRaises(ExprException, pool.make, 'a')
+        self.assertRaises(ExprException, pool.make, '+')
+        self.assertRaises(ExprException, pool.make, 5, [x])
+        self.assertRaises(ExprException, pool.make, '+', [x, 5])
+
+    def test_intern(self):
+        pool = ExprPool()
+        expr = Expr('+', [
+            Expr('*', [Expr(Symbol('x')), Expr(3)]),
+            Expr('*', [Expr(Symbol('x')), Expr(3)])
+        ])
+        interned = pool.intern(expr)
+        self.assertEqual(interned, expr)
+        self.assertEqual(expr, interned)
+        self.assertEqual(hash(interned), hash(expr))
+        self.assertIs(interned.operands[0], interned.operands[1])
+        self.assertIs(pool.intern(interned), interned)
+        self.assertIs(pool.intern(expr), interned)
+        self.assertEqual(str(interned), str(expr))
+        # x, 3, x * 3 and the sum
+        self.assertEqual(len(pool), 4)
+
+        # Nodes from different pools are compared structurally
+        self.assertEqual(ExprPool().intern(expr), interned)
+
+    def test_immutable(self):
+        pool = ExprPool()
+        expr = pool.make('+', [pool.make(1), pool.make(2)])
+        self.assertRaises(ExprException, expr.add_operand, pool.make(3))
+        self.assertRaises(ExprException, expr.add_operands, [pool.make(3)])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+import pickle
+import unittest
+from ..expr import *
+from ..flat import *
+from ..parser import *
+
+
+class TestFlatExpr(unittest.TestCase):
+    """Tests for the array-backed expression representation"""
+
+    def test_round_trip(self):
+        for expr_str in ['5', 'x', '5.3 + 385', '(.63 + x) * (7 + y)',
+                '5 * x * 3 + y', 'x ^ 2 / y']:
+            expr = Parser.parse(expr_str)
+            flat = FlatExpr.from_expr(expr)
+            self.assertEqual(flat.to_expr(), expr)
+            self.assertEqual(repr(flat.to_expr(sort=False)), repr(expr))
+            self.assertEqual(str(flat), str(expr))
+            self.assertEqual(repr(flat), repr(expr))
+            self.assertEqual(len(flat), flat.sizes[-1])
+
+    def test_pools(self):
+        expr = Expr('+', [
+            Expr('*', [Expr(Symbol('x')), Expr(5)]),
+            Expr('*', [Expr(Symbol('x')), Expr(5.0)])
+        ])
+        flat = FlatExpr.from_expr(expr)
+        self.assertEqual(flat.symbols, ['x'])
+        self.assertEqual(flat.constants, [5, 5.0])
+        self.assertIsInstance(flat.to_expr().operands[1].operands[0].value,
+                float)
+        self.assertEqual(list(flat.sizes), [1, 1, 3, 1, 1, 3, 7])
+
+    def test_substitute(self):
+        flat = FlatExpr.from_expr(Parser.parse('x * 3 + z'))
+        substituted = flat.substitute('x', Expr('+', [
+            Expr(Symbol('y')), Expr(1)]))
+        expected = Expr('+', [
+            Expr('*', [
+                Expr('+', [Expr(Symbol('y')), Expr(1)]),
+                Expr(3)
+            ]),
+            Expr(Symbol('z'))
+        ])
+        self.assertEqual(substituted.to_expr(), expected)
+        self.assertEqual(list(substituted.sizes)[-1], 7)
+        self.assertEqual(flat.substitute(Symbol('x'), 2).to_expr(),
+                Parser.parse('2 * 3 + z'))
+        self.assertEqual(flat.substitute('w', 2).to_expr(), flat.to_expr())
+
+    def test_evaluate(self):
+        flat = FlatExpr.from_expr(Parser.parse('(x + 1) * y ^ 2 / 4'))
+        self.assertEqual(flat.evaluate({'x': 3, 'y': 2}), 4)
+        self.assertEqual(flat.evaluate({Symbol('x'): 3, Symbol('y'): 2}), 4)
+        self.assertRaises(ExprException, flat.evaluate, {'x': 3})
+
+    def test_pickle(self):
+        flat = FlatExpr.from_expr(Parser.parse('(.63 + x) * (7 + y)'))
+        self.assertEqual(pickle.loads(pickle.dumps(flat)).to_expr(),
+                flat.to_expr())
+
+    def test_large_expr(self):
+        expr = Expr(Symbol('x'))
+        for _ in range(100000):
+            expr = Expr('+', [expr, Expr(1)])
+        flat = FlatExpr.from_expr(expr)
+        self.assertEqual(len(flat), 200001)
+        self.assertEqual(flat.evaluate({'x': 1}), 100001)
+
+
+if __name__ == '__main__':
+    unittest.main()
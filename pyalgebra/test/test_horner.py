@@ -0,0 +1,78 @@
+import time
+import unittest
+from ..expr import *
+from ..flat import *
+from ..horner import *
+from ..parser import *
+
+
+class TestHorner(unittest.TestCase):
+    """Tests for the Horner form rewrite"""
+
+    def assertSameValue(self, expr1, expr2):
+        for bindings in [{'x': 1.5, 'y': -0.5, 'z': 2}, {'x': 3, 'y': 2,
+                'z': 0.25}]:
+            self.assertAlmostEqual(FlatExpr.from_expr(expr1).evaluate(bindings),
+                    FlatExpr.from_expr(expr2).evaluate(bindings))
+
+    def test_eval_cost(self):
+        self.assertEqual(eval_cost(Parser.parse('x')), 0)
+        self.assertEqual(eval_cost(Parser.parse('x + y + 1')),
+                2 * OP_COSTS['+'])
+        self.assertEqual(eval_cost(Parser.parse('x ^ 2 / 3')),
+                OP_COSTS['^'] + OP_COSTS['/'])
+
+    def test_univariate(self):
+        expr = Parser.parse('3 * x ^ 4 + 2 * x ^ 3 + x ^ 2 + 5 * x + 7')
+        optimized, before, after = optimize_for_eval(expr)
+        self.assertEqual(before, eval_cost(expr))
+        self.assertEqual(after, eval_cost(optimized))
+        # 7 + x * (5 + x * (1 + x * (2 + x * 3)))
+        self.assertEqual(after, 4 * OP_COSTS['+'] + 4 * OP_COSTS['*'])
+        self.assertSameValue(expr, optimized)
+        self.assertEqual(expr, Parser.parse(
+            '3 * x ^ 4 + 2 * x ^ 3 + x ^ 2 + 5 * x + 7'))
+
+        # Gaps in the exponents become powers
+        expr = Parser.parse('x ^ 20 + x ^ 17 + 1')
+        optimized, before, after = optimize_for_eval(expr)
+        self.assertLess(after, before)
+        self.assertSameValue(expr, optimized)
+
+    def test_multivariate(self):
+        expr = Parser.parse('x * y + x * y ^ 2 + x ^ 2 * y + 1')
+        optimized, before, after = optimize_for_eval(expr)
+        # 1 + x * y * (1 + x + y)
+        self.assertEqual(after, 3 * OP_COSTS['+'] + 2 * OP_COSTS['*'])
+        self.assertSameValue(expr, optimized)
+
+        expr = Parser.parse('x / 2 + x * x / 4 + z * x * y')
+        optimized, before, after = optimize_for_eval(expr)
+        self.assertLess(after, before)
+        self.assertSameValue(expr, optimized)
+
+    def test_nested(self):
+        # Polynomials inside other operators are optimized on their own
+        expr = Parser.parse('y / (x ^ 3 + x ^ 2 + x) + 2 ^ (x * x * x + x)')
+        optimized, before, after = optimize_for_eval(expr)
+        self.assertLess(after, before)
+        self.assertSameValue(expr, optimized)
+
+    def test_no_improvement(self):
+        for expr_str in ['(x + 1) ^ 10', 'x + y', '2 ^ x', 'x ^ 100 + 1']:
+            expr = Parser.parse(expr_str)
+            optimized, before, after = optimize_for_eval(expr)
+            self.assertIs(optimized, expr)
+            self.assertEqual(before, after)
+        # Products too large to expand aren't built at all
+        start = time.perf_counter()
+        expr = Parser.parse('(a + b + c + 1) ^ 20 * (d + e + f + 1) ^ 20')
+        self.assertIs(optimize_for_eval(expr)[0], expr)
+        self.assertLess(time.perf_counter() - start, 5)
+        # A power with a single operand isn't a polynomial
+        expr = Expr('+', [Expr('^', [Expr(Symbol('x'))]), Expr(1)])
+        self.assertIs(optimize_for_eval(expr)[0], expr)
+
+
+if __name__ == '__main__':
+    unittest.main()
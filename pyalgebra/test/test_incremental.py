@@ -0,0 +1,89 @@
+import unittest
+from ..expr import *
+from ..flat import *
+from ..incremental import *
+from ..parser import *
+
+
+class TestIncrementalEvaluator(unittest.TestCase):
+    """Tests for incremental re-evaluation"""
+
+    def test_update(self):
+        expr = Parser.parse('(x + 1) * y ^ 2 / 4 + x * z')
+        flat = FlatExpr.from_expr(expr)
+        bindings = {'x': 3, 'y': 2, 'z': 5}
+        evaluator = IncrementalEvaluator(expr, bindings)
+        self.assertEqual(evaluator.value, flat.evaluate(bindings))
+        self.assertEqual(evaluator.symbols, {'x', 'y', 'z'})
+
+        for name, value in [('x', 1), ('y', 4), (Symbol('z'), -1),
+                ('x', 1), ('y', 0)]:
+            bindings[str(name)] = value
+            self.assertEqual(evaluator.update(name, value),
+                    flat.evaluate(bindings))
+            self.assertEqual(evaluator.value, flat.evaluate(bindings))
+
+        bindings.update({'x': 2, 'z': 2})
+        self.assertEqual(evaluator.update_many({'x': 2, 'z': 2}),
+                flat.evaluate(bindings))
+
+    def test_errors(self):
+        expr = Parser.parse('x + y')
+        self.assertRaises(ExprException, IncrementalEvaluator, expr,
+                {'x': 1})
+        evaluator = IncrementalEvaluator(expr, {'x': 1, 'y': 2})
+        self.assertRaises(ExprException, evaluator.update, 'z', 1)
+        self.assertEqual(evaluator.value, 3)
+
+        # A failed update leaves every value as it was
+        evaluator = IncrementalEvaluator(Parser.parse('1 / x + y * 2'),
+                {'x': 1, 'y': 1})
+        self.assertRaises(ZeroDivisionError, evaluator.update_many,
+                {'x': 0, 'y': 5})
+        self.assertEqual(evaluator.value, 3)
+        self.assertEqual(evaluator.update('x', 1), 3)
+        self.assertEqual(evaluator.update('y', 5), 11)
+
+    def test_only_affected_path_is_recomputed(self):
+        # A balanced sum of 2^12 symbols has paths of 12 nodes
+        exprs = [Expr(Symbol('x%d' % index)) for index in range(2 ** 12)]
+        while len(exprs) > 1:
+            exprs = [Expr('*', [Expr(1), Expr('+', exprs[index:index + 2])])
+                    for index in range(0, len(exprs), 2)]
+        bindings = {'x%d' % index: index for index in range(2 ** 12)}
+        evaluator = IncrementalEvaluator(exprs[0], bindings)
+        self.assertEqual(evaluator.value, sum(range(2 ** 12)))
+
+        calls = []
+        add = OP_FUNCS['+']
+        OP_FUNCS['+'] = lambda a, b: calls.append(1) or add(a, b)
+        try:
+            self.assertEqual(evaluator.update('x7', 1007),
+                    sum(range(2 ** 12)) + 1000)
+        finally:
+            OP_FUNCS['+'] = add
+        self.assertEqual(len(calls), 12)
+
+    def test_wide_nodes(self):
+        # The parser makes one flat sum with MAX_ARITY ^ 5 operands
+        count = MAX_ARITY ** 5
+        expr = Parser.parse(' + '.join([str(index)
+            for index in range(count - 1)]) + ' + y')
+        self.assertEqual(len(expr.operands), count)
+        evaluator = IncrementalEvaluator(expr, {'y': 0})
+        total = sum(range(count - 1))
+        self.assertEqual(evaluator.value, total)
+
+        calls = []
+        add = OP_FUNCS['+']
+        OP_FUNCS['+'] = lambda a, b: calls.append(1) or add(a, b)
+        try:
+            self.assertEqual(evaluator.update('y', 5), total + 5)
+        finally:
+            OP_FUNCS['+'] = add
+        # Only the 5 partial sums above y are recomputed
+        self.assertEqual(len(calls), 5 * (MAX_ARITY - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from .. import instrument
+from ..expr import *
+from ..parser import *
+from ..operations import *
+
+
+class TestInstrument(unittest.TestCase):
+    """Tests for the counters and timers"""
+
+    def setUp(self):
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_disabled(self):
+        expr = Parser.parse('x + y * 2')
+        substitute(expr, 'x', 3)
+        self.assertEqual(instrument.snapshot(),
+                {'counters': {}, 'timers': {}})
+
+    def test_capture(self):
+        with instrument.capture() as stats:
+            expr = Parser.parse('x + y * 2')
+        self.assertFalse(instrument.ENABLED)
+        self.assertEqual(stats['counters']['Parser.parse.nodes'], 5)
+        self.assertEqual(stats['counters']['Expr.nodes'], 5)
+        self.assertEqual(stats['timers']['Parser.parse']['calls'], 1)
+        self.assertGreaterEqual(stats['timers']['Parser.parse']['seconds'], 0)
+
+        with instrument.capture() as stats:
+            substitute(expr, 'y', 3)
+        self.assertEqual(stats['counters']['visits.Add'], 1)
+        self.assertEqual(stats['counters']['visits.Mul'], 1)
+        self.assertEqual(stats['timers']['substitute']['calls'], 1)
+        self.assertNotIn('Parser.parse', stats['timers'])
+
+    def test_flatten(self):
+        expr = Expr('+', [
+            Expr('+', [Expr(Symbol('x')), Expr(1)]),
+            Expr('*', [Expr(Symbol('y')), Expr(2)])
+        ])
+        with instrument.capture() as stats:
+            flatten_expr(expr)
+        self.assertEqual(stats['counters'], {'visits.Add': 1,
+            'visits.Mul': 1})
+        self.assertEqual(stats['timers']['flatten_expr']['calls'], 1)
+
+    def test_nested(self):
+        instrument.enable()
+        Parser.parse('x')
+        with instrument.capture() as outer:
+            Parser.parse('x')
+            with instrument.capture() as inner:
+                evalute(Parser.parse('x * 2'), 'x', 3)
+        self.assertTrue(instrument.ENABLED)
+        self.assertEqual(inner['timers']['Parser.parse']['calls'], 1)
+        self.assertEqual(inner['timers']['simplify']['calls'], 1)
+        self.assertEqual(outer['timers']['Parser.parse']['calls'], 2)
+        self.assertEqual(instrument.snapshot()['timers']['Parser.parse'][
+            'calls'], 3)
+
+    def test_pool(self):
+        pool = ExprPool()
+        with instrument.capture() as stats:
+            pool.intern(Parser.parse('x * x + x'))
+        self.assertEqual(stats['counters']['ExprPool.nodes'], 3)
@@ -0,0 +1,57 @@
+import unittest
+from ..expr import *
+from ..parser import *
+
+try:
+    import numpy
+    from ..numeric import *
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'requires numpy')
+class TestEvaluateArray(unittest.TestCase):
+    """Tests for vectorized evaluation"""
+
+    def test_evaluate_array(self):
+        x = numpy.arange(10.0)
+        y = numpy.linspace(1, 2, 10)
+        expr = Parser.parse('(x + 1) * y ^ 2 / 4 + x * y * 3')
+        result = evaluate_array(expr, {'x': x, 'y': y})
+        numpy.testing.assert_allclose(result,
+                (x + 1) * y ** 2 / 4 + x * y * 3)
+        # The bound arrays aren't overwritten
+        numpy.testing.assert_array_equal(x, numpy.arange(10.0))
+        numpy.testing.assert_array_equal(y, numpy.linspace(1, 2, 10))
+
+        result = evaluate_array(expr, {Symbol('x'): x, Symbol('y'): y})
+        numpy.testing.assert_allclose(result,
+                (x + 1) * y ** 2 / 4 + x * y * 3)
+
+    def test_broadcasting(self):
+        x = numpy.arange(6.0).reshape(2, 3)
+        expr = Parser.parse('2 * x + y')
+        numpy.testing.assert_allclose(
+                evaluate_array(expr, {'x': x, 'y': 5}), 2 * x + 5)
+        numpy.testing.assert_allclose(
+                evaluate_array(expr, {'x': 1, 'y': [1, 2, 3]}), [3, 4, 5])
+        numpy.testing.assert_allclose(
+                evaluate_array(Parser.parse('y + x * 2'),
+                    {'x': x, 'y': 5}), 2 * x + 5)
+        self.assertEqual(evaluate_array(Parser.parse('2 ^ 3'), {}), 8)
+
+    def test_scalar_temporaries(self):
+        # Constant subtrees and scalar bindings give 0-d intermediate results
+        numpy.testing.assert_allclose(evaluate_array(
+            Parser.parse('x + (2 * 3) ^ 2'), {'x': numpy.array([1., 2.])}),
+            [37, 38])
+        numpy.testing.assert_allclose(evaluate_array(
+            Parser.parse('(y * 2) ^ 2 + 1'), {'y': 0.7}), 2.96)
+
+    def test_unbound_symbol(self):
+        self.assertRaises(ExprException, evaluate_array,
+                Parser.parse('x + y'), {'x': [1, 2]})
+
+
+if __name__ == '__main__':
+    unittest.main()
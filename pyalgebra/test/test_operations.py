@@ -1,6 +1,9 @@
+import time
 import unittest
 from ..expr import *
 from ..operations import *
+from ..parser import *
+from ..polynomial import Polynomial
 
 
 class TestOperations(unittest.TestCase):
@@ -69,6 +72,173 @@ class TestOperations(unittest.TestCase):
         ])
         self.assertEqual(substituted, expected_substituted)
 
+    def test_substitute_shares_untouched_subtrees(self):
+        expr = Parser.parse('x * 3 + (y + 1) * 2')
+        substituted = substitute(expr, 'x', 5)
+        self.assertEqual(substituted, Parser.parse('5 * 3 + (y + 1) * 2'))
+        self.assertIs(substituted.operands[1], expr.operands[1])
+        self.assertIsNot(substituted.operands[0], expr.operands[0])
+
+    def test_substitute_many(self):
+        expr = Parser.parse('x * 3 + y + (z + 1) * 2')
+        substituted = substitute_many(expr, {
+            'x': 5, Symbol('y'): 'w', 'q': 1})
+        self.assertEqual(substituted,
+                Parser.parse('5 * 3 + w + (z + 1) * 2'))
+        self.assertEqual(expr, Parser.parse('x * 3 + y + (z + 1) * 2'))
+        # Untouched subtrees are shared with the original
+        self.assertIsNot(substituted, expr)
+        product, other_product = [operand for operand in expr.operands
+                if operand.value == '*']
+        if other_product.has_symbol('x'):
+            product, other_product = other_product, product
+        self.assertNotIn(product, substituted.operands)
+        self.assertTrue(any([operand is other_product
+            for operand in substituted.operands]))
+        new_product, = [operand for operand in substituted.operands
+                if operand == Parser.parse('5 * 3')]
+        self.assertIs(new_product.operands[0], product.operands[0])
+
+        self.assertIs(substitute_many(expr, {'q': 1}), expr)
+        self.assertIs(substitute_many(expr, {}), expr)
+
+        # Substitutions are simultaneous
+        expr = Parser.parse('x / y')
+        self.assertEqual(substitute_many(expr, {'x': 'y', 'y': 'x'}),
+                Parser.parse('y / x'))
+        replacement = Parser.parse('a + b')
+        substituted = substitute_many(expr, {'x': replacement})
+        self.assertIs(substituted.operands[0], replacement)
+
+    def test_simplify(self):
+        x = Expr(Symbol('x'))
+        y = Expr(Symbol('y'))
+        self.assertEqual(simplify(Parser.parse('x + x + 3 * x')),
+                Expr('*', [Expr(5), x]))
+        self.assertEqual(simplify(Parser.parse('x * y + y * x')),
+                Expr('*', [Expr(2), x, y]))
+        self.assertEqual(simplify(Parser.parse('x * 2 / 2 + 0')), x)
+        self.assertEqual(simplify(Parser.parse('x + 1 + x * 0 + 1')),
+                Expr('+', [x, Expr(2)]))
+        self.assertEqual(simplify(Parser.parse('x + 2 * y + 3 + 0')),
+                Parser.parse('x + 2 * y + 3'))
+        self.assertEqual(simplify(Parser.parse('x * 0')), Expr(0))
+        self.assertEqual(simplify(Parser.parse('2 ^ 3 + 4 ^ 0.5')),
+                Expr(10))
+
+        # Products and natural powers are expanded
+        self.assertEqual(simplify(Parser.parse('(x + 1) ^ 2')),
+                Parser.parse('x ^ 2 + 2 * x + 1'))
+        self.assertEqual(simplify(Parser.parse('(x + y) * (x + y) * x')),
+                simplify(Parser.parse('x ^ 3 + 2 * x ^ 2 * y + x * y ^ 2')))
+        self.assertEqual(simplify(Parser.parse('x * x ^ 2 * y')),
+                Expr('*', [Expr('^', [x, Expr(3)]), y]))
+
+        # Everything else is kept as a generator
+        self.assertEqual(simplify(Parser.parse('x / y + x / y')),
+                Expr('*', [Expr(2), Expr('/', [x, y])]))
+        self.assertEqual(simplify(Parser.parse('2 ^ (x + x)')),
+                Expr('^', [Expr(2), Expr('*', [Expr(2), x])]))
+        self.assertEqual(simplify(Parser.parse('x / 0')),
+                Expr('/', [x, Expr(0)]))
+
+        # The original expression isn't modified
+        expr = Parser.parse('x + x')
+        simplify(expr)
+        self.assertEqual(expr, Expr('+', [x, x]))
+
+    def test_simplify_large_sum(self):
+        expr = Expr('+', [Expr('*', [Expr(index % 7), Expr(Symbol('x%d' %
+            (index % 100)))]) for index in range(100000)])
+        simplified = simplify(expr)
+        self.assertEqual(simplified.value, '+')
+        self.assertEqual(simplified.num_operands, 100)
+
+    def test_simplify_deep_opaque(self):
+        # Each quotient becomes a generator of the one around it
+        expr = Parser.parse('x / (' * 4000 + 'y' + ')' * 4000)
+        start = time.perf_counter()
+        simplified = simplify(expr)
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(simplified, expr)
+
+    def test_expand(self):
+        expanded = expand(Parser.parse('(x + y + 1) ^ 20'))
+        self.assertEqual(expanded.num_operands, 231)
+        self.assertEqual(evalute(substitute(expanded, 'x', 2), 'y', 3),
+                Expr(6 ** 20))
+        self.assertEqual(expand(Parser.parse('(x + 1) * (x + 2) / 2')),
+                simplify(Parser.parse('x ^ 2 / 2 + 3 * x / 2 + 1')))
+        self.assertEqual(expand(Parser.parse('(x + 2) ^ 2 * y ^ 0')),
+                Parser.parse('x ^ 2 + 4 * x + 4'))
+
+        # Long products of one symbol are multiplied with Karatsuba
+        expanded = expand(Parser.parse('(x + 1) ^ 300 * (2 * x + 1) ^ 100'))
+        terms = Polynomial.from_expr(expanded).terms
+        x = (0, 'x')
+        self.assertEqual(len(terms), 401)
+        self.assertEqual(terms[((x, 400),)], 2 ** 100)
+        self.assertEqual(terms[((x, 1),)], 300 + 2 * 100)
+        self.assertEqual(terms[()], 1)
+        self.assertEqual(sum(terms.values()), 2 ** 300 * 3 ** 100)
+
+    def test_evalute(self):
+        expr = Parser.parse('x * y + x * 2')
+        self.assertEqual(evalute(expr, 'x', 3),
+                Expr('+', [Expr('*', [Expr(3), Expr(Symbol('y'))]), Expr(6)]))
+        self.assertEqual(evalute(evalute(expr, 'x', 3), 'y', 2), Expr(12))
+
+    def test_simplify_is_exact(self):
+        x = Expr(Symbol('x'))
+        simplified = simplify(Parser.parse('x / 3 + x / 6'))
+        self.assertEqual(simplified, Expr('*', [Expr(Fraction(1, 2)), x]))
+        self.assertIsInstance(simplified.operands[0].value, Fraction)
+        simplified = simplify(Expr('^', [Expr(2), Expr(-2)]))
+        self.assertEqual(repr(simplified), 'Fraction(1, 4)')
+        self.assertEqual(simplify(Parser.parse('x / 4 * 2 * 2')), x)
+        # Roots of exact numbers aren't folded into floats
+        for expr_str in ['8 ^ (1 / 3)', '2 ^ (1 / 2)']:
+            simplified = simplify(Parser.parse(expr_str))
+            self.assertEqual(simplified, fold_constants(Parser.parse(expr_str)))
+            self.assertEqual(simplified.value, '^')
+        self.assertEqual(simplify(Parser.parse('2.0 ^ 0.5')), Expr(2.0 ** 0.5))
+
+    def test_simplify_large_numbers(self):
+        big = '9' * 400
+        self.assertEqual(simplify(Parser.parse('x ^ ' + big)),
+                Parser.parse('x ^ ' + big))
+        # Folds that would overflow are kept as they are
+        for expr_str in ['2 ^ ' + big, '2.0 ^ ' + big, big + ' * x * 1.5',
+                big + ' + 1.5', big + ' / 1.5']:
+            simplify(Parser.parse(expr_str))
+        self.assertEqual(simplify(Parser.parse('2 ^ ' + big)),
+                Parser.parse('2 ^ ' + big))
+
+    def test_fold_constants(self):
+        fold = lambda expr_str: repr(fold_constants(Parser.parse(expr_str)))
+        self.assertEqual(fold('1 + 2 * 3'), '7')
+        self.assertEqual(fold('1 / 3 + 1 / 6'), 'Fraction(1, 2)')
+        self.assertEqual(fold('x + 1 + y + 2'), 'Add(3, x, y)')
+        self.assertEqual(fold('2 ^ 3 ^ x'), 'Exp(8, x)')
+        self.assertEqual(fold('x ^ 2 ^ 3'), 'Exp(x, 2, 3)')
+        self.assertEqual(fold('8 / 4 / x / 2'), 'Div(2, x, 2)')
+        self.assertEqual(fold('x * (0.5 + 0.25)'), 'Mul(0.75, x)')
+        self.assertEqual(fold('2 * 0.5'), '1.0')
+        # Folds without an exact real value are left alone
+        self.assertEqual(fold('x + 1 / 0'), 'Add(x, Div(1, 0))')
+        self.assertEqual(fold('2 ^ (1 / 2)'), 'Exp(2, Fraction(1, 2))')
+        self.assertEqual(fold('2 ^ 100000000'), 'Exp(2, 100000000)')
+        self.assertEqual(repr(fold_constants(Expr('^', [Expr(2),
+            Expr(-3)]))), 'Fraction(1, 8)')
+
+        # Unchanged subtrees are shared and the input isn't modified
+        expr = Parser.parse('x * y + 1 + 2')
+        folded = fold_constants(expr)
+        self.assertIs(folded.operands[1], expr.operands[2])
+        self.assertEqual(repr(expr), 'Add(1, 2, Mul(x, y))')
+        expr = Parser.parse('x * y')
+        self.assertIs(fold_constants(expr), expr)
+
 
 if __name__ == '__main__':
     unittest.main()
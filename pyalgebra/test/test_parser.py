@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from ..expr import *
 from ..parser import *
@@ -184,6 +186,72 @@ class TestParse(unittest.TestCase):
         ])
         self.assertEqual(Parser.parse(expr_str), expr)
 
+    def test_parse_errors(self):
+        self.assertRaises(ParseExprException, Parser.parse, '')
+        self.assertRaises(ParseExprException, Parser.parse, '   ')
+        self.assertRaises(ParseExprException, Parser.parse, '+ 5')
+        self.assertRaises(ParseExprException, Parser.parse, '5 +')
+        self.assertRaises(ParseExprException, Parser.parse, 'x y')
+        self.assertRaises(ParseExprException, Parser.parse, '(x + 5')
+        self.assertRaises(ParseExprException, Parser.parse, 'x + 5)')
+        self.assertRaises(ParseExprException, Parser.parse, '5..3')
+        self.assertRaises(ParseExprException, Parser.parse, 'x - 5')
+
+    def test_tokenize(self):
+        expr_str = ' xy+ (2.5*z) '
+        tokens = list(tokenize(expr_str))
+        self.assertEqual(tokens, [
+            (SYMBOL_TOKEN, 1, 3),
+            (OP_TOKEN, 3, 4),
+            (LPAREN_TOKEN, 5, 6),
+            (NUMBER_TOKEN, 6, 9),
+            (OP_TOKEN, 9, 10),
+            (SYMBOL_TOKEN, 10, 11),
+            (RPAREN_TOKEN, 11, 12),
+        ])
+        self.assertEqual([expr_str[start:end] for _, start, end in tokens],
+                ['xy', '+', '(', '2.5', '*', 'z', ')'])
+        self.assertEqual(list(tokenize('')), [])
+        with self.assertRaises(ParseExprException):
+            list(tokenize('x $ y'))
+
+    def test_parse_many(self):
+        expr_strs = ['5 + x', 'x +', 'y * (2 + z)', '', '3'] * 20
+        expected = [Parser.parse(expr_str) if expr_str not in ('x +', '')
+                else None for expr_str in expr_strs]
+        for workers in [None, 2]:
+            results = list(Parser.parse_many(iter(expr_strs),
+                workers=workers, chunksize=3))
+            self.assertEqual(len(results), len(expr_strs))
+            for result, expected_result in zip(results, expected):
+                if expected_result is None:
+                    self.assertIsInstance(result, ParseExprException)
+                else:
+                    self.assertEqual(result, expected_result)
+        self.assertEqual(list(Parser.parse_many([], workers=2)), [])
+
+        # Deeply nested results come back from the workers too
+        deep = 'x ^ (' * 3000 + 'y' + ')' * 3000
+        results = list(Parser.parse_many([deep, 'x +', 'x'], workers=2))
+        self.assertEqual(results[0], Parser.parse(deep))
+        self.assertIsInstance(results[1], ParseExprException)
+        self.assertEqual(results[2], Parser.parse('x'))
+        self.assertRaises(ValueError, Parser.parse_many, ['x'], chunksize=0)
+
+    def test_parse_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'exprs.txt')
+            with open(path, 'w') as expr_file:
+                expr_file.write('5 + x\n(x\n\ny * 2\r\n')
+            for workers in [None, 2]:
+                results = list(Parser.parse_file(path, workers=workers,
+                    chunksize=1))
+                self.assertEqual(len(results), 4)
+                self.assertEqual(results[0], Parser.parse('5 + x'))
+                self.assertIsInstance(results[1], ParseExprException)
+                self.assertIsInstance(results[2], ParseExprException)
+                self.assertEqual(results[3], Parser.parse('y * 2'))
+
     def test_flatten_expr(self):
         expr = Expr('+', [
             Expr('+', [Expr(Symbol('x')), Expr(3)]),
@@ -219,5 +287,107 @@ class TestParse(unittest.TestCase):
         ])
         self.assertEqual(flatten_expr(expr), expr)
 
+        # Operand order is kept
+        expr = Expr('+', [
+            Expr(Symbol('w')),
+            Expr('+', [Expr(Symbol('x')), Expr(Symbol('y'))]),
+            Expr(Symbol('z'))
+        ])
+        self.assertEqual(repr(flatten_expr(expr)), 'Add(w, x, y, z)')
+
+        # Only a first operand is merged for '/' and '^'
+        for op in ['/', '^']:
+            expr = Expr(op, [
+                Expr(op, [Expr(op, [Expr(Symbol('x')), Expr(3)]), Expr(2)]),
+                Expr(Symbol('z'))
+            ])
+            flattened_expr = Expr(op, [
+                Expr(Symbol('x')),
+                Expr(3),
+                Expr(2),
+                Expr(Symbol('z'))
+            ])
+            self.assertEqual(flatten_expr(expr), flattened_expr)
+
+            expr = Expr(op, [
+                Expr(Symbol('x')),
+                Expr(op, [Expr(Symbol('y')), Expr(Symbol('z'))])
+            ])
+            self.assertEqual(repr(flatten_expr(expr)),
+                    '%s(x, %s(y, z))' % (OP_NAMES[op], OP_NAMES[op]))
+
+        # Interned nodes are copied, not modified
+        pool = ExprPool()
+        inner = pool.intern(Parser.parse('x + 3'))
+        nested = pool.make('+', [inner, pool.make(Symbol('z'))])
+        shared = Expr('*', [inner, Expr(Symbol('y'))])
+        self.assertEqual(flatten_expr(Expr('+', [nested, Expr(2)])),
+                Parser.parse('x + 3 + z + 2'))
+        flattened = flatten_expr(nested)
+        self.assertIsNot(flattened, nested)
+        self.assertEqual(flattened, Parser.parse('x + 3 + z'))
+        self.assertEqual(len(nested.operands), 2)
+        self.assertTrue(any([operand is inner
+            for operand in nested.operands]))
+        self.assertEqual(shared, Parser.parse('(x + 3) * y'))
+
+    def test_parse_keeps_caches(self):
+        # Parsing only modifies its own new nodes, so the cached values of
+        # other expressions stay valid
+        expr = Parser.parse('x * y + z')
+        symbols = expr.free_symbols
+        hash(expr)
+        mutations = Expr._mutations
+        Parser.parse('p + (q + r)')
+        flatten_expr(Expr('*', [Expr('*', [Expr(1), Expr(2)]), Expr(3)]))
+        self.assertEqual(Expr._mutations, mutations)
+        self.assertIs(expr.free_symbols, symbols)
+        # Modifying a node with cached values invalidates them
+        expr.operands[-1].add_operand(Expr(Symbol('w')))
+        self.assertNotEqual(Expr._mutations, mutations)
+        self.assertIn(Symbol('w'), expr.free_symbols)
+        inner = Expr('+', [Expr(Symbol('a')), Expr(Symbol('b'))])
+        outer = Expr('+', [inner, Expr(Symbol('c'))])
+        hash(outer)
+        mutations = Expr._mutations
+        flatten_expr(outer)
+        self.assertNotEqual(Expr._mutations, mutations)
+        self.assertEqual(hash(outer), hash(Parser.parse('a + b + c')))
+
+    def test_parse_is_flat(self):
+        self.assertEqual(repr(Parser.parse('x / y / 4')), 'Div(x, y, 4)')
+        self.assertEqual(repr(Parser.parse('x / (y / 4)')),
+                'Div(x, Div(y, 4))')
+        self.assertEqual(repr(Parser.parse('(x / y) / 4')),
+                'Div(x, y, 4)')
+        self.assertEqual(repr(Parser.parse('x ^ 2 ^ 3')), 'Exp(x, 2, 3)')
+        self.assertEqual(repr(Parser.parse('x ^ (2 ^ 3)')),
+                'Exp(x, Exp(2, 3))')
+        self.assertEqual(repr(Parser.parse('a + (b + (c + d)) + e')),
+                'Add(a, b, c, d, e)')
+        self.assertEqual(repr(Parser.parse('a * (b + c) * (d * e)')),
+                'Mul(a, d, e, Add(b, c))')
+        self.assertEqual(repr(Parser.parse('a + b * c / d + e')),
+                'Add(a, e, Div(Mul(b, c), d))')
+
+    def test_numbers(self):
+        self.assertIsInstance(Parser.parse('12').value, int)
+        self.assertIsInstance(Parser.parse('12.').value, float)
+        self.assertIsInstance(Parser.parse('.5').value, float)
+        self.assertEqual(repr(Parser.parse('x * 2 + 1.5')),
+                'Add(1.5, Mul(2, x))')
+        self.assertEqual(repr(Parser.parse('x + 1 / 3 * 6', fold=True)),
+                'Add(2, x)')
+        self.assertEqual(repr(Parser.parse('x * 2 / 6', fold=True)),
+                'Div(Mul(2, x), 6)')
+        self.assertEqual(repr(Parser.parse('2 / 6 * x', fold=True)),
+                'Mul(Fraction(1, 3), x)')
+        self.assertEqual(repr(Parser.parse('2 / 6 * x')),
+                'Mul(x, Div(2, 6))')
+        # Folded fractions print so that the string parses back the same
+        expr = Parser.parse('x ^ (1 / 3)', fold=True)
+        self.assertEqual(str(expr), 'x ^ (1/3)')
+        self.assertEqual(Parser.parse(str(expr), fold=True), expr)
+
 if __name__ == '__main__':
     unittest.main()
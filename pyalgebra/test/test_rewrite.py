@@ -0,0 +1,103 @@
+import time
+import unittest
+from ..expr import *
+from ..parser import *
+from ..rewrite import *
+
+
+class TestRewrite(unittest.TestCase):
+    """Tests for pattern matching and rule-based rewriting"""
+
+    def setUp(self):
+        self.rules = RuleSet([
+            Rule('a * 0', '0', wilds='a'),
+            Rule('a * 1', 'a', wilds='a'),
+            Rule('a + 0', 'a', wilds='a'),
+            Rule('a ^ 1', 'a', wilds='a'),
+            Rule('a * b + a * c', 'a * (b + c)', wilds='a b c'),
+        ])
+
+    def test_wild(self):
+        self.assertNotEqual(Wild('a'), Symbol('a'))
+        self.assertNotEqual(Symbol('a'), Wild('a'))
+        self.assertEqual(Wild('a'), Wild('a'))
+        self.assertEqual(repr(Rule('a / 2', 'a', wilds='a')),
+                'Rule(Div(a_, 2), a_)')
+        self.assertRaises(ExprException, Rule, 'a', 'b', wilds='a b')
+
+    def test_match(self):
+        pattern = Rule('a * b + a * c', '0', wilds='a b c').pattern
+        bindings = match(pattern, Parser.parse('u * y + y * z'))
+        self.assertEqual(bindings['a'], Expr(Symbol('y')))
+        self.assertEqual({bindings['b'], bindings['c']},
+                {Expr(Symbol('u')), Expr(Symbol('z'))})
+        self.assertIsNone(match(pattern, Parser.parse('u * y + v * z')))
+        # The number of operands has to agree
+        self.assertIsNone(match(pattern, Parser.parse('u * y + y * z + 1')))
+        # Operands of non-commutative operators are matched in order
+        pattern = Rule('a / 2', '0', wilds='a').pattern
+        self.assertEqual(match(pattern, Parser.parse('(x + 1) / 2')),
+                {'a': Parser.parse('x + 1')})
+        self.assertIsNone(match(pattern, Parser.parse('2 / x')))
+
+    def test_rewrite(self):
+        rewrite = self.rules.rewrite
+        self.assertEqual(rewrite(Parser.parse('(x ^ 1) * 1')),
+                Expr(Symbol('x')))
+        self.assertEqual(rewrite(Parser.parse('x * y + y * z ^ 1')),
+                Parser.parse('y * (x + z)'))
+        # Rewriting continues until no rule matches
+        self.assertEqual(rewrite(Parser.parse('(x + y * 0) ^ (z * 1 + 0)')),
+                Parser.parse('x ^ z'))
+        self.assertEqual(rewrite(Parser.parse('x * y + (x + 0) * 0')),
+                Parser.parse('x * y'))
+        # Conditions and computed replacements
+        rules = RuleSet([Rule('a + b', lambda bindings: Expr(
+            bindings['a'].value + bindings['b'].value), wilds='a b',
+            condition=lambda bindings: all([not bound.operands and
+                not isinstance(bound.value, Symbol)
+                for bound in bindings.values()]))])
+        expr = Expr('+', [Expr('+', [Expr(1), Expr(2)]),
+            Expr('+', [Expr(3), Expr(4)])])
+        self.assertEqual(rules.rewrite(expr), Expr(10))
+        self.assertEqual(rules.rewrite(Parser.parse('x + 1')),
+                Parser.parse('x + 1'))
+
+    def test_memoization(self):
+        expr = Parser.parse('(x * 1 + 0) ^ (x * 1 + 0)')
+        rewritten = self.rules.rewrite(expr)
+        self.assertIs(rewritten.operands[0], rewritten.operands[1])
+        self.assertIs(self.rules.rewrite(expr), rewritten)
+        self.assertIs(self.rules.rewrite(rewritten), rewritten)
+
+    def test_termination(self):
+        self.assertRaises(ExprException,
+                RuleSet([Rule('a', 'a + 0', wilds='a')]).rewrite,
+                Parser.parse('x'))
+        rules = RuleSet([Rule('a ^ b', 'a ^ (b + 1)', wilds='a b')])
+        self.assertRaises(ExprException, rules.rewrite, Parser.parse('x ^ 2'),
+                max_steps=50)
+
+    def test_many_rules(self):
+        # One rule per divisor, of which the index only offers the right one
+        rules = RuleSet([Rule(Expr('/', [Expr(Symbol('a')), Expr(divisor)]),
+            Expr('*', [Expr(Fraction(1, divisor)), Expr(Symbol('a'))]),
+            wilds='a') for divisor in range(2, 5002)])
+        self.assertEqual(len(rules), 5000)
+        self.assertEqual(rules.candidates(Parser.parse('x / 7')),
+                [rules.rules[5]])
+        self.assertEqual(rules.candidates(Parser.parse('x / y')), [])
+
+        expr = Expr('+', [Expr('/', [Expr(Symbol('x')), Expr(divisor)])
+            for divisor in range(2, 2002)])
+        start = time.perf_counter()
+        rewritten = rules.rewrite(expr)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertIn(Expr('*', [Expr(Fraction(1, 2001)), Expr(Symbol('x'))]),
+                rewritten.operands)
+        self.assertTrue(all([operand.value == '*'
+            for operand in rewritten.operands]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from ..expr import *
+from ..flat import *
+from ..parser import *
+from ..serialize import *
+from ..serialize import _HEADER
+
+
+class TestSerialize(unittest.TestCase):
+    """Tests for the binary expression format"""
+
+    def setUp(self):
+        self.exprs = [Parser.parse(expr_str) for expr_str in
+                ['5.', 'x', '5.3 + 385', '(.63 + x) * (7 + y)',
+                 'x ^ 2 / y', 'x * y + x * 2.5']]
+        self.exprs.append(Expr('+', [Expr(Symbol('x')), Expr(7),
+            Expr(-3), Expr(2 ** 100), Expr(-2 ** 70), Expr(Fraction(-2, 3)),
+            Expr(Fraction(3 ** 50, 2 ** 70))]))
+
+    def test_round_trip(self):
+        archive = loads(dumps(self.exprs))
+        self.assertEqual(len(archive), len(self.exprs))
+        for index, expr in enumerate(self.exprs):
+            self.assertEqual(archive[index], expr)
+            self.assertEqual(repr(archive[index]), repr(expr))
+        self.assertEqual(list(archive), self.exprs)
+        self.assertEqual(archive[-1], self.exprs[-1])
+        self.assertRaises(IndexError, archive.flat, len(self.exprs))
+
+    def test_shared_pools(self):
+        archive = loads(dumps(self.exprs))
+        self.assertEqual(archive.symbols, ['x', 'y'])
+        self.assertEqual(len(archive.constants), len(set(
+            (type(value), value) for value in archive.constants)))
+        self.assertIsInstance(archive[0].value, float)
+        # Numbers come first, in increasing order
+        numbers = [operand.value for operand in archive[-1].operands[:-1]]
+        self.assertEqual([type(value) for value in numbers],
+                [int, int, Fraction, int, Fraction, int])
+        self.assertEqual(repr(numbers[2]), 'Fraction(-2, 3)')
+        flat = archive.flat(3)
+        self.assertEqual(list(flat.sizes),
+                list(FlatExpr.from_expr(self.exprs[3]).sizes))
+
+    def test_flat_input(self):
+        flats = [FlatExpr.from_expr(expr) for expr in self.exprs]
+        self.assertEqual(dumps(flats), dumps(self.exprs))
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            dump(self.exprs, path)
+            with load(path) as archive:
+                self.assertEqual(archive[3], self.exprs[3])
+                self.assertEqual(list(archive), self.exprs)
+            with open(path, 'wb') as expr_file:
+                dump([], expr_file)
+            with load(path) as archive:
+                self.assertEqual(len(archive), 0)
+        finally:
+            os.remove(path)
+
+    def test_errors(self):
+        data = dumps(self.exprs)
+        self.assertRaises(ExprFormatException, loads, b'PYAL')
+        self.assertRaises(ExprFormatException, loads, b'XXXX' + data[4:])
+        self.assertRaises(ExprFormatException, loads,
+                data[:4] + b'\x63\x00' + data[6:])
+        self.assertRaises(ExprFormatException, loads(data[:-1]).flat,
+                len(self.exprs) - 1)
+        self.assertRaises(ExprFormatException, dumps,
+                [Expr(complex(1, 2))])
+
+    def test_truncated_files(self):
+        data = dumps(self.exprs)
+        index_offset = _HEADER.unpack_from(data, 0)[-1]
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            for size in [0, 10, index_offset + 1]:
+                with open(path, 'wb') as expr_file:
+                    expr_file.write(data[:size])
+                self.assertRaises(ExprFormatException, load, path)
+        finally:
+            os.remove(path)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from ..server import *
+from .. import server as pyalgebra_server
+
+
+class TestExprServer(unittest.TestCase):
+    """Tests for the evaluation server, over local sockets"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'server.sock')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_with_server(self, test, **options):
+        """Runs test(server, client) against a server on a Unix socket."""
+        async def run():
+            server = ExprServer(**options)
+            listener = await server.start(self.path)
+            async with listener:
+                async with await ExprClient.connect(self.path) as client:
+                    return await test(server, client)
+        return asyncio.run(run())
+
+    def test_evaluate(self):
+        async def test(server, client):
+            self.assertEqual(await client.evaluate('x * y + 2',
+                {'x': 3, 'y': 4}), 14)
+            self.assertEqual(await client.evaluate('1 / 4 + x',
+                {'x': 0.5}), 0.75)
+            self.assertEqual(await client.evaluate('2 ^ 3 + 1'), 9)
+            # Extra bindings are ignored
+            self.assertEqual(await client.evaluate('x', {'x': 2, 'y': 3}), 2)
+        self.run_with_server(test)
+
+    def test_batching(self):
+        async def test(server, client):
+            values = await asyncio.gather(*[client.evaluate('x ^ 2 + y',
+                {'x': x, 'y': 1}) for x in range(100)])
+            self.assertEqual(values, [x ** 2 + 1 for x in range(100)])
+            self.assertEqual(server.num_requests, 100)
+            self.assertLess(server.num_batches, 10)
+            self.assertEqual(server.num_parses, 1)
+            # Later requests reuse the parsed formula
+            self.assertEqual(await client.evaluate('x ^ 2 + y',
+                {'x': 3, 'y': 2}), 11)
+            self.assertEqual(server.num_parses, 1)
+        self.run_with_server(test)
+
+    def test_errors(self):
+        async def test(server, client):
+            results = await asyncio.gather(
+                    client.evaluate('x + y', {'x': 1, 'y': 2}),
+                    client.evaluate('x + y', {'x': 1}),
+                    client.evaluate('x + y', {'x': 1, 'y': 'a'}),
+                    client.evaluate('x +', {'x': 1}),
+                    return_exceptions=True)
+            self.assertEqual(results[0], 3)
+            for result in results[1:]:
+                self.assertIsInstance(result, ExprServerException)
+            self.assertIn('No value for symbol y', str(results[1]))
+
+            # JSON has no inf or nan, so those results are errors
+            results = await asyncio.gather(
+                    client.evaluate('1 / x', {'x': 0}),
+                    client.evaluate('x / x', {'x': 0}),
+                    client.evaluate('1 / x', {'x': 4}),
+                    return_exceptions=True)
+            for result in results[:2]:
+                self.assertIsInstance(result, ExprServerException)
+                self.assertIn('not finite', str(result))
+            self.assertEqual(results[2], 0.25)
+        self.run_with_server(test)
+
+    def test_compile_errors(self):
+        async def test(server, client):
+            # Formulas that can't be compiled fail instead of hanging
+            with self.assertRaises(ExprServerException):
+                await asyncio.wait_for(client.evaluate('if + 1', {'if': 1}),
+                        5)
+            self.assertEqual(await client.evaluate('x + 1', {'x': 1}), 2)
+        numpy = pyalgebra_server.np
+        pyalgebra_server.np = None
+        try:
+            self.run_with_server(test)
+        finally:
+            pyalgebra_server.np = numpy
+
+    def test_raw_protocol(self):
+        async def test(server, client):
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(b'not json\n')
+            writer.write(json.dumps({'id': 'a', 'formula': 'x / 2',
+                'bindings': {'x': 5}}).encode() + b'\n')
+            await writer.drain()
+            self.assertIn('error', json.loads(await reader.readline()))
+            self.assertEqual(json.loads(await reader.readline()),
+                    {'id': 'a', 'value': 2.5})
+            writer.close()
+            await writer.wait_closed()
+        self.run_with_server(test)
+
+    def test_cache_size(self):
+        async def test(server, client):
+            for formula in ['x + 1', 'x + 2', 'x + 3', 'x + 1']:
+                await client.evaluate(formula, {'x': 1})
+            self.assertEqual(server.num_parses, 4)
+        self.run_with_server(test, cache_size=2)
+
+    def test_tcp(self):
+        async def run():
+            server = ExprServer(batch_delay=0.01)
+            listener = await server.start(port=0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                async with await ExprClient.connect(port=port) as client:
+                    return await asyncio.gather(client.evaluate('x * 2',
+                        {'x': 1}), client.evaluate('x * 2', {'x': 2}))
+        self.assertEqual(asyncio.run(run()), [2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
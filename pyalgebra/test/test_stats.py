@@ -0,0 +1,66 @@
+import time
+import unittest
+from ..expr import *
+from ..parser import *
+from ..stats import *
+
+
+class TestStats(unittest.TestCase):
+    """Tests for expression statistics and parser limits"""
+
+    def test_expr_stats(self):
+        stats = expr_stats(Parser.parse('(x + y) * z ^ 2 + (y + x) * 3'))
+        self.assertEqual(stats['nodes'], 13)
+        self.assertEqual(stats['depth'], 4)
+        # x, y, z, 2, 3, x + y, z ^ 2, the two products and the sum
+        self.assertEqual(stats['distinct_subtrees'], 10)
+        self.assertEqual(stats['symbols'], 3)
+        self.assertEqual(stats['operators'], {'+': 3, '*': 2, '^': 1, '/': 0})
+        self.assertGreater(stats['memory'], 0)
+
+        stats = expr_stats(Parser.parse('x'))
+        self.assertEqual((stats['nodes'], stats['depth'],
+            stats['distinct_subtrees'], stats['symbols']), (1, 1, 1, 1))
+
+    def test_shared_subexpressions(self):
+        # A tree with 2 ^ 40 leaves, but only 41 unique nodes
+        expr = Expr(Symbol('x'))
+        for _ in range(40):
+            expr = Expr('*', [expr, expr])
+        start = time.perf_counter()
+        stats = expr_stats(expr)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(stats['nodes'], 2 ** 41 - 1)
+        self.assertEqual(stats['depth'], 41)
+        self.assertEqual(stats['distinct_subtrees'], 41)
+        self.assertEqual(stats['operators']['*'], 2 ** 40 - 1)
+        # Shared objects take memory once
+        self.assertLess(stats['memory'], 1000 * 41)
+
+    def test_parse_limits(self):
+        # Parenthesized sums and products merged by flattening included
+        for expr_str in ['x', 'x + (y + z)', '(x + y) * z ^ 2',
+                'a * (b * (c + d)) / (e / f) ^ 2', 'y + x / x + (y + y)',
+                '((y * 2) + x / 3) + 3 ^ 3 / y + (x + x + 2)']:
+            stats = expr_stats(Parser.parse(expr_str))
+            Parser.parse(expr_str, max_nodes=stats['nodes'],
+                    max_depth=stats['depth'])
+            self.assertRaises(ParseLimitException, Parser.parse, expr_str,
+                    max_nodes=stats['nodes'] - 1)
+            self.assertRaises(ParseLimitException, Parser.parse, expr_str,
+                    max_depth=stats['depth'] - 1)
+        self.assertTrue(issubclass(ParseLimitException, ParseExprException))
+
+    def test_parse_limits_fail_early(self):
+        # The error comes before the rest of the input is even tokenized
+        expr_str = 'x + ' * 10 ** 6 + ')'
+        start = time.perf_counter()
+        self.assertRaises(ParseLimitException, Parser.parse, expr_str,
+                max_nodes=100)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertRaises(ParseLimitException, Parser.parse,
+                '(x ^ ' * 1000 + 'x' + ')' * 1000, max_depth=10)
+
+
+if __name__ == '__main__':
+    unittest.main()